@@ -1,24 +1,44 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Lower
 
 UserModel = get_user_model()
 
 class EmailOuUsuarioModelBackend(ModelBackend):
+    """Login por nome de usuário ou e-mail, sem diferenciar maiúsculas.
+
+    Uma única consulta, servida pelos índices em ``Lower(username)`` e
+    ``Lower(email)``. Se o texto casar com mais de um usuário, vale o nome de
+    usuário e, entre e-mails repetidos, a conta mais antiga; a senha é sempre
+    conferida.
+    """
+
     def authenticate(self, request, username=None, password=None, **kwargs):
         if username is None:
             username = kwargs.get(UserModel.USERNAME_FIELD)
-        
-        try:
-            user = UserModel.objects.get(
-                Q(username__iexact=username) | Q(email__iexact=username)
+        if username is None or password is None:
+            return None
+
+        login = username.lower()
+        user = (
+            UserModel.objects
+            .alias(username_min=Lower('username'), email_min=Lower('email'))
+            .filter(Q(username_min=login) | Q(email_min=login))
+            .order_by(
+                Case(When(username_min=login, then=Value(0)), default=Value(1), output_field=IntegerField()),
+                'id',
             )
-        except UserModel.DoesNotExist:
+            .first()
+        )
+
+        if user is None:
+            # Gera o hash mesmo assim, para a resposta demorar o mesmo que a de
+            # um usuário existente (ver ModelBackend.authenticate).
+            UserModel().set_password(password)
             return None
-        except UserModel.MultipleObjectsReturned:
-            return UserModel.objects.filter(email=username).order_by('id').first()
 
         if user.check_password(password) and self.user_can_authenticate(user):
             return user
         
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,253 @@
+"""Latência, consultas SQL e bytes por view, no formato texto do Prometheus.
+
+Os números ficam na memória de cada processo; com vários workers, cada um
+responde pelos seus (o Prometheus soma as séries).
+"""
+import heapq
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+logger = logging.getLogger('core.metricas.lentas')
+
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LIMITES_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+PIORES_CONSULTAS = 3
+
+_coleta_atual = ContextVar('coleta_metricas', default=None)
+
+
+class _Histograma:
+    __slots__ = ('limites', 'contagens', 'soma', 'total')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+
+class _View:
+    __slots__ = ('latencia', 'consultas', 'tempo_sql', 'bytes_resposta', 'bytes_upload', 'respostas')
+
+    def __init__(self):
+        self.latencia = _Histograma(LIMITES_SEGUNDOS)
+        self.consultas = _Histograma(LIMITES_CONSULTAS)
+        self.tempo_sql = 0.0
+        self.bytes_resposta = 0
+        self.bytes_upload = 0
+        self.respostas = {}
+
+
+class Registro:
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._views = {}
+
+    def observar(self, view, metodo, status, duracao, consultas, tempo_sql, bytes_resposta, bytes_upload):
+        with self._trava:
+            dados = self._views.get(view)
+            if dados is None:
+                dados = self._views[view] = _View()
+            dados.latencia.observar(duracao)
+            dados.consultas.observar(consultas)
+            dados.tempo_sql += tempo_sql
+            dados.bytes_resposta += bytes_resposta
+            dados.bytes_upload += bytes_upload
+            chave = (metodo, status)
+            dados.respostas[chave] = dados.respostas.get(chave, 0) + 1
+
+    def limpar(self):
+        with self._trava:
+            self._views.clear()
+
+    def exportar(self):
+        with self._trava:
+            views = sorted(self._views.items())
+            linhas = []
+            _histogramas(linhas, views, 'protese_requisicao_segundos',
+                         'Latência das requisições por view.', lambda d: d.latencia)
+            _histogramas(linhas, views, 'protese_sql_consultas',
+                         'Consultas SQL por requisição.', lambda d: d.consultas)
+            linhas += ['# HELP protese_requisicoes_total Requisições por view, método e status.',
+                       '# TYPE protese_requisicoes_total counter']
+            for view, dados in views:
+                for (metodo, status), total in sorted(dados.respostas.items()):
+                    linhas.append(
+                        f'protese_requisicoes_total{{view="{_rotulo(view)}",metodo="{metodo}",status="{status}"}} {total}'
+                    )
+            for nome, ajuda, valor in (
+                ('protese_sql_segundos_total', 'Tempo gasto em SQL por view.', lambda d: d.tempo_sql),
+                ('protese_resposta_bytes_total', 'Bytes de resposta com tamanho conhecido.', lambda d: d.bytes_resposta),
+                ('protese_upload_bytes_total', 'Bytes recebidos no corpo das requisições.', lambda d: d.bytes_upload),
+            ):
+                linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} counter']
+                linhas += [f'{nome}{{view="{_rotulo(view)}"}} {_numero(valor(dados))}' for view, dados in views]
+        return '\n'.join(linhas) + '\n'
+
+
+def _rotulo(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _numero(valor):
+    return repr(round(valor, 6)) if isinstance(valor, float) else str(valor)
+
+
+def _histogramas(linhas, views, nome, ajuda, histograma):
+    linhas += [f'# HELP {nome} {ajuda}', f'# TYPE {nome} histogram']
+    for view, dados in views:
+        h = histograma(dados)
+        acumulado = 0
+        for limite, contagem in zip(h.limites + (float('inf'),), h.contagens):
+            acumulado += contagem
+            le = '+Inf' if limite == float('inf') else _numero(float(limite))
+            linhas.append(f'{nome}_bucket{{view="{_rotulo(view)}",le="{le}"}} {acumulado}')
+        linhas.append(f'{nome}_sum{{view="{_rotulo(view)}"}} {_numero(h.soma)}')
+        linhas.append(f'{nome}_count{{view="{_rotulo(view)}"}} {h.total}')
+
+
+registro = Registro()
+
+
+class _Coleta:
+    __slots__ = ('consultas', 'tempo_sql', 'piores', 'guardar_piores')
+
+    def __init__(self, guardar_piores):
+        self.consultas = 0
+        self.tempo_sql = 0.0
+        self.piores = []
+        self.guardar_piores = guardar_piores
+
+    def registrar(self, sql, duracao):
+        self.consultas += 1
+        self.tempo_sql += duracao
+        if self.guardar_piores:
+            item = (duracao, self.consultas, sql)
+            if len(self.piores) < PIORES_CONSULTAS:
+                heapq.heappush(self.piores, item)
+            elif duracao > self.piores[0][0]:
+                heapq.heapreplace(self.piores, item)
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    coleta = _coleta_atual.get()
+    if coleta is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        coleta.registrar(sql, time.perf_counter() - inicio)
+
+
+def _instalar(conexao):
+    if _medir_consulta not in conexao.execute_wrappers:
+        conexao.execute_wrappers.append(_medir_consulta)
+
+
+@receiver(connection_created)
+def _conexao_criada(sender, connection, **kwargs):
+    # Conexões das threads de sync_to_async também passam a ser medidas; a
+    # ContextVar diz a qual requisição cada consulta pertence.
+    _instalar(connection)
+
+
+class MetricasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def _iniciar(self):
+        limite = getattr(settings, 'METRICAS_LENTAS_MS', 0)
+        coleta = _Coleta(guardar_piores=bool(limite))
+        return coleta, _coleta_atual.set(coleta), time.perf_counter()
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        for conexao in connections.all(initialized_only=True):
+            _instalar(conexao)
+        coleta, token, inicio = self._iniciar()
+        try:
+            resposta = self.get_response(request)
+        finally:
+            _coleta_atual.reset(token)
+        self._concluir(request, resposta, coleta, time.perf_counter() - inicio)
+        return resposta
+
+    async def __acall__(self, request):
+        coleta, token, inicio = self._iniciar()
+        try:
+            resposta = await self.get_response(request)
+        finally:
+            _coleta_atual.reset(token)
+        self._concluir(request, resposta, coleta, time.perf_counter() - inicio)
+        return resposta
+
+    def _concluir(self, request, resposta, coleta, duracao):
+        # Só o nome da rota vira rótulo: caminhos com ids explodiriam o número de séries.
+        rota = getattr(request, 'resolver_match', None)
+        view = (rota.view_name if rota else None) or 'sem_rota'
+        if resposta.has_header('Content-Length'):
+            bytes_resposta = int(resposta['Content-Length'])
+        elif not resposta.streaming:
+            bytes_resposta = len(resposta.content)
+        else:
+            bytes_resposta = 0
+        try:
+            bytes_upload = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            bytes_upload = 0
+
+        registro.observar(view, request.method, resposta.status_code, duracao,
+                          coleta.consultas, coleta.tempo_sql, bytes_resposta, bytes_upload)
+
+        limite = getattr(settings, 'METRICAS_LENTAS_MS', 0)
+        if limite and duracao * 1000 >= limite:
+            piores = ''.join(
+                f'\n  {tempo * 1000:.1f} ms (#{ordem}): {sql[:500]}'
+                for tempo, ordem, sql in sorted(coleta.piores, reverse=True)
+            )
+            logger.warning(
+                'Requisição lenta: %s %s (%s) %.0f ms, %d consulta(s) em %.0f ms.%s',
+                request.method, request.path, view, duracao * 1000,
+                coleta.consultas, coleta.tempo_sql * 1000, piores,
+            )
+
+
+def _autorizado(request):
+    token = getattr(settings, 'METRICAS_TOKEN', '')
+    cabecalho = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(cabecalho.encode(), f'Bearer {token}'.encode()):
+        return True
+    usuario = request.user
+    return usuario.is_authenticated and (usuario.is_superuser or usuario.tipo_usuario == 'GESTOR')
+
+
+def metricas(request):
+    if not _autorizado(request):
+        resposta = HttpResponse('Não autorizado.', status=401, content_type='text/plain; charset=utf-8')
+        resposta['WWW-Authenticate'] = 'Bearer'
+        return resposta
+    return HttpResponse(registro.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metricas.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,10 +74,69 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
+# DB_ENGINE=sqlite (padrão) ou postgresql.
+
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+
+# WAL deixa leituras e a escrita andarem juntas; o restante reduz fsync e
+# mantém mais páginas em memória. Executado a cada nova conexão.
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    f"PRAGMA busy_timeout={config('SQLITE_BUSY_TIMEOUT', default=5000, cast=int)}",
+    f"PRAGMA mmap_size={config('SQLITE_MMAP_SIZE', default=256 * 1024 ** 2, cast=int)}",
+    f"PRAGMA cache_size={config('SQLITE_CACHE_SIZE', default=-64000, cast=int)}",
+    'PRAGMA temp_store=MEMORY',
+]
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='proteseflow'),
+            'USER': config('DB_USER', default='proteseflow'),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if config('DB_POOL', default=False, cast=bool):
+        # Pool do psycopg 3 (pip install "psycopg[pool]"); não combina com CONN_MAX_AGE.
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': config('DB_POOL_MIN', default=2, cast=int),
+                'max_size': config('DB_POOL_MAX', default=10, cast=int),
+            },
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=60, cast=int)
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+            'OPTIONS': {
+                'init_command': '; '.join(SQLITE_PRAGMAS),
+                # Transações já começam com a trava de escrita: sem "database is
+                # locked" ao promover uma leitura para escrita no meio do bloco.
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+
+
+# Cache (KPIs do dashboard)
+# LocMemCache é por processo: com mais de um worker a invalidação feita num
+# não chega aos outros e os KPIs ficam velhos até TEMPO_CACHE_KPIS. Nesse caso
+# use um cache compartilhado, ex.: CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# e CACHE_LOCATION=redis://127.0.0.1:6379/1.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='protese-flow'),
     }
 }
 
@@ -127,11 +187,61 @@ AUTH_USER_MODEL = 'pedidos.Usuario'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Anexos e entregas são deduplicados por SHA-256 e as malhas (STL/PLY/OBJ)
+# gravadas com gzip (ver pedidos.storage). Só deduplicação:
+# STORAGE_BACKEND=pedidos.storage.ArmazenamentoDeduplicado
+STORAGES = {
+    'default': {
+        'BACKEND': config('STORAGE_BACKEND', default='pedidos.storage.ArmazenamentoComprimido'),
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Arquivos que ficam sem registro (pedido/anexo excluído, entrega trocada):
+# 'fila' apaga pela fila de tarefas, 'commit' logo após o commit da
+# requisição, '' deixa para o comando reconciliar_midia.
+REMOVER_ARQUIVOS_ORFAOS = config('REMOVER_ARQUIVOS_ORFAOS', default='fila')
+
+# Miniaturas e versões web das fotos anexadas (geradas sob demanda). Acima do
+# limite, as menos acessadas são apagadas.
+RENDICOES_DIR = config('RENDICOES_DIR', default=os.path.join(BASE_DIR, 'cache', 'rendicoes'))
+RENDICOES_LIMITE_BYTES = config('RENDICOES_LIMITE_BYTES', default=512 * 1024 ** 2, cast=int)
+
+# Upload em blocos (retomável) de escaneamentos
+TAMANHO_MAXIMO_UPLOAD = config('TAMANHO_MAXIMO_UPLOAD', default=2 * 1024 ** 3, cast=int)
+TAMANHO_MAXIMO_BLOCO_UPLOAD = config('TAMANHO_MAXIMO_BLOCO_UPLOAD', default=16 * 1024 ** 2, cast=int)
+# Uploads sem nenhum bloco novo por mais horas que isso são apagados (manage.py expirar_uploads).
+UPLOAD_EXPIRA_APOS_HORAS = config('UPLOAD_EXPIRA_APOS_HORAS', default=48, cast=int)
+
+# Downloads protegidos: '' (Django transmite), 'x-accel' (nginx) ou 'x-sendfile' (Apache)
+DOWNLOAD_OFFLOAD = config('DOWNLOAD_OFFLOAD', default='')
+DOWNLOAD_ACCEL_PREFIX = config('DOWNLOAD_ACCEL_PREFIX', default='/media-protegida/')
+
+# Casos em produção/retrabalho que um cadista pode ter ao mesmo tempo (0 = sem limite)
+LIMITE_CASOS_POR_CADISTA = config('LIMITE_CASOS_POR_CADISTA', default=5, cast=int)
+
+# Pedidos APROVADO criados há mais dias que isso vão para o arquivo
+# (manage.py archive_pedidos).
+ARQUIVAR_APOS_DIAS = config('ARQUIVAR_APOS_DIAS', default=180, cast=int)
+
+# Atualizações ao vivo (SSE): diretório de sockets Unix para repassar eventos
+# entre processos do servidor. Vazio = só dentro do processo (um worker).
+TRANSMISSAO_SOCKETS = config('TRANSMISSAO_SOCKETS', default='')
+
+# Métricas por view em /metrics (formato Prometheus): gestores logados ou
+# "Authorization: Bearer <METRICAS_TOKEN>". Requisições acima de
+# METRICAS_LENTAS_MS (0 = desligado) vão para o logger core.metricas.lentas
+# com as consultas mais demoradas.
+METRICAS_TOKEN = config('METRICAS_TOKEN', default='')
+METRICAS_LENTAS_MS = config('METRICAS_LENTAS_MS', default=0, cast=int)
+
 LOGIN_REDIRECT_URL = '/dashboard/'
 LOGOUT_REDIRECT_URL = '/login/'
 LOGIN_URL = '/login/'
 
 AUTHENTICATION_BACKENDS = [
     'core.backends.EmailOuUsuarioModelBackend',
-    'django.contrib.auth.backends.ModelBackend',
 ]
\ No newline at end of file
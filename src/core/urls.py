@@ -11,6 +11,7 @@ from pedidos.views import (
 )
 from django.conf import settings
 from django.conf.urls.static import static
+from core.metricas import metricas
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -25,14 +26,38 @@ urlpatterns = [
     # --- Fluxo Principal ---
     path('', views.dashboard, name='home'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('metrics', metricas, name='metricas'),
     path('pedidos/', views.lista_pedidos, name='lista_pedidos'),
+    path('pedidos/exportar/', views.exportar_pedidos, name='exportar_pedidos'),
+    path('pedidos/importar/', views.importar_pedidos, name='importar_pedidos'),
     
     # --- CRUD Pedidos ---
     path('pedidos/novo/', views.novo_pedido, name='criar_pedido'),
     path('pedidos/novo-pedido/', views.novo_pedido, name='novo_pedido'),
+    path('pedidos/<int:id>/', views.detalhes_pedido, name='detalhes_pedido'),
+    path('pedidos/proximo/', views.proximo_pedido, name='proximo_pedido'),
+    path('pedidos/atualizacoes/', views.fluxo_pedidos, name='fluxo_pedidos'),
     path('pedidos/editar/<int:id>/', views.editar_pedido, name='editar_pedido'),
     path('pedidos/excluir/<int:id>/', views.excluir_pedido, name='excluir_pedido'),
 
+    # --- Arquivo (pedidos aprovados antigos, somente leitura) ---
+    path('pedidos/arquivo/', views.arquivo_pedidos, name='arquivo_pedidos'),
+    path('pedidos/arquivo/<int:id>/', views.detalhes_arquivado, name='detalhes_arquivado'),
+    path('pedidos/arquivo/<int:id>/entrega/', views.baixar_entrega_arquivada, name='baixar_entrega_arquivada'),
+    path('anexos-arquivados/<int:id>/download/', views.baixar_anexo_arquivado, name='baixar_anexo_arquivado'),
+    path('anexos-arquivados/<int:id>/previa/', views.baixar_anexo_arquivado, {'previa': True},
+         name='baixar_previa_anexo_arquivado'),
+
+    # --- Downloads protegidos ---
+    path('anexos/<int:id>/download/', views.baixar_anexo, name='baixar_anexo'),
+    path('anexos/<int:id>/previa/', views.baixar_anexo, {'previa': True}, name='baixar_previa_anexo'),
+    path('anexos/<int:id>/imagem/<str:tamanho>/', views.imagem_anexo, name='imagem_anexo'),
+    path('pedidos/<int:id>/entrega/', views.baixar_entrega, name='baixar_entrega'),
+
+    # --- Upload em blocos (retomável) ---
+    path('pedidos/<int:id>/uploads/', views.iniciar_upload, name='iniciar_upload'),
+    path('uploads/<uuid:upload_id>/', views.upload_bloco, name='upload_bloco'),
+
     # --- Gestão de Usuários ---
     path('usuarios/', views.lista_usuarios, name='lista_usuarios'),
     path('usuarios/criar/', views.criar_usuario, name='criar_usuario'),
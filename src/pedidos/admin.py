@@ -1,6 +1,17 @@
 from django.contrib import admin
-from .models import Usuario, Pedido, Anexo
+from .models import (
+    Usuario, Pedido, Anexo, UploadArquivo, ArquivoArmazenado, ElementoPedido, Tarefa,
+    PedidoEvento, IndicadorDiario, PedidoArquivado, AnexoArquivado,
+)
 
 admin.site.register(Usuario)
 admin.site.register(Pedido)
-admin.site.register(Anexo)
\ No newline at end of file
+admin.site.register(Anexo)
+admin.site.register(UploadArquivo)
+admin.site.register(ArquivoArmazenado)
+admin.site.register(ElementoPedido)
+admin.site.register(Tarefa)
+admin.site.register(PedidoEvento)
+admin.site.register(IndicadorDiario)
+admin.site.register(PedidoArquivado)
+admin.site.register(AnexoArquivado)
\ No newline at end of file
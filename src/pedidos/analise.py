@@ -0,0 +1,168 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import as_completed
+from datetime import timedelta
+
+from django.core.files import File
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .malhas import analisar_em_processo
+from .models import Anexo
+
+EXTENSOES_MALHA = ('.stl', '.ply')
+
+CAMPOS_ANALISE = [
+    'analise_status', 'analise_erro', 'triangulos', 'vertices',
+    'caixa_delimitadora', 'area_superficie', 'estanque', 'previa',
+]
+# Análises em PROCESSANDO há mais que isso são de um worker que parou.
+ANALISE_EXPIRA_APOS = 30 * 60
+
+
+def _reservar(pk):
+    # A atualização condicional garante que dois workers não peguem o mesmo anexo.
+    return Anexo.objects.filter(pk=pk, analise_status='PENDENTE').update(
+        analise_status='PROCESSANDO', analise_iniciada_em=timezone.now(),
+    )
+
+
+def devolver_presos(idade=ANALISE_EXPIRA_APOS):
+    """Devolve para a fila as análises reservadas há mais de ``idade`` segundos."""
+    limite = timezone.now() - timedelta(seconds=idade)
+    return (
+        Anexo.objects.filter(analise_status='PROCESSANDO')
+        .filter(Q(analise_iniciada_em__lt=limite) | Q(analise_iniciada_em__isnull=True))
+        .update(analise_status='PENDENTE', analise_iniciada_em=None)
+    )
+
+
+def reservar_pendentes(limite):
+    ids = list(
+        Anexo.objects.filter(analise_status='PENDENTE')
+        .order_by('uploaded_at')
+        .values_list('pk', flat=True)[:limite]
+    )
+    reservados = [pk for pk in ids if _reservar(pk)]
+    return list(Anexo.objects.filter(pk__in=reservados))
+
+
+def _salvar(anexo, campos):
+    """Grava ``campos``; devolve False se o anexo foi excluído durante a análise."""
+    try:
+        with transaction.atomic():
+            anexo.save(update_fields=campos)
+    except DatabaseError:
+        # save(update_fields=...) sem linha afetada: só engole se o anexo sumiu mesmo.
+        if Anexo.objects.filter(pk=anexo.pk).exists():
+            raise
+        return False
+    return True
+
+
+def registrar_resultado(anexo, resultado, erro, caminho_previa=None):
+    previa_nova = None
+    if erro:
+        anexo.analise_status = 'ERRO'
+        anexo.analise_erro = erro[:1000]
+    else:
+        anexo.analise_status = 'CONCLUIDA'
+        anexo.analise_erro = ''
+        for campo, valor in resultado.items():
+            setattr(anexo, campo, valor)
+        if caminho_previa and os.path.getsize(caminho_previa):
+            base = os.path.splitext(os.path.basename(anexo.arquivo.name))[0]
+            with open(caminho_previa, 'rb') as f:
+                anexo.previa.save(f'{base}_previa.stl', File(f), save=False)
+            previa_nova = anexo.previa.name
+
+    if caminho_previa and os.path.exists(caminho_previa):
+        os.remove(caminho_previa)
+    if not _salvar(anexo, CAMPOS_ANALISE):
+        if previa_nova:
+            anexo.previa.storage.delete(previa_nova)
+        return False
+    return True
+
+
+def _descomprimir(arquivo):
+    # Os leitores usam memmap: a malha comprimida vira um arquivo cru temporário.
+    fd, caminho = tempfile.mkstemp(suffix=os.path.splitext(arquivo.name)[1])
+    with os.fdopen(fd, 'wb') as destino, arquivo.storage.open(arquivo.name, 'rb') as origem:
+        shutil.copyfileobj(origem, destino)
+    return caminho
+
+
+def _remover(caminho):
+    if caminho and os.path.exists(caminho):
+        os.remove(caminho)
+
+
+def _preparar(anexo):
+    """Devolve ``(caminho, caminho_previa, temporario)``, ou None se o anexo não
+    tiver o que analisar. ``temporario`` é a cópia descomprimida, se houve."""
+    if os.path.splitext(anexo.arquivo.name)[1].lower() not in EXTENSOES_MALHA:
+        anexo.analise_status = 'IGNORADA'
+        _salvar(anexo, ['analise_status'])
+        return None
+    try:
+        caminho = anexo.arquivo.path
+    except NotImplementedError:
+        registrar_resultado(anexo, None, "O storage não expõe caminho local.")
+        return None
+
+    temporario = None
+    codec = getattr(anexo.arquivo.storage, 'codec', None)
+    if codec and codec(anexo.arquivo.name):
+        try:
+            caminho = temporario = _descomprimir(anexo.arquivo)
+        except (OSError, EOFError) as erro:
+            registrar_resultado(anexo, None, f"Não foi possível descomprimir o arquivo: {erro}")
+            return None
+
+    fd, caminho_previa = tempfile.mkstemp(suffix='.stl')
+    os.close(fd)
+    return caminho, caminho_previa, temporario
+
+
+def analisar_anexo(pk):
+    """Analisa um anexo no processo atual; usado pela fila de tarefas."""
+    if not _reservar(pk):
+        return False
+    anexo = Anexo.objects.filter(pk=pk).first()
+    if anexo is None:
+        return False
+    preparado = _preparar(anexo)
+    if preparado:
+        caminho, caminho_previa, temporario = preparado
+        try:
+            resultado, erro = analisar_em_processo(caminho, caminho_previa)
+        finally:
+            _remover(temporario)
+        registrar_resultado(anexo, resultado, erro, caminho_previa)
+    return True
+
+
+def processar_lote(executor, limite):
+    anexos = reservar_pendentes(limite)
+    futuros = {}
+
+    for anexo in anexos:
+        preparado = _preparar(anexo)
+        if preparado:
+            caminho, caminho_previa, temporario = preparado
+            futuros[executor.submit(analisar_em_processo, caminho, caminho_previa)] = (anexo, caminho_previa, temporario)
+
+    for futuro in as_completed(futuros):
+        anexo, caminho_previa, temporario = futuros[futuro]
+        try:
+            resultado, erro = futuro.result()
+        except Exception as excecao:
+            resultado, erro = None, f"Falha no processo de análise: {excecao}"
+        finally:
+            _remover(temporario)
+        registrar_resultado(anexo, resultado, erro, caminho_previa)
+
+    return len(anexos)
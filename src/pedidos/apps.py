@@ -1,4 +1,7 @@
 from django.apps import AppConfig
 
 class PedidosConfig(AppConfig):
-    name = 'pedidos'
\ No newline at end of file
+    name = 'pedidos'
+
+    def ready(self):
+        from . import signals  # noqa: F401
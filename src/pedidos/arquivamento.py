@@ -0,0 +1,119 @@
+"""Separação entre pedidos ativos (``Pedido``) e o histórico (``PedidoArquivado``).
+
+Pedidos APROVADO antigos saem da tabela quente em lotes pequenos, cada lote na
+sua transação. O id é preservado e a linha do FTS volta a apontar para ele, de
+modo que ``filtrar_busca`` funciona igual sobre ``PedidoArquivado``.
+"""
+import datetime
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+from .busca import indexar_pedidos
+from .models import Anexo, AnexoArquivado, Pedido, PedidoArquivado
+from .odontograma import sincronizar_elementos
+
+TAMANHO_LOTE_ARQUIVAMENTO = 200
+
+_local = threading.local()
+
+
+def _campos(modelo, excluir=()):
+    return [f.attname for f in modelo._meta.concrete_fields if f.attname not in excluir]
+
+
+_CAMPOS_PEDIDO = _campos(PedidoArquivado, excluir=('arquivado_em',))
+_CAMPOS_ANEXO = _campos(AnexoArquivado)
+
+
+def _copiar(origem, campos):
+    valores = {}
+    for campo in campos:
+        valor = getattr(origem, campo)
+        valores[campo] = valor.name if isinstance(valor, FieldFile) else valor
+    return valores
+
+
+def em_movimento():
+    """Verdadeiro enquanto pedidos trocam de tabela: a exclusão não é definitiva."""
+    return getattr(_local, 'movendo', False)
+
+
+@contextmanager
+def _movendo():
+    _local.movendo = True
+    try:
+        yield
+    finally:
+        _local.movendo = False
+
+
+def candidatos(idade_dias):
+    corte = timezone.now() - datetime.timedelta(days=idade_dias)
+    return Pedido.objects.filter(status='APROVADO', data_criacao__lt=corte)
+
+
+def arquivar_lote(ids):
+    """Move os pedidos ``ids`` (se ainda APROVADO) para o arquivo. Devolve quantos."""
+    with transaction.atomic():
+        pedidos = list(
+            Pedido.objects.select_for_update()
+            .filter(pk__in=ids, status='APROVADO')
+            .prefetch_related('anexos')
+        )
+        if not pedidos:
+            return 0
+        arquivados = PedidoArquivado.objects.bulk_create(
+            [PedidoArquivado(**_copiar(pedido, _CAMPOS_PEDIDO)) for pedido in pedidos]
+        )
+        AnexoArquivado.objects.bulk_create([
+            AnexoArquivado(**_copiar(anexo, _CAMPOS_ANEXO))
+            for pedido in pedidos for anexo in pedido.anexos.all()
+        ])
+        # Os sinais de exclusão tiram o pedido do FTS e pedem a liberação dos
+        # arquivos; liberar_arquivo vê que o arquivo segue referenciado no
+        # arquivo. O histórico de eventos fica.
+        with _movendo():
+            Pedido.objects.filter(pk__in=[pedido.pk for pedido in pedidos]).delete()
+        indexar_pedidos(arquivados)
+    return len(pedidos)
+
+
+def arquivar_antigos(idade_dias, lote=TAMANHO_LOTE_ARQUIVAMENTO, limite=None, pausa=0):
+    """Arquiva, lote a lote, os pedidos APROVADO criados há mais de ``idade_dias``."""
+    total = 0
+    while limite is None or total < limite:
+        tamanho = lote if limite is None else min(lote, limite - total)
+        ids = list(candidatos(idade_dias).order_by('data_criacao', 'pk').values_list('pk', flat=True)[:tamanho])
+        if not ids:
+            break
+        total += arquivar_lote(ids)
+        if pausa:
+            # Dá espaço às requisições entre uma escrita e outra.
+            time.sleep(pausa)
+    return total
+
+
+def restaurar_pedido(pedido_id):
+    """Devolve um pedido arquivado à tabela ativa, com o mesmo id e anexos."""
+    with transaction.atomic():
+        arquivado = (
+            PedidoArquivado.objects.select_for_update()
+            .prefetch_related('anexos')
+            .get(pk=pedido_id)
+        )
+        pedido = Pedido(**_copiar(arquivado, _CAMPOS_PEDIDO))
+        # raw, como no loaddata: mantém data_criacao/uploaded_at e não gera
+        # evento de status nem nova análise de malha. O FTS já tem a linha e
+        # os KPIs são invalidados pelo post_save, que roda mesmo em raw.
+        pedido.save_base(raw=True, force_insert=True)
+        for anexo in arquivado.anexos.all():
+            Anexo(**_copiar(anexo, _CAMPOS_ANEXO)).save_base(raw=True, force_insert=True)
+        sincronizar_elementos(pedido)
+        with _movendo():
+            arquivado.delete()
+    return pedido
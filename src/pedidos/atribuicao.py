@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import IsNull
+
+from .busca import indexar_pedido
+from .eventos import registrar_evento
+from .kpis import invalidar_kpis
+from .models import Pedido
+from .transmissao import publicar_pedido
+
+STATUS_ATIVOS = ('EM_PRODUCAO', 'RETRABALHO')
+CANDIDATOS_POR_TENTATIVA = 10
+
+
+def casos_ativos(cadista):
+    return Pedido.objects.filter(cadista=cadista, status__in=STATUS_ATIVOS).count()
+
+
+def _ativos_do_cadista(cadista):
+    return Coalesce(Subquery(
+        Pedido.objects.filter(cadista=cadista, status__in=STATUS_ATIVOS)
+        .order_by()
+        .values('cadista')
+        .annotate(total=Count('pk'))
+        .values('total')[:1]
+    ), Value(0))
+
+
+def assumir_pedido(pedido_id, cadista, limite=None):
+    """Atribui o pedido ao cadista num único UPDATE condicional.
+
+    Só um entre vários cliques simultâneos encontra o pedido ainda PENDENTE; o
+    limite de casos em andamento é conferido no mesmo comando. Só cadistas
+    assumem pedidos.
+    """
+    if cadista.tipo_usuario != 'CADISTA':
+        return None
+    limite = settings.LIMITE_CASOS_POR_CADISTA if limite is None else limite
+    consulta = Pedido.objects.filter(pk=pedido_id, status='PENDENTE')
+    if limite:
+        consulta = consulta.alias(ativos=_ativos_do_cadista(cadista)).filter(ativos__lt=limite)
+    if not consulta.update(status='EM_PRODUCAO', cadista=cadista):
+        return None
+
+    # update() não dispara post_save: evento, índice de busca, KPIs e transmissão ficam por conta daqui.
+    pedido = Pedido.objects.get(pk=pedido_id)
+    registrar_evento(pedido, 'PENDENTE', 'EM_PRODUCAO')
+    publicar_pedido(pedido, 'PENDENTE', None)
+    indexar_pedido(pedido)
+    transaction.on_commit(lambda: invalidar_kpis(pedido))
+    return pedido
+
+
+def fila_pendentes():
+    # Mais urgente primeiro; sem prazo vai para o fim, e o mais antigo desempata.
+    # "IS NULL" explícito em vez de NULLS LAST, para seguir pedido_fila_idx.
+    return Pedido.objects.filter(status='PENDENTE').order_by(
+        IsNull(F('data_entrega_prevista'), True), 'data_entrega_prevista', 'data_criacao', 'pk',
+    )
+
+
+def proximo_pedido(cadista, limite=None):
+    if cadista.tipo_usuario != 'CADISTA':
+        return None
+    limite = settings.LIMITE_CASOS_POR_CADISTA if limite is None else limite
+    if limite and casos_ativos(cadista) >= limite:
+        return None
+
+    # Quem perde a corrida por um pedido tenta o seguinte, sem esperar por trava.
+    anteriores = None
+    while True:
+        candidatos = list(fila_pendentes().values_list('pk', flat=True)[:CANDIDATOS_POR_TENTATIVA])
+        # Fila vazia, ou igual à da volta anterior em que nada foi assumido:
+        # a falha não foi corrida com outro cadista, e tentar de novo não muda nada.
+        if not candidatos or candidatos == anteriores:
+            return None
+        for pk in candidatos:
+            pedido = assumir_pedido(pk, cadista, limite)
+            if pedido is not None:
+                return pedido
+        if limite and casos_ativos(cadista) >= limite:
+            return None
+        anteriores = candidatos
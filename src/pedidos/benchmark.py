@@ -0,0 +1,255 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .busca import indexar_pedidos
+from .eventos import eventos_em_lote, registrar_evento
+from .kpis import _chave, invalidar_kpis
+from .models import Anexo, ElementoPedido, Pedido, Usuario
+from .odontograma import serializar_elementos
+
+PREFIXO_BENCHMARK = 'bench_'
+TAMANHO_LOTE_BENCHMARK = 1000
+
+_NOMES = ['Ana', 'Bruno', 'Carla', 'Daniel', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique', 'Isabela',
+          'João', 'Larissa', 'Marcos', 'Natália', 'Otávio', 'Paula', 'Rafael', 'Sofia', 'Tiago']
+_SOBRENOMES = ['Silva', 'Souza', 'Oliveira', 'Santos', 'Pereira', 'Lima', 'Carvalho', 'Ferreira',
+               'Rodrigues', 'Almeida', 'Costa', 'Gomes', 'Martins', 'Araújo', 'Ribeiro']
+_STATUS = [('PENDENTE', 20), ('EM_PRODUCAO', 20), ('CONCLUIDO', 15), ('RETRABALHO', 5), ('APROVADO', 40)]
+_PROCEDIMENTOS = [('COROA', 50), ('FACETA', 20), ('PROVISORIO', 15), ('IMPLANTE', 15)]
+_SERVICOS = {'COROA': 'Coroa', 'FACETA': 'Faceta', 'PROVISORIO': 'Provisório', 'IMPLANTE': 'Coroa sobre Implante'}
+_CORES = ['A1', 'A2', 'A3', 'B1', 'B2', 'C1', None]
+# STL ASCII mínimo; todos os anexos sintéticos apontam para o mesmo arquivo.
+_STL = b'solid bench\nfacet normal 0 0 1\nouter loop\nvertex 0 0 0\nvertex 1 0 0\nvertex 0 1 0\nendloop\nendfacet\nendsolid bench\n'
+
+
+def _escolher(sorteio, pesos):
+    return sorteio.choices([valor for valor, _ in pesos], weights=[peso for _, peso in pesos])[0]
+
+
+def _odontograma(sorteio):
+    """Um a quatro dentes vizinhos no mesmo quadrante, quase sempre com o mesmo procedimento."""
+    quadrante = sorteio.randint(1, 4)
+    quantidade = sorteio.choices([1, 2, 3, 4], weights=[55, 20, 15, 10])[0]
+    inicio = sorteio.randint(1, 9 - quantidade)
+    procedimento = _escolher(sorteio, _PROCEDIMENTOS)
+    mapa = {}
+    for posicao in range(inicio, inicio + quantidade):
+        mapa[quadrante * 10 + posicao] = (
+            procedimento if sorteio.random() < 0.85 else _escolher(sorteio, _PROCEDIMENTOS)
+        )
+    return mapa, procedimento
+
+
+def _usuarios(tipo, quantidade, prefixo, senha, inicio):
+    usuarios = [
+        Usuario(
+            username=f'{prefixo}{tipo.lower()}_{inicio + i}',
+            first_name=_NOMES[(inicio + i) % len(_NOMES)],
+            last_name=_SOBRENOMES[(inicio + i) % len(_SOBRENOMES)],
+            email=f'{prefixo}{tipo.lower()}_{inicio + i}@exemplo.com',
+            cro=f'BENCH-{inicio + i}' if tipo == 'DENTISTA' else None,
+            tipo_usuario=tipo,
+            password=senha,
+            cadastro_confirmado=True,
+        )
+        for i in range(quantidade)
+    ]
+    return Usuario.objects.bulk_create(usuarios)
+
+
+def semear(dentistas=50, cadistas=10, pedidos=10000, anexos_por_pedido=1, dias=365,
+           semente=42, prefixo=PREFIXO_BENCHMARK, tamanho_lote=TAMANHO_LOTE_BENCHMARK):
+    """Cria usuários, pedidos (com odontograma, eventos e índice de busca) e anexos em lote."""
+    sorteio = random.Random(semente)
+    senha = make_password('benchmark')
+    inicio = Usuario.objects.filter(username__startswith=prefixo).count()
+    agora = timezone.now()
+
+    with transaction.atomic():
+        if not Usuario.objects.filter(username=f'{prefixo}gestor').exists():
+            Usuario.objects.create(
+                username=f'{prefixo}gestor', first_name='Gestão', tipo_usuario='GESTOR',
+                password=senha, cadastro_confirmado=True,
+            )
+        lista_dentistas = _usuarios('DENTISTA', dentistas, prefixo, senha, inicio)
+        lista_cadistas = _usuarios('CADISTA', cadistas, prefixo, senha, inicio)
+        blob = default_storage.save('benchmark/modelo.stl', ContentFile(_STL)) if anexos_por_pedido else None
+
+    criados = 0
+    while criados < pedidos:
+        lote = []
+        for _ in range(min(tamanho_lote, pedidos - criados)):
+            mapa, principal = _odontograma(sorteio)
+            status = _escolher(sorteio, _STATUS)
+            criacao = agora - timedelta(seconds=sorteio.randint(0, dias * 86400))
+            pedido = Pedido(
+                dentista=sorteio.choice(lista_dentistas),
+                cadista=None if status == 'PENDENTE' else sorteio.choice(lista_cadistas),
+                nome_paciente=f'{sorteio.choice(_NOMES)} {sorteio.choice(_SOBRENOMES)} {sorteio.choice(_SOBRENOMES)}',
+                sexo=sorteio.choice('MF'),
+                tipo_servico=_SERVICOS[principal],
+                cor=sorteio.choice(_CORES),
+                elementos=serializar_elementos(mapa),
+                dentes=', '.join(str(dente) for dente in sorted(mapa)),
+                status=status,
+                data_entrega_prevista=(criacao + timedelta(days=sorteio.randint(3, 20))).date(),
+                motivo_retrabalho='Ajustar contato proximal.' if status == 'RETRABALHO' else None,
+            )
+            pedido._criacao = criacao
+            lote.append((pedido, mapa))
+        _gravar_lote_benchmark(lote, anexos_por_pedido, blob, sorteio)
+        criados += len(lote)
+
+    for dentista in lista_dentistas:
+        invalidar_kpis(Pedido(dentista=dentista))
+    return criados
+
+
+def _gravar_lote_benchmark(lote, anexos_por_pedido, blob, sorteio):
+    pedidos = [pedido for pedido, _ in lote]
+    with transaction.atomic():
+        Pedido.objects.bulk_create(pedidos)
+        # auto_now_add ignora o valor informado no INSERT; a data espalhada vem depois.
+        for pedido in pedidos:
+            pedido.data_criacao = pedido._criacao
+        Pedido.objects.bulk_update(pedidos, ['data_criacao'])
+        ElementoPedido.objects.bulk_create([
+            ElementoPedido(pedido=pedido, dente=dente, procedimento=procedimento)
+            for pedido, mapa in lote
+            for dente, procedimento in mapa.items()
+        ])
+        Anexo.objects.bulk_create([
+            Anexo(
+                pedido=pedido, arquivo=blob, descricao=f'Escaneamento {numero + 1}',
+                analise_status='CONCLUIDA', triangulos=sorteio.randint(50_000, 400_000),
+                vertices=sorteio.randint(25_000, 200_000), estanque=True,
+            )
+            for pedido in pedidos
+            for numero in range(anexos_por_pedido)
+        ])
+        indexar_pedidos(pedidos)
+        with eventos_em_lote():
+            for pedido in pedidos:
+                registrar_evento(pedido, '', 'PENDENTE', quando=pedido.data_criacao)
+                if pedido.status != 'PENDENTE':
+                    registrar_evento(pedido, 'PENDENTE', pedido.status,
+                                     quando=pedido.data_criacao + timedelta(hours=sorteio.randint(1, 72)))
+
+
+def limpar(prefixo=PREFIXO_BENCHMARK):
+    usuarios = Usuario.objects.filter(username__startswith=prefixo)
+    with transaction.atomic():
+        Pedido.objects.filter(dentista__in=usuarios).delete()
+        return usuarios.delete()[1].get('pedidos.Usuario', 0)
+
+
+def _usuario_de_teste(tipo, prefixo):
+    usuarios = Usuario.objects.filter(tipo_usuario=tipo, is_active=True)
+    if tipo == 'GESTOR':
+        return usuarios.filter(username__startswith=prefixo).first() or usuarios.first()
+    # O usuário com mais pedidos, para as telas medirem o pior caso.
+    relacao = 'pedidos' if tipo == 'DENTISTA' else 'pedidos_alocados'
+    return (
+        usuarios.filter(username__startswith=prefixo).annotate(total=Count(relacao)).order_by('-total').first()
+        or usuarios.first()
+    )
+
+
+def cenarios(prefixo=PREFIXO_BENCHMARK):
+    """``(nome, papel, usuário, url)`` para cada tela medida."""
+    usuarios = {
+        'gestor': _usuario_de_teste('GESTOR', prefixo),
+        'cadista': _usuario_de_teste('CADISTA', prefixo),
+        'dentista': _usuario_de_teste('DENTISTA', prefixo),
+    }
+    usuarios = {papel: usuario for papel, usuario in usuarios.items() if usuario is not None}
+    lista = []
+    for papel, usuario in usuarios.items():
+        lista.append((f'dashboard {papel}', papel, usuario, '/dashboard/'))
+        lista.append((f'dashboard {papel} pendentes', papel, usuario, '/dashboard/?status=PENDENTE'))
+
+    for papel in ('gestor', 'dentista'):
+        if papel not in usuarios:
+            continue
+        usuario = usuarios[papel]
+        for ordem in ('id', '-id', 'paciente', '-paciente', 'data', '-data', 'status'):
+            lista.append((f'lista {papel} ordenar={ordem}', papel, usuario, f'/pedidos/?ordenar={ordem}'))
+
+        exemplo = Pedido.objects.for_user(usuario).order_by('-id').first()
+        if exemplo is None:
+            continue
+        sobrenome = exemplo.nome_paciente.split()[-1]
+        lista.append((f'lista {papel} busca texto', papel, usuario, f'/pedidos/?busca={sobrenome}'))
+        lista.append((f'lista {papel} busca prefixo', papel, usuario, f'/pedidos/?busca={sobrenome[:3]}'))
+        lista.append((f'lista {papel} busca id', papel, usuario, f'/pedidos/?busca={exemplo.id}'))
+        if papel == 'gestor':
+            lista.append((f'lista {papel} cliente', papel, usuario, f'/pedidos/?cliente={exemplo.dentista_id}'))
+        lista.append((f'detalhes {papel}', papel, usuario, f'/pedidos/{exemplo.id}/'))
+    return lista
+
+
+def executar(repeticoes=5, cache_quente=False, prefixo=PREFIXO_BENCHMARK):
+    """Mede cada cenário: consultas SQL e mediana do tempo de resposta (ms)."""
+    clientes = {}
+    resultados = {}
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for nome, papel, usuario, url in cenarios(prefixo):
+            if usuario.pk not in clientes:
+                clientes[usuario.pk] = Client()
+                clientes[usuario.pk].force_login(usuario)
+            cliente = clientes[usuario.pk]
+            cliente.get(url)  # aquecimento: templates, conexões, detecção do FTS
+
+            tempos, consultas, status = [], 0, None
+            for _ in range(repeticoes):
+                if not cache_quente:
+                    cache.delete(_chave(papel, usuario))
+                with CaptureQueriesContext(connection) as capturadas:
+                    inicio = time.perf_counter()
+                    resposta = cliente.get(url)
+                    tempos.append((time.perf_counter() - inicio) * 1000)
+                consultas, status = len(capturadas), resposta.status_code
+            resultados[nome] = {
+                'url': url,
+                'status': status,
+                'consultas': consultas,
+                'tempo_ms': round(statistics.median(tempos), 2),
+                'tempo_min_ms': round(min(tempos), 2),
+            }
+    return {
+        'gerado_em': timezone.now().isoformat(),
+        'banco': connection.vendor,
+        'pedidos': Pedido.objects.count(),
+        'repeticoes': repeticoes,
+        'cache_quente': cache_quente,
+        'cenarios': resultados,
+    }
+
+
+def comparar(atual, base, tolerancia=0.2, folga_ms=5.0):
+    """Regressões de ``atual`` em relação a ``base``: mais consultas ou tempo
+    acima de ``tolerancia`` (fração) e de ``folga_ms`` ao mesmo tempo."""
+    regressoes = []
+    for nome, medida in atual['cenarios'].items():
+        anterior = base.get('cenarios', {}).get(nome)
+        if anterior is None:
+            continue
+        if medida['consultas'] > anterior['consultas']:
+            regressoes.append((nome, f"consultas {anterior['consultas']} -> {medida['consultas']}"))
+        limite = max(anterior['tempo_ms'] * (1 + tolerancia), anterior['tempo_ms'] + folga_ms)
+        if medida['tempo_ms'] > limite:
+            regressoes.append((nome, f"tempo {anterior['tempo_ms']:.1f} ms -> {medida['tempo_ms']:.1f} ms"))
+    return regressoes
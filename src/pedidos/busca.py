@@ -0,0 +1,89 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+TABELA_BUSCA = 'pedidos_pedido_busca'
+CAMPOS_BUSCA = ('nome_paciente', 'tipo_servico', 'observacoes')
+
+_TERMO = re.compile(r'\w+', re.UNICODE)
+# Aliases de banco em que a tabela FTS já foi vista. Só a resposta positiva
+# fica guardada: um processo que subiu antes do migrate passa a usar o índice
+# assim que a tabela aparece, sem precisar reiniciar.
+_com_fts = set()
+
+
+def fts_disponivel(conexao=connection):
+    if conexao.vendor != 'sqlite':
+        return False
+    if conexao.alias in _com_fts:
+        return True
+    with conexao.cursor() as cursor:
+        if TABELA_BUSCA not in conexao.introspection.table_names(cursor):
+            return False
+    _com_fts.add(conexao.alias)
+    return True
+
+
+def esquecer_fts(alias=None):
+    """Descarta o que se sabe da tabela FTS (ex.: depois de um migrate)."""
+    if alias is None:
+        _com_fts.clear()
+    else:
+        _com_fts.discard(alias)
+
+
+def indexar_pedido(pedido):
+    if not fts_disponivel():
+        return
+    colunas = ', '.join(CAMPOS_BUSCA)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABELA_BUSCA} WHERE rowid = %s", [pedido.pk])
+        cursor.execute(
+            f"INSERT INTO {TABELA_BUSCA}(rowid, {colunas}) VALUES (%s, %s, %s, %s)",
+            [pedido.pk] + [getattr(pedido, campo) for campo in CAMPOS_BUSCA],
+        )
+
+
+def indexar_pedidos(pedidos):
+    """Versão em lote de ``indexar_pedido`` para pedidos novos (ex.: ``bulk_create``)."""
+    if not fts_disponivel() or not pedidos:
+        return
+    colunas = ', '.join(CAMPOS_BUSCA)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {TABELA_BUSCA}(rowid, {colunas}) VALUES (%s, %s, %s, %s)",
+            [[pedido.pk] + [getattr(pedido, campo) for campo in CAMPOS_BUSCA] for pedido in pedidos],
+        )
+
+
+def remover_pedido(pedido_id):
+    if not fts_disponivel():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABELA_BUSCA} WHERE rowid = %s", [pedido_id])
+
+
+def expressao_fts(texto):
+    # Cada termo vira um prefixo entre aspas, o que neutraliza a sintaxe do FTS5.
+    return ' '.join(f'"{termo}"*' for termo in _TERMO.findall(texto))
+
+
+def filtrar_busca(queryset, texto):
+    texto = (texto or '').strip()[:100]
+    if not texto:
+        return queryset
+    numero = texto.lstrip('#')
+    if numero.isdigit() and len(numero) <= 18:
+        return queryset.filter(pk=int(numero))
+
+    if not fts_disponivel():
+        return queryset.filter(nome_paciente__icontains=texto)
+
+    expressao = expressao_fts(texto)
+    if not expressao:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(
+        f"SELECT rowid FROM {TABELA_BUSCA} WHERE {TABELA_BUSCA} MATCH %s",
+        [expressao],
+    ))
@@ -0,0 +1,233 @@
+import asyncio
+import gzip
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import content_disposition_header, http_date
+
+from .storage import CODEC_GZIP
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+TAMANHO_BLOCO_DOWNLOAD = 256 * 1024
+
+
+class _Trecho:
+    """Leitor limitado a ``tamanho`` bytes a partir de ``inicio``.
+
+    Não expõe ``fileno()`` de propósito: o ``wsgi.file_wrapper`` do servidor
+    enviaria o arquivo inteiro em vez do trecho pedido.
+    """
+
+    def __init__(self, arquivo, inicio, tamanho):
+        self.arquivo = arquivo
+        self.restante = tamanho
+        arquivo.seek(inicio)
+
+    def read(self, n=-1):
+        if self.restante <= 0:
+            return b''
+        if n < 0 or n > self.restante:
+            n = self.restante
+        dados = self.arquivo.read(n)
+        self.restante -= len(dados)
+        return dados
+
+    def close(self):
+        self.arquivo.close()
+
+
+def _intervalo(cabecalho, tamanho):
+    # Só um intervalo por pedido; múltiplos intervalos recebem o arquivo inteiro.
+    m = _RANGE.match(cabecalho.strip())
+    if not m or not any(m.groups()):
+        return None
+    inicio, fim = m.groups()
+    if not inicio:
+        sufixo = int(fim)
+        if sufixo == 0:
+            return 'invalido'
+        return max(tamanho - sufixo, 0), tamanho - 1
+    inicio = int(inicio)
+    fim = min(int(fim), tamanho - 1) if fim else tamanho - 1
+    if inicio >= tamanho or fim < inicio:
+        return 'invalido'
+    return inicio, fim
+
+
+def etag_arquivo(estado, codificacao=None):
+    # Cada representação (comprimida ou não) tem a sua ETag.
+    sufixo = f'-{codificacao}' if codificacao else ''
+    return f'"{estado.st_size:x}-{estado.st_mtime_ns:x}{sufixo}"'
+
+
+_DESCOMPRESSORES = {CODEC_GZIP: gzip.open}
+
+
+def _aceita_codificacao(request, codec):
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        nome, _, parametro = item.partition(';')
+        if nome.strip().lower() != codec:
+            continue
+        parametro = parametro.strip().lower()
+        if parametro.startswith('q='):
+            try:
+                return float(parametro[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def _codec_gravado(arquivo):
+    registro = getattr(arquivo.storage, 'registro', None)
+    registro = registro(arquivo.name) if registro else None
+    if registro is None or not registro.codec:
+        return '', None
+    return registro.codec, registro.tamanho
+
+
+def _planejar(request, arquivo, nome_download, gravado):
+    """Decide a resposta sem ler o arquivo.
+
+    Devolve ``(resposta, None)`` quando já há o que responder (304, 416 ou
+    repasse ao servidor web) ou ``(None, envio)`` com o que transmitir.
+    """
+    if not arquivo:
+        raise Http404("Arquivo não encontrado.")
+    try:
+        caminho = arquivo.path
+        estado = os.stat(caminho)
+    except (FileNotFoundError, NotImplementedError):
+        raise Http404("Arquivo não encontrado.")
+
+    nome_download = nome_download or os.path.basename(arquivo.name)
+    codec, tamanho_original = gravado
+    if not codec:
+        codificacao, tamanho, abrir = None, estado.st_size, open
+    elif _aceita_codificacao(request, codec):
+        # Os bytes comprimidos vão como estão; o navegador descomprime.
+        codificacao, tamanho, abrir = codec, estado.st_size, open
+    else:
+        codificacao, tamanho, abrir = None, tamanho_original, _DESCOMPRESSORES[codec]
+
+    etag = etag_arquivo(estado, codificacao)
+    condicional = get_conditional_response(request, etag=etag, last_modified=int(estado.st_mtime))
+    if condicional is not None:
+        condicional['ETag'] = etag
+        if codec:
+            patch_vary_headers(condicional, ['Accept-Encoding'])
+        return condicional, None
+
+    modo = getattr(settings, 'DOWNLOAD_OFFLOAD', '')
+    # Arquivos comprimidos ficam no Django: o nginx não repassa Content-Encoding
+    # numa resposta de X-Accel-Redirect.
+    if modo in ('x-accel', 'x-sendfile') and not codec:
+        # O servidor web cuida de Range e do envio; aqui só a permissão.
+        tipo = mimetypes.guess_type(nome_download)[0] or 'application/octet-stream'
+        resposta = HttpResponse(content_type=tipo)
+        if modo == 'x-accel':
+            resposta['X-Accel-Redirect'] = settings.DOWNLOAD_ACCEL_PREFIX + quote(arquivo.name)
+        else:
+            resposta['X-Sendfile'] = caminho
+        resposta['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(nome_download)}"
+        return _cabecalhos(resposta, estado, etag, tamanho), None
+
+    intervalo = None
+    cabecalho_range = request.headers.get('Range')
+    # Descomprimindo, chegar ao byte N custa descomprimir tudo antes dele: cada
+    # retomada refaria o trabalho. Range vale só para os bytes gravados (gzip
+    # aceito pelo cliente); sem isso vai o arquivo inteiro, com 200.
+    descomprimindo = codec and not codificacao
+    if cabecalho_range and not descomprimindo and request.headers.get('If-Range', etag) == etag:
+        intervalo = _intervalo(cabecalho_range, tamanho)
+
+    if intervalo == 'invalido':
+        resposta = HttpResponse(status=416)
+        resposta['Content-Range'] = f'bytes */{tamanho}'
+        return resposta, None
+
+    return None, (lambda: abrir(caminho, 'rb'), estado, tamanho, etag, nome_download, intervalo, codec, codificacao)
+
+
+def _cabecalhos(resposta, estado, etag, tamanho, intervalo=None, codec='', codificacao=None):
+    if intervalo:
+        inicio, fim = intervalo
+        resposta['Content-Range'] = f'bytes {inicio}-{fim}/{tamanho}'
+        resposta['Content-Length'] = str(fim - inicio + 1)
+    elif not resposta.has_header('X-Accel-Redirect') and not resposta.has_header('X-Sendfile'):
+        resposta['Content-Length'] = str(tamanho)
+    if codificacao:
+        resposta['Content-Encoding'] = codificacao
+    if codec:
+        patch_vary_headers(resposta, ['Accept-Encoding'])
+    resposta['Accept-Ranges'] = 'none' if codec and not codificacao else 'bytes'
+    resposta['ETag'] = etag
+    resposta['Last-Modified'] = http_date(estado.st_mtime)
+    resposta['Cache-Control'] = 'private, no-cache'
+    return resposta
+
+
+def servir_arquivo(request, arquivo, nome_download=None, gravado=None):
+    if gravado is None:
+        gravado = _codec_gravado(arquivo) if arquivo else ('', None)
+    resposta, envio = _planejar(request, arquivo, nome_download, gravado)
+    if resposta is not None:
+        return resposta
+    abrir, estado, tamanho, etag, nome_download, intervalo, codec, codificacao = envio
+
+    inicio, fim = intervalo or (0, tamanho - 1)
+    f = abrir()
+    if intervalo or (codec and not codificacao):
+        # Descomprimindo, o fileno() seria o do arquivo comprimido: o _Trecho o esconde.
+        corpo = _Trecho(f, inicio, fim - inicio + 1)
+    else:
+        corpo = f
+    resposta = FileResponse(corpo, as_attachment=True, filename=nome_download,
+                            status=206 if intervalo else 200)
+    return _cabecalhos(resposta, estado, etag, tamanho, intervalo, codec, codificacao)
+
+
+async def _ler_em_blocos(abrir, inicio, tamanho):
+    # Cada leitura passa rapidamente por uma thread; nenhuma fica presa ao
+    # download inteiro enquanto o cliente lento consome os blocos.
+    f = await asyncio.to_thread(abrir)
+    try:
+        await asyncio.to_thread(f.seek, inicio)
+        restante = tamanho
+        while restante > 0:
+            dados = await asyncio.to_thread(f.read, min(TAMANHO_BLOCO_DOWNLOAD, restante))
+            if not dados:
+                break
+            restante -= len(dados)
+            yield dados
+    finally:
+        f.close()
+
+
+async def aservir_arquivo(request, arquivo, nome_download=None):
+    """Versão para views assíncronas: o corpo é um iterador assíncrono, que o
+    ASGI transmite sem carregar o arquivo na memória."""
+    gravado = await sync_to_async(_codec_gravado)(arquivo) if arquivo else ('', None)
+    if not isinstance(request, ASGIRequest):
+        # Em WSGI um iterador assíncrono seria lido inteiro antes do envio.
+        return servir_arquivo(request, arquivo, nome_download, gravado)
+    resposta, envio = _planejar(request, arquivo, nome_download, gravado)
+    if resposta is not None:
+        return resposta
+    abrir, estado, tamanho, etag, nome_download, intervalo, codec, codificacao = envio
+
+    inicio, fim = intervalo or (0, tamanho - 1)
+    resposta = StreamingHttpResponse(
+        _ler_em_blocos(abrir, inicio, fim - inicio + 1),
+        status=206 if intervalo else 200,
+        content_type=mimetypes.guess_type(nome_download)[0] or 'application/octet-stream',
+    )
+    resposta['Content-Disposition'] = content_disposition_header(True, nome_download)
+    return _cabecalhos(resposta, estado, etag, tamanho, intervalo, codec, codificacao)
@@ -0,0 +1,163 @@
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils import timezone
+
+from .models import IndicadorDiario, PedidoEvento, Trava
+
+# A leitura para no primeiro evento gravado há menos que isso: uma transação
+# que ainda não terminou pode ter um id menor que o dele.
+MARGEM_INDICADORES = 60
+TAMANHO_LOTE_EVENTOS = 500
+DURACAO_TRAVA_INDICADORES = 300
+
+_TRAVA_INDICADORES = 'indicadores'
+_local = threading.local()
+
+
+def registrar_evento(pedido, anterior, novo, quando=None):
+    evento = PedidoEvento(
+        pedido_id=pedido.pk,
+        status_anterior=anterior or '',
+        status_novo=novo,
+        cadista_id=pedido.cadista_id,
+        criado_em=quando or timezone.now(),
+        pedido_criado_em=pedido.data_criacao,
+    )
+    lote = getattr(_local, 'lote', None)
+    if lote is not None:
+        lote.append(evento)
+    else:
+        evento.save()
+    return evento
+
+
+@contextmanager
+def eventos_em_lote(tamanho=TAMANHO_LOTE_EVENTOS):
+    """Acumula os eventos gerados no bloco e grava tudo com ``bulk_create`` no fim."""
+    if getattr(_local, 'lote', None) is not None:
+        yield
+        return
+    _local.lote = []
+    try:
+        yield
+        PedidoEvento.objects.bulk_create(_local.lote, batch_size=tamanho)
+    finally:
+        _local.lote = None
+
+
+@contextmanager
+def travar(nome, duracao):
+    """Trava compartilhada entre processos; produz ``False`` se outro já a tem."""
+    Trava.objects.get_or_create(nome=nome)
+    agora = timezone.now()
+    ate = agora + timedelta(seconds=duracao)
+    # UPDATE condicional: só um processo consegue trocar uma trava livre ou vencida.
+    obtida = Trava.objects.filter(Q(ate__isnull=True) | Q(ate__lt=agora), nome=nome).update(ate=ate)
+    try:
+        yield bool(obtida)
+    finally:
+        if obtida:
+            Trava.objects.filter(nome=nome, ate=ate).update(ate=None)
+
+
+def atualizar_indicadores(margem=MARGEM_INDICADORES):
+    """Soma em ``IndicadorDiario`` só os eventos posteriores ao último processado."""
+    with travar(_TRAVA_INDICADORES, DURACAO_TRAVA_INDICADORES) as obtida:
+        if not obtida:
+            return 0
+        ultimo = IndicadorDiario.objects.aggregate(m=Max('ultimo_evento'))['m'] or 0
+        limite = timezone.now() - timedelta(seconds=margem)
+        eventos = (
+            PedidoEvento.objects
+            .filter(pk__gt=ultimo)
+            .order_by('pk')
+            .values_list('pk', 'registrado_em', 'criado_em', 'status_anterior', 'status_novo', 'pedido_criado_em')
+        )
+
+        por_dia = defaultdict(Counter)
+        processados = 0
+        for pk, registrado, quando, anterior, novo, criacao in eventos.iterator(chunk_size=2000):
+            # O marcador nunca passa de um evento ainda não somado.
+            if registrado >= limite:
+                break
+            contadores = por_dia[timezone.localdate(quando)]
+            if novo == 'PENDENTE':
+                contadores['entradas_fila'] += 1
+            if anterior == 'PENDENTE':
+                contadores['saidas_fila'] += 1
+            if novo == 'RETRABALHO':
+                contadores['retrabalhos'] += 1
+            # Eventos sem status anterior vêm da carga inicial e não têm duração real.
+            if novo == 'CONCLUIDO' and anterior not in ('', 'RETRABALHO'):
+                contadores['entregas'] += 1
+                if criacao is not None:
+                    contadores['lead_time_total'] += (quando - criacao).total_seconds()
+            ultimo = pk
+            processados += 1
+
+        with transaction.atomic():
+            for dia, contadores in por_dia.items():
+                IndicadorDiario.objects.get_or_create(dia=dia)
+                IndicadorDiario.objects.filter(dia=dia).update(
+                    ultimo_evento=ultimo,
+                    **{campo: F(campo) + valor for campo, valor in contadores.items()},
+                )
+        return processados
+
+
+def _indicadores(inicio, fim):
+    atualizar_indicadores()
+    return IndicadorDiario.objects.filter(dia__gte=inicio, dia__lte=fim)
+
+
+def lead_time_medio(inicio, fim):
+    totais = _indicadores(inicio, fim).aggregate(segundos=Sum('lead_time_total'), entregas=Sum('entregas'))
+    if not totais['entregas']:
+        return None
+    return timedelta(seconds=totais['segundos'] / totais['entregas'])
+
+
+def taxa_retrabalho(inicio, fim):
+    totais = _indicadores(inicio, fim).aggregate(retrabalhos=Sum('retrabalhos'), entregas=Sum('entregas'))
+    if not totais['entregas']:
+        return None
+    return (totais['retrabalhos'] or 0) / totais['entregas']
+
+
+def profundidade_fila(inicio, fim):
+    """Pedidos PENDENTES ao fim de cada dia com movimento no intervalo."""
+    dias = _indicadores(inicio, fim).order_by('dia').values_list('dia', 'entradas_fila', 'saidas_fila')
+    anteriores = IndicadorDiario.objects.filter(dia__lt=inicio).aggregate(
+        entradas=Sum('entradas_fila'), saidas=Sum('saidas_fila'),
+    )
+    profundidade = (anteriores['entradas'] or 0) - (anteriores['saidas'] or 0)
+    serie = []
+    for dia, entradas, saidas in dias:
+        profundidade += entradas - saidas
+        serie.append((dia, profundidade))
+    return serie
+
+
+def vazao_por_cadista(inicio, fim):
+    """Entregas por cadista entre ``inicio`` e ``fim`` (datetimes)."""
+    return (
+        PedidoEvento.objects
+        .filter(status_novo='CONCLUIDO', criado_em__gte=inicio, criado_em__lt=fim, cadista__isnull=False)
+        .values('cadista', 'cadista__first_name', 'cadista__username')
+        .annotate(entregas=Count('pk'))
+        .order_by('-entregas')
+    )
+
+
+def tempo_em_status(pedido):
+    """Quanto tempo o pedido passou em cada status, pelo seu histórico de eventos."""
+    eventos = list(pedido.eventos.order_by('criado_em', 'pk').values_list('status_novo', 'criado_em'))
+    tempos = defaultdict(timedelta)
+    for (status, inicio), proximo in zip(eventos, eventos[1:] + [(None, timezone.now())]):
+        tempos[status] += proximo[1] - inicio
+    return dict(tempos)
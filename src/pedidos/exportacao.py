@@ -0,0 +1,264 @@
+import csv
+import datetime
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Pedido
+
+TAMANHO_LOTE_EXPORTACAO = 2000
+
+CABECALHO = [
+    'ID', 'Paciente', 'Dentista', 'CRO', 'Cadista', 'Serviço', 'Dentes', 'Cor',
+    'Status', 'Criado em', 'Entrega prevista',
+]
+
+_ROTULOS_STATUS = dict(Pedido.STATUS_CHOICES)
+# Texto que a planilha executaria como fórmula (nome de paciente "=HYPERLINK(...)").
+_INICIOS_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _texto_seguro(valor):
+    valor = str(valor)
+    return "'" + valor if valor.startswith(_INICIOS_FORMULA) else valor
+
+
+def _consulta(queryset):
+    # named=True: o iterador de tuplas simples executa o SELECT já ao ser
+    # criado, o que aiterator() não admite em contexto assíncrono.
+    return queryset.values_list(
+        'id', 'nome_paciente', 'dentista__first_name', 'dentista__last_name', 'dentista__username',
+        'dentista__cro', 'cadista__first_name', 'cadista__username', 'tipo_servico', 'dentes', 'cor',
+        'status', 'data_criacao', 'data_entrega_prevista', named=True,
+    )
+
+
+def _formatar(registro):
+    (pk, paciente, nome, sobrenome, usuario, cro, cadista_nome, cadista_usuario,
+     servico, dentes, cor, status, criado, entrega) = registro
+    return (
+        pk,
+        paciente,
+        f'{nome} {sobrenome}'.strip() or usuario,
+        cro or '',
+        cadista_nome or cadista_usuario or '',
+        servico,
+        dentes,
+        cor or '',
+        _ROTULOS_STATUS.get(status, status),
+        timezone.localtime(criado).replace(tzinfo=None) if criado else None,
+        entrega,
+    )
+
+
+def linhas_pedidos(queryset):
+    """Uma tupla por pedido, com os nomes vindos do mesmo SELECT (JOIN)."""
+    for registro in _consulta(queryset).iterator(chunk_size=TAMANHO_LOTE_EXPORTACAO):
+        yield _formatar(registro)
+
+
+async def alinhas_pedidos(queryset):
+    async for registro in _consulta(queryset).aiterator(chunk_size=TAMANHO_LOTE_EXPORTACAO):
+        yield _formatar(registro)
+
+
+class _Eco:
+    """Arquivo que devolve o que recebe, para o csv.writer alimentar o gerador."""
+
+    def write(self, valor):
+        return valor
+
+
+class _Csv:
+    def __init__(self):
+        self.escritor = csv.writer(_Eco(), delimiter=';')
+
+    def inicio(self):
+        # BOM para o Excel reconhecer UTF-8; ';' é o separador que ele espera em pt-BR.
+        return '\ufeff' + self.escritor.writerow(CABECALHO)
+
+    def linha(self, linha):
+        return self.escritor.writerow([
+            valor.strftime('%d/%m/%Y %H:%M') if isinstance(valor, datetime.datetime)
+            else valor.strftime('%d/%m/%Y') if isinstance(valor, datetime.date)
+            else _texto_seguro(valor) if isinstance(valor, str)
+            else valor
+            for valor in linha
+        ])
+
+    def fim(self):
+        return ''
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Pedidos" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+# Estilos: 0 = padrão, 1 = data (formato 14), 2 = data e hora (formato 22).
+_ESTILOS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '</styleSheet>'
+)
+_INICIO_PLANILHA = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_FIM_PLANILHA = '</sheetData></worksheet>'
+
+_EPOCA_EXCEL = datetime.datetime(1899, 12, 30)
+# Caracteres de controle que o XML 1.0 não aceita nem escapados; um só deles
+# (colado no formulário, por exemplo) faz o Excel recusar a planilha inteira.
+_CONTROLE_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _celula(valor):
+    if valor is None or valor == '':
+        return '<c/>'
+    if isinstance(valor, datetime.datetime):
+        serial = (valor - _EPOCA_EXCEL).total_seconds() / 86400
+        return f'<c s="2"><v>{serial:.6f}</v></c>'
+    if isinstance(valor, datetime.date):
+        return f'<c s="1"><v>{(valor - _EPOCA_EXCEL.date()).days}</v></c>'
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f'<c><v>{valor}</v></c>'
+    texto = _texto_seguro(_CONTROLE_XML.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(texto)}</t></is></c>'
+
+
+def _linha_xml(linha):
+    return '<row>' + ''.join(_celula(valor) for valor in linha) + '</row>'
+
+
+class _Saida:
+    """Destino do ZipFile sem ``seek``: o zip grava descritores de dados e
+    o gerador entrega os bytes à medida que saem do compressor."""
+
+    def __init__(self):
+        self.partes = []
+        self.posicao = 0
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        self.posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self.posicao
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        dados = b''.join(self.partes)
+        self.partes.clear()
+        return dados
+
+
+class _Xlsx:
+    def __init__(self):
+        self.saida = _Saida()
+        self.linhas = 0
+
+    def inicio(self):
+        self.pacote = zipfile.ZipFile(self.saida, 'w', zipfile.ZIP_DEFLATED)
+        self.pacote.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        self.pacote.writestr('_rels/.rels', _RELS)
+        self.pacote.writestr('xl/workbook.xml', _WORKBOOK)
+        self.pacote.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        self.pacote.writestr('xl/styles.xml', _ESTILOS)
+        self.planilha = self.pacote.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True)
+        self.planilha.write((_INICIO_PLANILHA + _linha_xml(CABECALHO)).encode())
+        return self.saida.retirar()
+
+    def linha(self, linha):
+        self.planilha.write(_linha_xml(linha).encode())
+        self.linhas += 1
+        return self.saida.retirar() if self.linhas % 500 == 0 else b''
+
+    def fim(self):
+        self.planilha.write(_FIM_PLANILHA.encode())
+        self.planilha.close()
+        self.pacote.close()
+        return self.saida.retirar()
+
+
+def _gerar(formato, linhas):
+    arquivo = formato()
+    yield arquivo.inicio()
+    for linha in linhas:
+        dados = arquivo.linha(linha)
+        if dados:
+            yield dados
+    yield arquivo.fim()
+
+
+async def _agerar(formato, linhas):
+    arquivo = formato()
+    yield arquivo.inicio()
+    async for linha in linhas:
+        dados = arquivo.linha(linha)
+        if dados:
+            yield dados
+    yield arquivo.fim()
+
+
+def resposta_exportacao(queryset, formato, assincrona=False):
+    """``assincrona`` para servidores ASGI: o corpo vira um iterador assíncrono,
+    que não prende uma thread nem é acumulado na memória."""
+    if formato == 'xlsx':
+        gerador, tipo = _Xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        gerador, tipo = _Csv, 'text/csv; charset=utf-8'
+    if assincrona:
+        conteudo = _agerar(gerador, alinhas_pedidos(queryset))
+    else:
+        conteudo = _gerar(gerador, linhas_pedidos(queryset))
+
+    resposta = StreamingHttpResponse(conteudo, content_type=tipo)
+    nome = f'pedidos-{timezone.localdate().isoformat()}.{formato}'
+    resposta['Content-Disposition'] = f'attachment; filename="{nome}"'
+    return resposta
@@ -0,0 +1,133 @@
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Tarefa
+
+VISIBILIDADE_PADRAO = 300
+ATRASO_BASE = 10
+ATRASO_MAXIMO = 3600
+
+_registro = {}
+
+
+def tarefa(nome=None, prioridade=0, max_tentativas=5):
+    """Registra a função como tarefa da fila. Os argumentos precisam ser JSON."""
+    def registrar(funcao):
+        funcao.nome_tarefa = nome or f'{funcao.__module__}.{funcao.__name__}'
+        funcao.prioridade = prioridade
+        funcao.max_tentativas = max_tentativas
+        _registro[funcao.nome_tarefa] = funcao
+        return funcao
+    return registrar
+
+
+def enfileirar(funcao, prioridade=None, atraso=0, **argumentos):
+    """Grava a tarefa na mesma transação de quem chama: se ela for desfeita, a tarefa some junto."""
+    return Tarefa.objects.create(
+        nome=funcao.nome_tarefa,
+        argumentos=argumentos,
+        prioridade=funcao.prioridade if prioridade is None else prioridade,
+        max_tentativas=funcao.max_tentativas,
+        executar_em=timezone.now() + timedelta(seconds=atraso),
+    )
+
+
+def nome_worker():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def atraso_retentativa(tentativas):
+    atraso = min(ATRASO_BASE * 2 ** (tentativas - 1), ATRASO_MAXIMO)
+    return atraso + random.uniform(0, atraso / 10)
+
+
+def devolver_expiradas():
+    """Tarefas cujo worker sumiu sem concluir voltam para a fila (ou falham, se esgotaram as tentativas)."""
+    agora = timezone.now()
+    expiradas = Tarefa.objects.filter(status='EXECUTANDO', reservada_ate__lt=agora)
+    esgotadas = expiradas.filter(tentativas__gte=F('max_tentativas')).update(
+        status='FALHOU', ultimo_erro="Tempo de visibilidade expirou.", reservada_ate=None,
+    )
+    devolvidas = expiradas.update(status='PENDENTE', executar_em=agora, reservada_ate=None, worker='')
+    return devolvidas + esgotadas
+
+
+def reservar(worker, limite, visibilidade=VISIBILIDADE_PADRAO):
+    agora = timezone.now()
+    ids = list(
+        Tarefa.objects.filter(status='PENDENTE', executar_em__lte=agora)
+        .order_by('-prioridade', 'executar_em', 'pk')
+        .values_list('pk', flat=True)[:limite]
+    )
+    # Como em analise.reservar_pendentes: só um worker consegue mudar o status.
+    reservadas = [
+        pk for pk in ids
+        if Tarefa.objects.filter(pk=pk, status='PENDENTE').update(
+            status='EXECUTANDO',
+            worker=worker,
+            reservada_ate=agora + timedelta(seconds=visibilidade),
+            tentativas=F('tentativas') + 1,
+        )
+    ]
+    return list(Tarefa.objects.filter(pk__in=reservadas).order_by('-prioridade', 'executar_em', 'pk'))
+
+
+def executar(tarefa_reservada):
+    # A conclusão só vale se a reserva ainda for deste worker.
+    reserva = Tarefa.objects.filter(pk=tarefa_reservada.pk, status='EXECUTANDO', worker=tarefa_reservada.worker)
+
+    funcao = _registro.get(tarefa_reservada.nome)
+    if funcao is None:
+        reserva.update(status='FALHOU', ultimo_erro=f"Tarefa desconhecida: {tarefa_reservada.nome}.",
+                       reservada_ate=None)
+        return False
+
+    try:
+        funcao(**tarefa_reservada.argumentos)
+    except Exception:
+        erro = traceback.format_exc()[-4000:]
+        if tarefa_reservada.tentativas >= tarefa_reservada.max_tentativas:
+            reserva.update(status='FALHOU', ultimo_erro=erro, reservada_ate=None)
+        else:
+            reserva.update(
+                status='PENDENTE',
+                ultimo_erro=erro,
+                reservada_ate=None,
+                worker='',
+                executar_em=timezone.now() + timedelta(seconds=atraso_retentativa(tarefa_reservada.tentativas)),
+            )
+        return False
+
+    reserva.update(status='CONCLUIDA', reservada_ate=None, concluida_em=timezone.now())
+    return True
+
+
+def processar(worker=None, limite=10, visibilidade=VISIBILIDADE_PADRAO):
+    worker = worker or nome_worker()
+    devolver_expiradas()
+    tarefas = reservar(worker, limite, visibilidade)
+    for item in tarefas:
+        executar(item)
+    return len(tarefas)
+
+
+def limpar_concluidas(dias):
+    limite = timezone.now() - timedelta(days=dias)
+    return Tarefa.objects.filter(status='CONCLUIDA', concluida_em__lt=limite).delete()[0]
+
+
+def laco_worker(limite=10, intervalo=1.0, visibilidade=VISIBILIDADE_PADRAO, uma_vez=False):
+    worker = nome_worker()
+    while True:
+        processadas = processar(worker, limite, visibilidade)
+        if not processadas:
+            if uma_vez:
+                return
+            time.sleep(intervalo)
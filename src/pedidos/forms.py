@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from .models import Usuario, Pedido, Anexo
+from .odontograma import OdontogramaInvalido, interpretar_elementos, serializar_elementos
 
 class CadastroForm(UserCreationForm):
     cro = forms.CharField(
@@ -53,6 +54,16 @@ class PedidoForm(forms.ModelForm):
             if field_name != 'sexo':
                 field.widget.attrs['class'] = 'form-control'
 
+    def clean_elementos(self):
+        try:
+            mapa = interpretar_elementos(self.cleaned_data.get('elementos'))
+        except OdontogramaInvalido as erro:
+            raise forms.ValidationError(str(erro))
+
+        if mapa:
+            self.instance.dentes = ", ".join(str(dente) for dente in sorted(mapa))
+        return serializar_elementos(mapa)
+
 class AnexoForm(forms.ModelForm):
     class Meta:
         model = Anexo
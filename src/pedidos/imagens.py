@@ -0,0 +1,199 @@
+"""Miniaturas e versões para a web das fotos anexadas, geradas sob demanda.
+
+Cada rendição fica em ``RENDICOES_DIR``, com a chave derivada do SHA-256 do
+original (ou do nome, tamanho e data quando o storage não registra o hash),
+o lado máximo e o formato. O diretório é limitado a ``RENDICOES_LIMITE_BYTES``:
+passando disso, as menos usadas recentemente são apagadas.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import ArquivoArmazenado
+
+EXTENSOES_IMAGEM = ('.jpg', '.jpeg', '.png', '.webp', '.tif', '.tiff', '.bmp')
+TAMANHOS = {'miniatura': 320, 'web': 1600}
+QUALIDADE = {'WEBP': 80, 'JPEG': 82}
+FRACAO_APOS_LIMPEZA = 0.8
+# Uso registrado no mtime, no máximo uma vez por hora por rendição.
+INTERVALO_TOQUE = 3600
+
+
+def eh_imagem(nome):
+    return bool(nome) and nome.lower().endswith(EXTENSOES_IMAGEM)
+
+
+def _chave(arquivo):
+    sha = ArquivoArmazenado.objects.filter(nome=arquivo.name).values_list('sha256', flat=True).first()
+    if sha:
+        return sha
+    try:
+        estado = os.stat(arquivo.path)
+    except (FileNotFoundError, NotImplementedError):
+        raise Http404("Arquivo não encontrado.")
+    return hashlib.sha256(f'{arquivo.name}:{estado.st_size}:{estado.st_mtime_ns}'.encode()).hexdigest()
+
+
+class ImagemInvalida(Exception):
+    pass
+
+
+def _reduzir(origem, lado, formato):
+    try:
+        with Image.open(origem) as imagem:
+            # Em JPEG decodifica já reduzido (1/2, 1/4 ou 1/8), o que é bem mais rápido.
+            imagem.draft('RGB', (lado, lado))
+            imagem = ImageOps.exif_transpose(imagem)
+            imagem.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+    except (UnidentifiedImageError, Image.DecompressionBombError, SyntaxError, ValueError) as erro:
+        raise ImagemInvalida(erro)
+    except OSError as erro:
+        # O Pillow acusa arquivo truncado ou corrompido com OSError sem errno;
+        # os erros de disco (permissão, E/S) têm errno e seguem adiante.
+        if erro.errno is not None:
+            raise
+        raise ImagemInvalida(erro)
+    if imagem.mode not in ('RGB', 'RGBA'):
+        imagem = imagem.convert('RGBA' if imagem.has_transparency_data else 'RGB')
+    if formato == 'JPEG' and imagem.mode == 'RGBA':
+        fundo = Image.new('RGB', imagem.size, 'white')
+        fundo.paste(imagem, mask=imagem.getchannel('A'))
+        imagem = fundo
+    return imagem
+
+
+def _gerar(origem, destino, lado, formato):
+    imagem = _reduzir(origem, lado, formato)
+    pasta = os.path.dirname(destino)
+    os.makedirs(pasta, exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=pasta, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            imagem.save(f, formato, quality=QUALIDADE[formato], optimize=formato == 'JPEG')
+        os.replace(temporario, destino)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+    return os.path.getsize(destino)
+
+
+class CacheRendicoes:
+    def __init__(self, pasta=None, limite=None):
+        self._pasta = pasta
+        self._limite = limite
+        self._trava = threading.Lock()
+        self._ocupado = None
+
+    @property
+    def pasta(self):
+        return self._pasta or settings.RENDICOES_DIR
+
+    @property
+    def limite(self):
+        return self._limite if self._limite is not None else settings.RENDICOES_LIMITE_BYTES
+
+    def caminho(self, chave, lado, formato):
+        return os.path.join(self.pasta, chave[:2], f'{chave}-{lado}.{formato.lower()}')
+
+    def obter(self, arquivo, lado, formato):
+        """Caminho da rendição de ``arquivo``, gerando-a se ainda não existir."""
+        destino = self.caminho(_chave(arquivo), lado, formato)
+        try:
+            estado = os.stat(destino)
+            agora = time.time()
+            if agora - estado.st_mtime > INTERVALO_TOQUE:
+                os.utime(destino, (agora, agora))
+            return destino
+        except FileNotFoundError:
+            pass
+
+        try:
+            origem = arquivo.path
+        except NotImplementedError:
+            raise Http404("Arquivo não encontrado.")
+        try:
+            tamanho = _gerar(origem, destino, lado, formato)
+        except FileNotFoundError:
+            raise Http404("Arquivo não encontrado.")
+        except ImagemInvalida:
+            raise Http404("O anexo não é uma imagem válida.")
+        self._registrar(tamanho)
+        return destino
+
+    def _registrar(self, tamanho):
+        with self._trava:
+            if self._ocupado is None:
+                self._ocupado = self._medir()
+            self._ocupado += tamanho
+            if self._ocupado > self.limite:
+                self._ocupado = self.limpar(int(self.limite * FRACAO_APOS_LIMPEZA))
+
+    def _arquivos(self):
+        pendentes = [self.pasta]
+        while pendentes:
+            try:
+                entradas = os.scandir(pendentes.pop())
+            except FileNotFoundError:
+                continue
+            with entradas:
+                for entrada in entradas:
+                    if entrada.is_dir(follow_symlinks=False):
+                        pendentes.append(entrada.path)
+                    elif entrada.is_file(follow_symlinks=False):
+                        yield entrada.path, entrada.stat(follow_symlinks=False)
+
+    def _medir(self):
+        return sum(estado.st_size for _, estado in self._arquivos())
+
+    def limpar(self, alvo):
+        """Apaga as rendições usadas há mais tempo até o total caber em ``alvo``."""
+        # Cada processo tem a sua estimativa; a varredura refaz a conta real.
+        arquivos = sorted(self._arquivos(), key=lambda item: item[1].st_mtime)
+        total = sum(estado.st_size for _, estado in arquivos)
+        for caminho, estado in arquivos:
+            if total <= alvo:
+                break
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+            total -= estado.st_size
+        return total
+
+
+cache_rendicoes = CacheRendicoes()
+
+
+def _ler(caminho):
+    # Rendições são pequenas: lidas de uma vez, sem iterador de arquivo.
+    with open(caminho, 'rb') as f:
+        return f.read()
+
+
+def responder_rendicao(request, arquivo, tamanho):
+    lado = TAMANHOS.get(tamanho)
+    if lado is None or not arquivo or not eh_imagem(arquivo.name):
+        raise Http404("Rendição não disponível.")
+    formato = 'WEBP' if 'image/webp' in request.headers.get('Accept', '') else 'JPEG'
+    caminho = cache_rendicoes.obter(arquivo, lado, formato)
+
+    etag = f'"{os.path.basename(caminho)}"'
+    resposta = get_conditional_response(request, etag=etag)
+    if resposta is None:
+        try:
+            conteudo = _ler(caminho)
+        except FileNotFoundError:
+            # A limpeza de outro processo apagou a rendição depois do obter().
+            conteudo = _ler(cache_rendicoes.obter(arquivo, lado, formato))
+        resposta = HttpResponse(conteudo, content_type=f'image/{formato.lower()}')
+    resposta['ETag'] = etag
+    resposta['Cache-Control'] = 'private, max-age=86400'
+    patch_vary_headers(resposta, ['Accept'])
+    return resposta
@@ -0,0 +1,209 @@
+import csv
+import io
+import itertools
+import json
+import re
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower, Upper
+
+from .busca import indexar_pedidos
+from .eventos import eventos_em_lote, registrar_evento
+from .forms import PedidoForm
+from .kpis import invalidar_kpis
+from .models import ElementoPedido, Pedido, Usuario
+from .odontograma import OdontogramaInvalido, interpretar_elementos, serializar_elementos
+from .transmissao import publicar_pedidos_novos
+
+TAMANHO_LOTE_IMPORTACAO = 1000
+
+# Aceita também os cabeçalhos da exportação (exportacao.CABECALHO).
+_APELIDOS = {
+    'paciente': 'nome_paciente',
+    'serviço': 'tipo_servico',
+    'servico': 'tipo_servico',
+    'cro': 'dentista_cro',
+    'email': 'dentista_email',
+    'e-mail': 'dentista_email',
+    'entrega prevista': 'data_entrega_prevista',
+    'observações': 'observacoes',
+}
+_DATA_BR = re.compile(r'^(\d{2})/(\d{2})/(\d{4})$')
+_STATUS_VALIDOS = dict(Pedido.STATUS_CHOICES)
+
+
+class ResultadoImportacao:
+    def __init__(self):
+        self.importados = 0
+        self.erros = []
+
+    def erro(self, linha, mensagem):
+        self.erros.append((linha, mensagem))
+
+
+def _linhas_csv(texto, primeira):
+    separador = ';' if primeira.count(';') > primeira.count(',') else ','
+    leitor = csv.reader(itertools.chain([primeira], texto), delimiter=separador)
+    cabecalho = next(leitor, [])
+    anterior = leitor.line_num
+    for campos in leitor:
+        # Número da linha na planilha (o cabeçalho é a 1); um campo entre aspas
+        # pode ocupar várias linhas, então conta a partir do fim do registro anterior.
+        numero, anterior = anterior + 1, leitor.line_num
+        if campos:
+            yield numero, dict(zip(cabecalho, campos))
+
+
+def ler_linhas(arquivo, formato=None):
+    """Lê CSV (``,`` ou ``;``) ou JSON (lista de objetos) e devolve ``(número da linha, dicionário)``.
+
+    O CSV é lido registro a registro, sem carregar o arquivo inteiro.
+    """
+    if isinstance(arquivo.read(0), bytes):
+        texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    else:
+        texto = arquivo
+    try:
+        primeira = texto.readline()
+        formato = formato or ('json' if primeira.lstrip().startswith('[') else 'csv')
+
+        if formato == 'json':
+            dados = json.loads(primeira + texto.read())
+            if not isinstance(dados, list):
+                raise ValueError("O JSON deve ser uma lista de pedidos.")
+            linhas = enumerate(dados, start=1)
+        else:
+            linhas = _linhas_csv(texto, primeira)
+
+        for numero, linha in linhas:
+            yield numero, {
+                _APELIDOS.get(chave.strip().lower(), chave.strip().lower()): valor
+                for chave, valor in (linha.items() if isinstance(linha, dict) else [])
+                if chave
+            }
+    finally:
+        if texto is not arquivo:
+            # Sem isso o wrapper fecharia o arquivo de quem chamou.
+            texto.detach()
+
+
+def _mapa_dentistas(linhas):
+    cros = {str(linha.get('dentista_cro') or '').strip().upper() for linha in linhas} - {''}
+    emails = {str(linha.get('dentista_email') or '').strip().lower() for linha in linhas} - {''}
+    por_cro, por_email = {}, {}
+    if not cros and not emails:
+        return por_cro, por_email
+
+    # Uma única consulta para o arquivo inteiro.
+    dentistas = (
+        Usuario.objects.filter(tipo_usuario='DENTISTA')
+        .annotate(cro_normalizado=Upper('cro'), email_normalizado=Lower('email'))
+        .filter(Q(cro_normalizado__in=cros) | Q(email_normalizado__in=emails))
+        .values_list('id', 'cro_normalizado', 'email_normalizado')
+    )
+    for pk, cro, email in dentistas:
+        if cro:
+            por_cro.setdefault(cro.strip(), pk)
+        if email:
+            por_email.setdefault(email, pk)
+    return por_cro, por_email
+
+
+def _dados_formulario(linha):
+    dados = {campo: linha.get(campo) for campo in PedidoForm.base_fields}
+    elementos = dados.get('elementos')
+    if isinstance(elementos, dict):
+        dados['elementos'] = json.dumps(elementos)
+    data = str(dados.get('data_entrega_prevista') or '').strip()
+    m = _DATA_BR.match(data)
+    if m:
+        dados['data_entrega_prevista'] = f'{m.group(3)}-{m.group(2)}-{m.group(1)}'
+    if not dados.get('sexo'):
+        dados['sexo'] = 'M'
+    return dados
+
+
+def validar_linha(linha, por_cro, por_email):
+    """Devolve ``(pedido, mapa_elementos)`` ou levanta ``ValueError`` com a mensagem da linha."""
+    cro = str(linha.get('dentista_cro') or '').strip().upper()
+    email = str(linha.get('dentista_email') or '').strip().lower()
+    dentista_id = por_cro.get(cro) if cro else None
+    if dentista_id is None and email:
+        dentista_id = por_email.get(email)
+    if dentista_id is None:
+        if not cro and not email:
+            raise ValueError("Informe o CRO ou o e-mail do dentista.")
+        raise ValueError(f"Dentista não encontrado (CRO {cro or '-'}, e-mail {email or '-'}).")
+
+    dados = _dados_formulario(linha)
+    limpos, erros = {}, []
+    # Os campos de PedidoForm são usados direto: instanciar um form por linha
+    # (cópia profunda de todos os campos) dominava o tempo da importação.
+    for nome, campo in PedidoForm.base_fields.items():
+        try:
+            limpos[nome] = campo.clean(campo.widget.value_from_datadict(dados, {}, nome))
+        except ValidationError as erro:
+            erros.append(f"{nome}: {' '.join(erro.messages)}")
+    if erros:
+        raise ValueError("; ".join(erros))
+    try:
+        mapa = interpretar_elementos(limpos['elementos'])
+    except OdontogramaInvalido as erro:
+        raise ValueError(f"elementos: {erro}")
+
+    limpos['elementos'] = serializar_elementos(mapa)
+    pedido = Pedido(dentista_id=dentista_id, **limpos)
+    if mapa:
+        pedido.dentes = ", ".join(str(dente) for dente in sorted(mapa))
+    else:
+        pedido.dentes = str(linha.get('dentes') or '')[:100]
+    status = str(linha.get('status') or '').strip().upper()
+    if status:
+        if status not in _STATUS_VALIDOS:
+            raise ValueError(f"Status inválido: {status}.")
+        pedido.status = status
+    return pedido, mapa
+
+
+def _gravar_lote(lote):
+    pedidos = [pedido for pedido, _ in lote]
+    with transaction.atomic():
+        # bulk_create não dispara post_save: busca, odontograma, eventos, KPIs e transmissão são feitos aqui.
+        Pedido.objects.bulk_create(pedidos)
+        ElementoPedido.objects.bulk_create([
+            ElementoPedido(pedido=pedido, dente=dente, procedimento=procedimento)
+            for pedido, mapa in lote
+            for dente, procedimento in mapa.items()
+        ])
+        indexar_pedidos(pedidos)
+        with eventos_em_lote():
+            for pedido in pedidos:
+                registrar_evento(pedido, '', pedido.status)
+        publicar_pedidos_novos(pedidos)
+        por_dentista = {pedido.dentista_id: pedido for pedido in pedidos}
+        transaction.on_commit(lambda: [invalidar_kpis(pedido) for pedido in por_dentista.values()])
+
+
+def importar_pedidos(linhas, tamanho_lote=TAMANHO_LOTE_IMPORTACAO, simular=False):
+    """Valida cada linha e grava as válidas em lotes; erros ficam por número de linha.
+
+    ``linhas`` são pares ``(número, dicionário)`` como os de :func:`ler_linhas`,
+    consumidos um bloco de ``tamanho_lote`` por vez.
+    """
+    resultado = ResultadoImportacao()
+    linhas = iter(linhas)
+    while bloco := list(itertools.islice(linhas, tamanho_lote)):
+        por_cro, por_email = _mapa_dentistas([linha for _, linha in bloco])
+        lote = []
+        for numero, linha in bloco:
+            try:
+                lote.append(validar_linha(linha, por_cro, por_email))
+            except ValueError as erro:
+                resultado.erro(numero, str(erro))
+        if lote:
+            if not simular:
+                _gravar_lote(lote)
+            resultado.importados += len(lote)
+    return resultado
@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .models import Pedido
+
+TEMPO_CACHE_KPIS = 300
+
+_CHAVE_GERACAO_CADISTAS = 'kpis:geracao_cadistas'
+
+
+def _contagens():
+    # Uma única agregação condicional em vez de um COUNT por status.
+    return {
+        codigo: Count('pk', filter=Q(status=codigo))
+        for codigo, _ in Pedido.STATUS_CHOICES
+    }
+
+
+def _chave(papel, usuario, geracao=None):
+    if papel == 'gestor':
+        return 'kpis:gestor'
+    if papel == 'cadista':
+        # A fila de um cadista inclui todos os PENDENTES, então qualquer
+        # alteração invalida todos os cadistas de uma vez via geração.
+        if geracao is None:
+            geracao = cache.get_or_set(_CHAVE_GERACAO_CADISTAS, 1, None)
+        return f'kpis:cadista:{geracao}:{usuario.pk}'
+    return f'kpis:dentista:{usuario.pk}'
+
+
+async def akpis_do_usuario(papel, usuario, queryset):
+    geracao = None
+    if papel == 'cadista':
+        geracao = await cache.aget_or_set(_CHAVE_GERACAO_CADISTAS, 1, None)
+    chave = _chave(papel, usuario, geracao)
+    kpis = await cache.aget(chave)
+    if kpis is None:
+        agregados = await queryset.aaggregate(**_contagens())
+        kpis = {codigo: total or 0 for codigo, total in agregados.items()}
+        await cache.aset(chave, kpis, TEMPO_CACHE_KPIS)
+    return kpis
+
+
+def invalidar_kpis(pedido):
+    cache.delete_many(['kpis:gestor', f'kpis:dentista:{pedido.dentista_id}'])
+    try:
+        cache.incr(_CHAVE_GERACAO_CADISTAS)
+    except ValueError:
+        cache.set(_CHAVE_GERACAO_CADISTAS, 1, None)
@@ -0,0 +1,350 @@
+import os
+import re
+
+import numpy as np
+
+# Leitura e análise de malhas STL/PLY. As funções daqui rodam nos processos
+# do pool de análise e não tocam no banco: recebem caminhos e devolvem dicts.
+
+TRIANGULOS_PREVIA = 20_000
+
+_DTYPE_STL_BINARIO = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('atributo', '<u2'),
+])
+
+_VERTEX_ASCII = re.compile(rb'vertex\s+([^\n]*)')
+_ESPACOS = np.frombuffer(b' \t\r\n', dtype=np.uint8)
+# Faces binárias de tamanhos variados são lidas em trechos; a janela dobra
+# enquanto os polígonos seguem do mesmo tamanho.
+JANELA_FACES = 64
+
+_TIPOS_PLY = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8',
+}
+
+
+class MalhaInvalida(Exception):
+    pass
+
+
+def _stl_binario(caminho, tamanho):
+    if tamanho < 84:
+        return None
+    with open(caminho, 'rb') as f:
+        f.seek(80)
+        quantidade = int.from_bytes(f.read(4), 'little')
+    if 84 + quantidade * _DTYPE_STL_BINARIO.itemsize != tamanho:
+        return None
+    if quantidade == 0:
+        raise MalhaInvalida("STL sem triângulos.")
+    registros = np.memmap(caminho, dtype=_DTYPE_STL_BINARIO, mode='r', offset=84, shape=(quantidade,))
+    return registros['vertices']
+
+
+def _stl_ascii(caminho):
+    import mmap
+
+    with open(caminho, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+        # Só as linhas de vértice, juntas num texto que o NumPy converte de uma vez.
+        numeros = b' '.join(_VERTEX_ASCII.findall(mapa))
+    coordenadas = np.fromstring(numeros, dtype=np.float64, sep=' ')
+    if coordenadas.size == 0 or coordenadas.size % 9:
+        raise MalhaInvalida("STL ASCII sem triângulos completos.")
+    return coordenadas.reshape(-1, 3, 3)
+
+
+def ler_stl(caminho):
+    tamanho = os.path.getsize(caminho)
+    triangulos = _stl_binario(caminho, tamanho)
+    if triangulos is None:
+        with open(caminho, 'rb') as f:
+            if not f.read(5).lower().startswith(b'solid'):
+                raise MalhaInvalida("Arquivo não é um STL válido.")
+        triangulos = _stl_ascii(caminho)
+    return _indexar(triangulos)
+
+
+def _cabecalho_ply(f):
+    if f.readline().strip() != b'ply':
+        raise MalhaInvalida("Arquivo não é um PLY válido.")
+    formato = None
+    elementos = []
+    while True:
+        linha = f.readline()
+        if not linha:
+            raise MalhaInvalida("Cabeçalho PLY sem end_header.")
+        partes = linha.decode('ascii', 'replace').split()
+        if not partes or partes[0] in ('comment', 'obj_info'):
+            continue
+        if partes[0] == 'format':
+            formato = partes[1]
+        elif partes[0] == 'element':
+            elementos.append({'nome': partes[1], 'quantidade': int(partes[2]), 'propriedades': []})
+        elif partes[0] == 'property':
+            if partes[1] == 'list':
+                elementos[-1]['propriedades'].append((partes[4], 'list', partes[2], partes[3]))
+            else:
+                elementos[-1]['propriedades'].append((partes[2], partes[1]))
+        elif partes[0] == 'end_header':
+            return formato, elementos, f.tell()
+
+
+def _dtype_simples(propriedades, ordem):
+    campos = []
+    for propriedade in propriedades:
+        if propriedade[1] == 'list':
+            return None
+        campos.append((propriedade[0], ordem + _TIPOS_PLY[propriedade[1]]))
+    return np.dtype(campos)
+
+
+def ler_ply(caminho):
+    with open(caminho, 'rb') as f:
+        formato, elementos, inicio = _cabecalho_ply(f)
+
+    vertice = next((e for e in elementos if e['nome'] == 'vertex'), None)
+    face = next((e for e in elementos if e['nome'] == 'face'), None)
+    if vertice is None or face is None or not face['quantidade']:
+        raise MalhaInvalida("PLY sem vértices ou faces.")
+    if elementos.index(vertice) > elementos.index(face):
+        raise MalhaInvalida("PLY com faces antes dos vértices não é suportado.")
+
+    if formato == 'ascii':
+        return _ply_ascii(caminho, inicio, vertice, face)
+    if formato not in ('binary_little_endian', 'binary_big_endian'):
+        raise MalhaInvalida(f"Formato PLY desconhecido: {formato}")
+    ordem = '<' if formato == 'binary_little_endian' else '>'
+
+    offset = inicio
+    for elemento in elementos[:elementos.index(vertice)]:
+        dtype = _dtype_simples(elemento['propriedades'], ordem)
+        if dtype is None:
+            raise MalhaInvalida("Elemento PLY com listas antes dos vértices não é suportado.")
+        offset += dtype.itemsize * elemento['quantidade']
+
+    dtype_vertice = _dtype_simples(vertice['propriedades'], ordem)
+    if dtype_vertice is None:
+        raise MalhaInvalida("Vértices PLY com listas não são suportados.")
+    vertices_brutos = np.memmap(caminho, dtype=dtype_vertice, mode='r', offset=offset, shape=(vertice['quantidade'],))
+    vertices = np.column_stack([vertices_brutos[c] for c in ('x', 'y', 'z')]).astype(np.float64)
+    offset += dtype_vertice.itemsize * vertice['quantidade']
+
+    for elemento in elementos[elementos.index(vertice) + 1:elementos.index(face)]:
+        dtype = _dtype_simples(elemento['propriedades'], ordem)
+        if dtype is None:
+            raise MalhaInvalida("Elemento PLY com listas entre vértices e faces não é suportado.")
+        offset += dtype.itemsize * elemento['quantidade']
+
+    lista = next((p for p in face['propriedades'] if p[1] == 'list'), None)
+    if lista is None or len(face['propriedades']) != 1:
+        raise MalhaInvalida("Faces PLY devem ter uma única lista de índices.")
+    tipo_contagem, tipo_indice = ordem + _TIPOS_PLY[lista[2]], ordem + _TIPOS_PLY[lista[3]]
+
+    # Caso comum (só triângulos): as faces têm tamanho fixo e são mapeadas direto.
+    dtype_triangulo = np.dtype([('n', tipo_contagem), ('i', tipo_indice, (3,))])
+    tamanho = os.path.getsize(caminho)
+    if offset + dtype_triangulo.itemsize * face['quantidade'] <= tamanho:
+        faces = np.memmap(caminho, dtype=dtype_triangulo, mode='r', offset=offset, shape=(face['quantidade'],))
+        if np.all(faces['n'] == 3):
+            return vertices, np.asarray(faces['i'], dtype=np.int64)
+
+    return vertices, _faces_ply_variaveis(caminho, offset, face['quantidade'], tipo_contagem, tipo_indice)
+
+
+def _leque(poligonos):
+    """Triangulação em leque de ``m`` polígonos de ``n`` lados: ``(m * (n - 2), 3)``."""
+    quantidade, lados = poligonos.shape
+    if lados < 3:
+        return np.empty((0, 3), dtype=np.int64)
+    k = np.arange(1, lados - 1)
+    triangulos = np.empty((quantidade, lados - 2, 3), dtype=np.int64)
+    triangulos[:, :, 0] = poligonos[:, :1]
+    triangulos[:, :, 1] = poligonos[:, k]
+    triangulos[:, :, 2] = poligonos[:, k + 1]
+    return triangulos.reshape(-1, 3)
+
+
+def _faces_ply_variaveis(caminho, offset, quantidade, tipo_contagem, tipo_indice):
+    # O início de cada face depende das contagens anteriores. Cada trecho supõe
+    # o tamanho da primeira face, vale até a primeira contagem diferente e é
+    # triangulado de uma vez.
+    bruto = np.memmap(caminho, dtype=np.uint8, mode='r', offset=offset)
+    dtype_contagem = np.dtype(tipo_contagem)
+    blocos = []
+    posicao = lidas = 0
+    janela = JANELA_FACES
+    while lidas < quantidade:
+        n = int(np.frombuffer(bruto, dtype_contagem, 1, posicao)[0])
+        dtype_face = np.dtype([('n', dtype_contagem), ('i', tipo_indice, (n,))])
+        maximo = min(janela, quantidade - lidas, (len(bruto) - posicao) // dtype_face.itemsize)
+        if maximo < 1:
+            raise MalhaInvalida("Faces PLY incompletas.")
+        faces = np.frombuffer(bruto, dtype_face, maximo, posicao)
+        diferentes = np.flatnonzero(faces['n'] != n)
+        fim = int(diferentes[0]) if diferentes.size else maximo
+        blocos.append(_leque(faces['i'][:fim]))
+        posicao += fim * dtype_face.itemsize
+        lidas += fim
+        janela = janela * 2 if fim == maximo else JANELA_FACES
+    return np.concatenate(blocos)
+
+
+def _faces_ply_ascii(texto, quantidade):
+    # Uma face por linha: a quantidade de números em cada linha dá o início
+    # de cada face na sequência, sem percorrê-las uma a uma.
+    bruto = np.frombuffer(texto, dtype=np.uint8)
+    espaco = np.isin(bruto, _ESPACOS)
+    inicio_numero = ~espaco & np.concatenate(([True], espaco[:-1]))
+    linha = np.cumsum(bruto == ord('\n'))
+    por_linha = np.bincount(linha[inicio_numero])
+    por_linha = por_linha[por_linha > 0][:quantidade]
+
+    # Lido como float: elementos depois das faces podem ter decimais.
+    dados = np.fromstring(texto, dtype=np.float64, sep=' ').astype(np.int64)
+    inicios = np.cumsum(por_linha) - por_linha
+    if len(por_linha) != quantidade or inicios[-1] + por_linha[-1] > len(dados):
+        raise MalhaInvalida("Faces PLY incompletas.")
+    contagens = dados[inicios]
+    if np.any(contagens != por_linha - 1):
+        raise MalhaInvalida("Face PLY com contagem diferente da quantidade de índices.")
+
+    por_face = np.maximum(contagens - 2, 0)
+    destinos = np.cumsum(por_face) - por_face
+    triangulos = np.empty((int(por_face.sum()), 3), dtype=np.int64)
+    for n in np.unique(contagens[contagens >= 3]):
+        faces = np.flatnonzero(contagens == n)
+        poligonos = dados[inicios[faces, None] + 1 + np.arange(n)]
+        triangulos[(destinos[faces, None] + np.arange(n - 2)).ravel()] = _leque(poligonos)
+    return triangulos
+
+
+def _ply_ascii(caminho, inicio, vertice, face):
+    with open(caminho, 'rb') as f:
+        f.seek(inicio)
+        nomes = [p[0] for p in vertice['propriedades']]
+        colunas = [nomes.index(c) for c in ('x', 'y', 'z')]
+        vertices = np.loadtxt(f, max_rows=vertice['quantidade'], usecols=colunas, dtype=np.float64, ndmin=2)
+        faces = _faces_ply_ascii(f.read(), face['quantidade'])
+    return vertices, faces
+
+
+def _linhas_unicas(matriz, **kwargs):
+    # np.unique(axis=0) é lento; comparar cada linha como um bloco de bytes é
+    # equivalente e bem mais rápido.
+    matriz = np.ascontiguousarray(matriz)
+    linhas = matriz.view(np.dtype((np.void, matriz.dtype.itemsize * matriz.shape[1]))).reshape(-1)
+    resultado = np.unique(linhas, **kwargs)
+    if isinstance(resultado, tuple):
+        return (resultado[0].view(matriz.dtype).reshape(-1, matriz.shape[1]),) + resultado[1:]
+    return resultado.view(matriz.dtype).reshape(-1, matriz.shape[1])
+
+
+def _indexar(triangulos):
+    pontos = np.asarray(triangulos, dtype=np.float64).reshape(-1, 3)
+    # -0.0 e 0.0 têm bytes diferentes mas são o mesmo vértice.
+    pontos = pontos + 0.0
+    vertices, inverso = _linhas_unicas(pontos, return_inverse=True)
+    return vertices, inverso.reshape(-1, 3)
+
+
+def ler_malha(caminho):
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao == '.ply':
+        return ler_ply(caminho)
+    if extensao == '.stl':
+        return ler_stl(caminho)
+    raise MalhaInvalida(f"Extensão não suportada: {extensao or '(nenhuma)'}")
+
+
+def estanque(faces):
+    # Malha fechada: toda aresta é compartilhada por exatamente duas faces.
+    arestas = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    arestas.sort(axis=1)
+    _, contagens = _linhas_unicas(arestas, return_counts=True)
+    return bool(np.all(contagens == 2))
+
+
+def decimar(vertices, faces, alvo=TRIANGULOS_PREVIA):
+    """Simplificação por agrupamento de vértices numa grade regular."""
+    if len(faces) <= alvo:
+        return vertices, faces
+
+    minimo = vertices.min(axis=0)
+    maior_lado = max(float((vertices.max(axis=0) - minimo).max()), 1e-9)
+    celula = maior_lado / max(2, int(np.sqrt(alvo / 2)))
+    while True:
+        chaves = np.floor((vertices - minimo) / celula).astype(np.int64)
+        grupos, grupo = _linhas_unicas(chaves, return_inverse=True)
+        grupo = grupo.reshape(-1)
+
+        novas = grupo[faces]
+        validas = (novas[:, 0] != novas[:, 1]) & (novas[:, 1] != novas[:, 2]) & (novas[:, 0] != novas[:, 2])
+        novas = novas[validas]
+        _, primeiras = _linhas_unicas(np.sort(novas, axis=1), return_index=True)
+        novas = novas[np.sort(primeiras)]
+        if len(novas) <= alvo or celula >= maior_lado:
+            break
+        celula *= 1.5
+
+    contagem = np.bincount(grupo, minlength=len(grupos))
+    centroides = np.column_stack([
+        np.bincount(grupo, weights=vertices[:, eixo], minlength=len(grupos)) for eixo in range(3)
+    ]) / contagem[:, None]
+    return centroides, novas
+
+
+def escrever_stl_binario(caminho, vertices, faces):
+    triangulos = vertices[faces]
+    normais = np.cross(triangulos[:, 1] - triangulos[:, 0], triangulos[:, 2] - triangulos[:, 0])
+    comprimentos = np.linalg.norm(normais, axis=1, keepdims=True)
+    normais = np.divide(normais, comprimentos, out=np.zeros_like(normais), where=comprimentos > 0)
+
+    registros = np.zeros(len(faces), dtype=_DTYPE_STL_BINARIO)
+    registros['normal'] = normais
+    registros['vertices'] = triangulos
+    with open(caminho, 'wb') as f:
+        f.write(b'ProteseFlow preview'.ljust(80, b' '))
+        f.write(np.uint32(len(faces)).tobytes())
+        registros.tofile(f)
+
+
+def analisar_malha(caminho, caminho_previa=None):
+    vertices, faces = ler_malha(caminho)
+    if len(faces) == 0:
+        raise MalhaInvalida("Malha sem faces.")
+    if faces.min() < 0 or faces.max() >= len(vertices):
+        raise MalhaInvalida("Faces apontam para vértices inexistentes.")
+
+    triangulos = vertices[faces]
+    area = 0.5 * np.linalg.norm(
+        np.cross(triangulos[:, 1] - triangulos[:, 0], triangulos[:, 2] - triangulos[:, 0]), axis=1
+    ).sum()
+
+    resultado = {
+        'triangulos': int(len(faces)),
+        'vertices': int(len(vertices)),
+        'caixa_delimitadora': {
+            'min': [round(float(v), 4) for v in vertices.min(axis=0)],
+            'max': [round(float(v), 4) for v in vertices.max(axis=0)],
+        },
+        'area_superficie': round(float(area), 4),
+        'estanque': estanque(faces),
+    }
+
+    if caminho_previa:
+        os.makedirs(os.path.dirname(caminho_previa), exist_ok=True)
+        escrever_stl_binario(caminho_previa, *decimar(vertices, faces))
+    return resultado
+
+
+def analisar_em_processo(caminho, caminho_previa=None):
+    # Ponto de entrada do pool: erros de malha voltam como texto, não como exceção.
+    try:
+        return analisar_malha(caminho, caminho_previa), None
+    except (MalhaInvalida, ValueError, IndexError, OSError) as erro:
+        return None, str(erro) or erro.__class__.__name__
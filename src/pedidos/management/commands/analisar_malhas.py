@@ -0,0 +1,38 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from pedidos.analise import ANALISE_EXPIRA_APOS, devolver_presos, processar_lote
+
+
+class Command(BaseCommand):
+    help = 'Analisa em segundo plano os anexos STL/PLY (triângulos, dimensões, área, malha fechada e prévia).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processos', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--lote', type=int, default=20)
+        parser.add_argument('--intervalo', type=float, default=5.0, help='Segundos entre consultas quando a fila está vazia.')
+        parser.add_argument('--uma-vez', action='store_true', help='Processa o que estiver pendente e sai.')
+        parser.add_argument('--expirar', type=int, default=ANALISE_EXPIRA_APOS,
+                            help='Segundos em PROCESSANDO até a análise voltar para a fila.')
+
+    def handle(self, *args, **options):
+        # 'spawn' evita herdar as conexões de banco do processo principal.
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=options['processos'], mp_context=contexto) as executor:
+            while True:
+                # Só o que foi reservado há muito tempo: análises em curso em
+                # outros workers ou na fila de tarefas continuam com eles.
+                presos = devolver_presos(options['expirar'])
+                if presos:
+                    self.stdout.write(f'{presos} anexo(s) devolvido(s) para a fila.')
+                processados = processar_lote(executor, options['lote'])
+                if processados:
+                    self.stdout.write(f'{processados} anexo(s) analisado(s).')
+                elif options['uma_vez']:
+                    break
+                else:
+                    time.sleep(options['intervalo'])
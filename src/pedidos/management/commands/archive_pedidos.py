@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from pedidos.arquivamento import TAMANHO_LOTE_ARQUIVAMENTO, arquivar_antigos, candidatos, restaurar_pedido
+from pedidos.models import PedidoArquivado
+
+
+class Command(BaseCommand):
+    help = 'Move pedidos APROVADO antigos para o arquivo (somente leitura), em lotes pequenos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=None,
+                            help='Idade mínima, em dias desde a criação (padrão: ARQUIVAR_APOS_DIAS).')
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_ARQUIVAMENTO,
+                            help='Pedidos por transação.')
+        parser.add_argument('--limite', type=int, default=None, help='Para depois de arquivar este total.')
+        parser.add_argument('--pausa', type=float, default=0.0, help='Segundos de espera entre lotes.')
+        parser.add_argument('--simular', action='store_true', help='Só informa quantos seriam arquivados.')
+        parser.add_argument('--restaurar', type=int, nargs='+', metavar='ID',
+                            help='Devolve estes pedidos arquivados à tabela ativa.')
+
+    def handle(self, *args, **options):
+        if options['restaurar']:
+            for pedido_id in options['restaurar']:
+                try:
+                    restaurar_pedido(pedido_id)
+                except PedidoArquivado.DoesNotExist:
+                    raise CommandError(f'Pedido #{pedido_id} não está no arquivo.')
+                self.stdout.write(f'Pedido #{pedido_id} restaurado.')
+            return
+
+        dias = options['dias'] if options['dias'] is not None else settings.ARQUIVAR_APOS_DIAS
+        if dias < 0 or options['lote'] < 1:
+            raise CommandError('--dias não pode ser negativo e --lote deve ser ao menos 1.')
+
+        if options['simular']:
+            total = candidatos(dias).count()
+            self.stdout.write(f'{total} pedido(s) APROVADO com mais de {dias} dia(s) seriam arquivados.')
+            return
+
+        total = arquivar_antigos(dias, lote=options['lote'], limite=options['limite'], pausa=options['pausa'])
+        self.stdout.write(self.style.SUCCESS(f'{total} pedido(s) arquivado(s).'))
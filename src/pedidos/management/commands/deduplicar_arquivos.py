@@ -0,0 +1,40 @@
+import hashlib
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from pedidos.models import Anexo, ArquivoArmazenado, Pedido
+from pedidos.storage import TAMANHO_LEITURA
+
+
+class Command(BaseCommand):
+    help = ('Move anexos e entregas já gravados para o armazenamento deduplicado por SHA-256 '
+            '(no ArmazenamentoComprimido, as malhas também passam a ser comprimidas).')
+
+    def handle(self, *args, **options):
+        if not hasattr(default_storage, 'adotar'):
+            raise CommandError('O storage padrão não é o ArmazenamentoDeduplicado.')
+
+        nomes = set(Anexo.objects.exclude(arquivo='').values_list('arquivo', flat=True))
+        nomes.update(
+            Pedido.objects.exclude(arquivo_entregavel__isnull=True)
+            .exclude(arquivo_entregavel='')
+            .values_list('arquivo_entregavel', flat=True)
+        )
+        nomes -= set(ArquivoArmazenado.objects.filter(nome__in=nomes).values_list('nome', flat=True))
+
+        adotados = ausentes = 0
+        for nome in sorted(nomes):
+            if not default_storage.exists(nome):
+                ausentes += 1
+                continue
+            sha = hashlib.sha256()
+            with default_storage.open(nome, 'rb') as f:
+                for bloco in iter(lambda: f.read(TAMANHO_LEITURA), b''):
+                    sha.update(bloco)
+            default_storage.adotar(nome, sha.hexdigest())
+            adotados += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{adotados} arquivo(s) deduplicado(s), {ausentes} ausente(s) no disco.'
+        ))
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pedidos.uploads import expirar_uploads, uploads_abandonados
+
+
+class Command(BaseCommand):
+    help = 'Apaga os uploads em blocos abandonados e os seus arquivos parciais.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=int, default=None,
+                            help='Horas sem bloco novo (padrão: UPLOAD_EXPIRA_APOS_HORAS).')
+        parser.add_argument('--simular', action='store_true', help='Só informa quantos seriam apagados.')
+
+    def handle(self, *args, **options):
+        horas = options['horas'] if options['horas'] is not None else settings.UPLOAD_EXPIRA_APOS_HORAS
+        if options['simular']:
+            total = uploads_abandonados(horas).count()
+            self.stdout.write(f'{total} upload(s) parado(s) há mais de {horas} hora(s) seriam apagados.')
+            return
+        total = expirar_uploads(horas)
+        self.stdout.write(self.style.SUCCESS(f'{total} upload(s) abandonado(s) apagado(s).'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pedidos.importacao import TAMANHO_LOTE_IMPORTACAO, importar_pedidos, ler_linhas
+
+
+class Command(BaseCommand):
+    help = 'Importa pedidos de um arquivo CSV ou JSON, resolvendo o dentista pelo CRO ou e-mail.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo')
+        parser.add_argument('--formato', choices=['csv', 'json'])
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_IMPORTACAO)
+        parser.add_argument('--simular', action='store_true', help='Só valida; não grava nada.')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                resultado = importar_pedidos(
+                    ler_linhas(arquivo, options['formato']),
+                    tamanho_lote=options['lote'],
+                    simular=options['simular'],
+                )
+        except (OSError, ValueError) as erro:
+            raise CommandError(f'Não foi possível ler o arquivo: {erro}')
+
+        for linha, mensagem in resultado.erros:
+            self.stderr.write(f'Linha {linha}: {mensagem}')
+        verbo = 'válido(s)' if options['simular'] else 'importado(s)'
+        self.stdout.write(f'{resultado.importados} pedido(s) {verbo}, {len(resultado.erros)} linha(s) com erro.')
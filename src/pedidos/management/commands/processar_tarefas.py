@@ -0,0 +1,67 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+
+
+def _processo_worker(opcoes):
+    # Processo novo ('spawn'): precisa configurar o Django antes de tocar nos models.
+    import django
+    django.setup()
+
+    from pedidos.fila import laco_worker
+    try:
+        laco_worker(**opcoes)
+    except KeyboardInterrupt:
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Executa as tarefas da fila em segundo plano (retentativas, prioridades e tempo de visibilidade).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processos', type=int, default=2)
+        parser.add_argument('--lote', type=int, default=10)
+        parser.add_argument('--intervalo', type=float, default=1.0, help='Segundos entre consultas quando a fila está vazia.')
+        parser.add_argument('--visibilidade', type=int, default=300,
+                            help='Segundos até uma tarefa reservada voltar para a fila se o worker não concluir.')
+        parser.add_argument('--reter-dias', type=int, default=7, help='Apaga tarefas concluídas há mais tempo que isso.')
+        parser.add_argument('--uma-vez', action='store_true', help='Processa o que estiver pendente e sai.')
+
+    def handle(self, *args, **options):
+        from pedidos.fila import laco_worker, limpar_concluidas
+
+        removidas = limpar_concluidas(options['reter_dias'])
+        if removidas:
+            self.stdout.write(f'{removidas} tarefa(s) concluída(s) removida(s).')
+
+        opcoes = {
+            'limite': options['lote'],
+            'intervalo': options['intervalo'],
+            'visibilidade': options['visibilidade'],
+            'uma_vez': options['uma_vez'],
+        }
+        if options['processos'] <= 1:
+            laco_worker(**opcoes)
+            return
+
+        # 'spawn' evita herdar as conexões de banco do processo principal.
+        contexto = multiprocessing.get_context('spawn')
+        processos = [None] * options['processos']
+        try:
+            while True:
+                for i, processo in enumerate(processos):
+                    if processo is None or (not processo.is_alive() and not options['uma_vez']):
+                        if processo is not None:
+                            self.stderr.write(f'Worker {processo.pid} saiu com código {processo.exitcode}; reiniciando.')
+                        processos[i] = contexto.Process(target=_processo_worker, args=(opcoes,))
+                        processos[i].start()
+                if options['uma_vez'] and not any(p.is_alive() for p in processos):
+                    break
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for processo in processos:
+                if processo is not None:
+                    processo.join()
@@ -0,0 +1,42 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from pedidos.reconciliacao import TAMANHO_LOTE_RECONCILIACAO, descartar, encontrar_orfaos
+
+
+class Command(BaseCommand):
+    help = 'Apaga (ou põe em quarentena) arquivos de mídia que nenhum pedido, anexo ou upload referencia.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--simular', action='store_true', help='Só lista os órfãos, sem apagar nada.')
+        parser.add_argument('--quarentena', metavar='PASTA',
+                            help='Move os órfãos para esta pasta (mesma estrutura) em vez de apagar.')
+        parser.add_argument('--horas', type=float, default=24,
+                            help='Ignora arquivos modificados há menos tempo que isso.')
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_RECONCILIACAO,
+                            help='Nomes conferidos por consulta.')
+
+    def handle(self, *args, **options):
+        raiz = getattr(default_storage, 'location', None)
+        if raiz is None:
+            raise CommandError('O storage padrão não guarda arquivos em disco local.')
+
+        total = tamanho_total = 0
+        for nome, tamanho in encontrar_orfaos(raiz, options['horas'] * 3600, options['lote']):
+            if options['verbosity'] > 1 or options['simular']:
+                self.stdout.write(f'{nome} ({filesizeformat(tamanho)})')
+            if not options['simular']:
+                descartar(raiz, nome, options['quarentena'])
+            total += 1
+            tamanho_total += tamanho
+
+        if options['simular']:
+            acao = 'seriam removido(s)'
+        elif options['quarentena']:
+            acao = f"movido(s) para {options['quarentena']}"
+        else:
+            acao = 'removido(s)'
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} arquivo(s) órfão(s) {acao}, {filesizeformat(tamanho_total)}.'
+        ))
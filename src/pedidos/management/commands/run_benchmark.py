@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pedidos.benchmark import PREFIXO_BENCHMARK, comparar, executar
+
+
+class Command(BaseCommand):
+    help = 'Mede consultas SQL e tempo de cada tela e compara com uma linha de base em JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=5)
+        parser.add_argument('--cache-quente', action='store_true', help='Não limpa o cache de KPIs entre medições.')
+        parser.add_argument('--prefixo', default=PREFIXO_BENCHMARK)
+        parser.add_argument('--saida', help='Grava o resultado neste arquivo JSON.')
+        parser.add_argument('--base', help='Linha de base (JSON de uma execução anterior) para comparar.')
+        parser.add_argument('--tolerancia', type=float, default=0.2, help='Aumento de tempo aceito (fração).')
+        parser.add_argument('--folga-ms', type=float, default=5.0, help='Aumento de tempo sempre aceito (ms).')
+
+    def handle(self, *args, **options):
+        resultado = executar(options['repeticoes'], options['cache_quente'], options['prefixo'])
+        if not resultado['cenarios']:
+            raise CommandError('Nenhum usuário para medir; rode antes "manage.py seed_benchmark".')
+
+        for nome, medida in resultado['cenarios'].items():
+            self.stdout.write(
+                f"{nome:<40} {medida['status']:>4} {medida['consultas']:>4} consultas "
+                f"{medida['tempo_ms']:>9.1f} ms"
+            )
+
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+        if options['base']:
+            try:
+                with open(options['base'], encoding='utf-8') as arquivo:
+                    base = json.load(arquivo)
+            except (OSError, ValueError) as erro:
+                raise CommandError(f'Não foi possível ler a linha de base: {erro}')
+            regressoes = comparar(resultado, base, options['tolerancia'], options['folga_ms'])
+            for nome, motivo in regressoes:
+                self.stderr.write(f'REGRESSÃO {nome}: {motivo}')
+            if regressoes:
+                raise CommandError(f'{len(regressoes)} regressão(ões) em relação a {options["base"]}.')
+            self.stdout.write(self.style.SUCCESS('Sem regressões em relação à linha de base.'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from pedidos.benchmark import PREFIXO_BENCHMARK, TAMANHO_LOTE_BENCHMARK, limpar, semear
+
+
+class Command(BaseCommand):
+    help = 'Gera dentistas, cadistas, pedidos com odontograma e anexos sintéticos para medir desempenho.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dentistas', type=int, default=50)
+        parser.add_argument('--cadistas', type=int, default=10)
+        parser.add_argument('--pedidos', type=int, default=10000)
+        parser.add_argument('--anexos', type=int, default=1, help='Anexos por pedido.')
+        parser.add_argument('--dias', type=int, default=365, help='Período em que as datas de criação se espalham.')
+        parser.add_argument('--semente', type=int, default=42)
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_BENCHMARK)
+        parser.add_argument('--prefixo', default=PREFIXO_BENCHMARK, help='Prefixo dos usuários gerados.')
+        parser.add_argument('--limpar', action='store_true', help='Remove os dados gerados antes (mesmo prefixo).')
+
+    def handle(self, *args, **options):
+        if options['limpar']:
+            removidos = limpar(options['prefixo'])
+            self.stdout.write(f'{removidos} usuário(s) sintético(s) removido(s), com seus pedidos.')
+
+        criados = semear(
+            dentistas=options['dentistas'],
+            cadistas=options['cadistas'],
+            pedidos=options['pedidos'],
+            anexos_por_pedido=options['anexos'],
+            dias=options['dias'],
+            semente=options['semente'],
+            prefixo=options['prefixo'],
+            tamanho_lote=options['lote'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['dentistas']} dentista(s), {options['cadistas']} cadista(s) e {criados} pedido(s) criados."
+        ))
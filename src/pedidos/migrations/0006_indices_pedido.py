@@ -0,0 +1,57 @@
+# Generated by Django 6.0 on 2026-10-18 15:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0005_pedido_arquivo_entregavel_pedido_cadista_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pedido',
+            name='cadista',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pedidos_alocados', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='pedido',
+            name='dentista',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='pedidos', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['data_criacao'], name='pedido_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['status', 'data_criacao'], name='pedido_status_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['dentista', 'status', 'data_criacao'], name='pedido_dent_status_cria_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['dentista', 'data_criacao'], name='pedido_dent_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['cadista', 'status'], name='pedido_cadista_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['nome_paciente'], name='pedido_paciente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['data_entrega_prevista'], name='pedido_entrega_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(condition=models.Q(('status', 'PENDENTE')), fields=['data_entrega_prevista', 'data_criacao'], name='pedido_pendentes_idx'),
+        ),
+    ]
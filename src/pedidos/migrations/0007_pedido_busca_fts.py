@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-18 16:02
+
+from django.db import OperationalError, migrations
+
+
+def criar_tabela_busca(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS pedidos_pedido_busca USING fts5("
+            "nome_paciente, tipo_servico, observacoes, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+    except OperationalError:
+        # SQLite sem FTS5: a busca volta para icontains.
+        return
+    schema_editor.execute(
+        "INSERT INTO pedidos_pedido_busca(rowid, nome_paciente, tipo_servico, observacoes) "
+        "SELECT id, nome_paciente, tipo_servico, observacoes FROM pedidos_pedido"
+    )
+
+
+def remover_tabela_busca(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS pedidos_pedido_busca")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0006_indices_pedido'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_tabela_busca, remover_tabela_busca),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 16:40
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0007_pedido_busca_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadArquivo',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('caminho', models.CharField(max_length=255)),
+                ('nome_original', models.CharField(max_length=255)),
+                ('descricao', models.CharField(blank=True, default='Arquivo STL', max_length=100)),
+                ('tamanho_total', models.BigIntegerField()),
+                ('recebido', models.BigIntegerField(default=0)),
+                ('sha256_esperado', models.CharField(blank=True, default='', max_length=64)),
+                ('sha256', models.CharField(blank=True, default='', max_length=64)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('anexo', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload', to='pedidos.anexo')),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='pedidos.pedido')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
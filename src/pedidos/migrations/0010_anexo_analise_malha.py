@@ -0,0 +1,57 @@
+# Generated by Django 6.0 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0009_arquivoarmazenado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anexo',
+            name='analise_erro',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='anexo',
+            name='analise_status',
+            field=models.CharField(choices=[('PENDENTE', 'Aguardando Análise'), ('PROCESSANDO', 'Em Análise'), ('CONCLUIDA', 'Analisada'), ('ERRO', 'Malha Inválida'), ('IGNORADA', 'Não é Malha')], default='PENDENTE', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='anexo',
+            name='area_superficie',
+            field=models.FloatField(blank=True, null=True, verbose_name='Área de Superfície (mm²)'),
+        ),
+        migrations.AddField(
+            model_name='anexo',
+            name='caixa_delimitadora',
+            field=models.JSONField(blank=True, null=True, verbose_name='Caixa Delimitadora (mm)'),
+        ),
+        migrations.AddField(
+            model_name='anexo',
+            name='estanque',
+            field=models.BooleanField(blank=True, null=True, verbose_name='Malha Fechada'),
+        ),
+        migrations.AddField(
+            model_name='anexo',
+            name='previa',
+            field=models.FileField(blank=True, null=True, upload_to='previas/%Y/%m/'),
+        ),
+        migrations.AddField(
+            model_name='anexo',
+            name='triangulos',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='anexo',
+            name='vertices',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='anexo',
+            index=models.Index(condition=models.Q(('analise_status', 'PENDENTE')), fields=['uploaded_at'], name='anexo_analise_pendente_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-18 18:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0010_anexo_analise_malha'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ElementoPedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dente', models.PositiveSmallIntegerField(verbose_name='Dente (FDI)')),
+                ('procedimento', models.CharField(choices=[('COROA', 'Coroa'), ('FACETA', 'Faceta'), ('PROVISORIO', 'Provisório'), ('IMPLANTE', 'Implante')], max_length=20)),
+                ('pedido', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='elementos_dentarios', to='pedidos.pedido')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dente', 'procedimento'], name='elemento_dente_proc_idx'), models.Index(fields=['procedimento', 'dente'], name='elemento_proc_dente_idx')],
+                'constraints': [models.UniqueConstraint(fields=('pedido', 'dente'), name='elemento_pedido_dente_unico')],
+            },
+        ),
+    ]
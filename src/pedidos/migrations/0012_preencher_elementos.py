@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-18 18:52
+
+import json
+
+from django.db import migrations
+
+DENTES_VALIDOS = frozenset(
+    [q * 10 + d for q in (1, 2, 3, 4) for d in range(1, 9)]
+    + [q * 10 + d for q in (5, 6, 7, 8) for d in range(1, 6)]
+)
+PROCEDIMENTOS = {'COROA', 'FACETA', 'PROVISORIO', 'IMPLANTE'}
+
+
+def preencher_elementos(apps, schema_editor):
+    Pedido = apps.get_model('pedidos', 'Pedido')
+    ElementoPedido = apps.get_model('pedidos', 'ElementoPedido')
+
+    lote = []
+    for pedido_id, texto in Pedido.objects.values_list('id', 'elementos').iterator(chunk_size=2000):
+        try:
+            mapa = json.loads(texto or '{}')
+        except ValueError:
+            continue
+        if not isinstance(mapa, dict):
+            continue
+        for dente, procedimento in mapa.items():
+            try:
+                dente = int(dente)
+            except (TypeError, ValueError):
+                continue
+            if dente in DENTES_VALIDOS and procedimento in PROCEDIMENTOS:
+                lote.append(ElementoPedido(pedido_id=pedido_id, dente=dente, procedimento=procedimento))
+        if len(lote) >= 2000:
+            ElementoPedido.objects.bulk_create(lote, ignore_conflicts=True)
+            lote = []
+    ElementoPedido.objects.bulk_create(lote, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0011_elementopedido'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher_elementos, migrations.RunPython.noop),
+    ]
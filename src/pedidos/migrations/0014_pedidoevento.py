@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 19:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0013_tarefa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndicadorDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(unique=True)),
+                ('entradas_fila', models.PositiveIntegerField(default=0)),
+                ('saidas_fila', models.PositiveIntegerField(default=0)),
+                ('entregas', models.PositiveIntegerField(default=0)),
+                ('retrabalhos', models.PositiveIntegerField(default=0)),
+                ('lead_time_total', models.FloatField(default=0, help_text='Soma em segundos, da criação à primeira entrega.')),
+                ('ultimo_evento', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PedidoEvento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status_anterior', models.CharField(blank=True, default='', max_length=20)),
+                ('status_novo', models.CharField(max_length=20)),
+                ('criado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('cadista', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('pedido', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='eventos', to='pedidos.pedido')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['pedido', 'criado_em'], name='evento_pedido_idx'), models.Index(fields=['criado_em'], name='evento_criado_idx'), models.Index(fields=['cadista', 'status_novo', 'criado_em'], name='evento_cadista_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-18 19:46
+
+from django.db import migrations
+
+
+def preencher_eventos(apps, schema_editor):
+    # Não há histórico dos pedidos antigos: cada um ganha só o status atual,
+    # datado da criação, sem status anterior.
+    Pedido = apps.get_model('pedidos', 'Pedido')
+    PedidoEvento = apps.get_model('pedidos', 'PedidoEvento')
+
+    lote = []
+    pedidos = Pedido.objects.values_list('id', 'status', 'cadista_id', 'data_criacao')
+    for pedido_id, status, cadista_id, data_criacao in pedidos.iterator(chunk_size=2000):
+        lote.append(PedidoEvento(
+            pedido_id=pedido_id, status_novo=status, cadista_id=cadista_id, criado_em=data_criacao,
+        ))
+        if len(lote) >= 2000:
+            PedidoEvento.objects.bulk_create(lote)
+            lote = []
+    PedidoEvento.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0014_pedidoevento'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher_eventos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 6.0 on 2026-10-18 10:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0016_indices_login_usuario'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pedidoevento',
+            name='pedido',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='eventos', to='pedidos.pedido'),
+        ),
+        migrations.CreateModel(
+            name='PedidoArquivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('arquivo_entregavel', models.FileField(blank=True, null=True, upload_to='entregas/')),
+                ('motivo_retrabalho', models.TextField(blank=True, null=True)),
+                ('nome_paciente', models.CharField(max_length=100, verbose_name='Nome do Paciente')),
+                ('dentes', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Aguardando Início'), ('EM_PRODUCAO', 'Em Produção'), ('CONCLUIDO', 'Finalizado'), ('RETRABALHO', 'Ajuste Solicitado'), ('APROVADO', 'Aprovado')], max_length=20)),
+                ('data_criacao', models.DateTimeField()),
+                ('data_entrega_prevista', models.DateField(blank=True, null=True)),
+                ('sexo', models.CharField(choices=[('M', 'Masculino'), ('F', 'Feminino')], default='M', max_length=1, verbose_name='Sexo')),
+                ('elementos', models.TextField(blank=True, default='{}', verbose_name='Odontograma JSON')),
+                ('tipo_servico', models.CharField(max_length=100, verbose_name='Tipo de Serviço')),
+                ('cor', models.CharField(blank=True, max_length=50, null=True, verbose_name='Cor (Ex: A2)')),
+                ('observacoes', models.TextField(blank=True, null=True, verbose_name='Observações / Detalhes')),
+                ('arquivado_em', models.DateTimeField(auto_now_add=True)),
+                ('cadista', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('dentista', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='pedidos_arquivados', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AnexoArquivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('arquivo', models.FileField(upload_to='arquivos_protese/%Y/%m/')),
+                ('descricao', models.CharField(blank=True, default='Arquivo STL', max_length=100)),
+                ('uploaded_at', models.DateTimeField()),
+                ('analise_status', models.CharField(choices=[('PENDENTE', 'Aguardando Análise'), ('PROCESSANDO', 'Em Análise'), ('CONCLUIDA', 'Analisada'), ('ERRO', 'Malha Inválida'), ('IGNORADA', 'Não é Malha')], default='PENDENTE', max_length=20)),
+                ('analise_erro', models.TextField(blank=True, default='')),
+                ('triangulos', models.PositiveIntegerField(blank=True, null=True)),
+                ('vertices', models.PositiveIntegerField(blank=True, null=True)),
+                ('caixa_delimitadora', models.JSONField(blank=True, null=True, verbose_name='Caixa Delimitadora (mm)')),
+                ('area_superficie', models.FloatField(blank=True, null=True, verbose_name='Área de Superfície (mm²)')),
+                ('estanque', models.BooleanField(blank=True, null=True, verbose_name='Malha Fechada')),
+                ('previa', models.FileField(blank=True, null=True, upload_to='previas/%Y/%m/')),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='anexos', to='pedidos.pedidoarquivado')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pedidoarquivado',
+            index=models.Index(fields=['dentista', 'data_criacao'], name='arquivado_dent_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedidoarquivado',
+            index=models.Index(fields=['cadista', 'data_criacao'], name='arquivado_cad_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedidoarquivado',
+            index=models.Index(fields=['data_criacao'], name='arquivado_criacao_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0017_arquivo_pedidos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='arquivoarmazenado',
+            name='codec',
+            field=models.CharField(blank=True, choices=[('', 'Sem compressão'), ('gzip', 'gzip')], default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='arquivoarmazenado',
+            name='tamanho_armazenado',
+            field=models.BigIntegerField(blank=True, help_text='Bytes no disco.', null=True),
+        ),
+        migrations.AlterField(
+            model_name='arquivoarmazenado',
+            name='tamanho',
+            field=models.BigIntegerField(help_text='Tamanho original, antes da compressão.'),
+        ),
+    ]
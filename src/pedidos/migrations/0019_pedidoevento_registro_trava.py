@@ -0,0 +1,50 @@
+# Generated by Django 6.0 on 2026-10-18 15:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def preencher_registro(apps, schema_editor):
+    Pedido = apps.get_model('pedidos', 'Pedido')
+    PedidoArquivado = apps.get_model('pedidos', 'PedidoArquivado')
+    PedidoEvento = apps.get_model('pedidos', 'PedidoEvento')
+
+    PedidoEvento.objects.update(registrado_em=models.F('criado_em'))
+    for modelo in (Pedido, PedidoArquivado):
+        criacao = modelo.objects.filter(pk=models.OuterRef('pedido_id')).values('data_criacao')[:1]
+        PedidoEvento.objects.filter(pedido_criado_em__isnull=True).update(pedido_criado_em=models.Subquery(criacao))
+    # Pedidos já excluídos: o primeiro evento é o da criação.
+    primeiro = (
+        PedidoEvento.objects.filter(pedido_id=models.OuterRef('pedido_id'))
+        .order_by('criado_em').values('criado_em')[:1]
+    )
+    PedidoEvento.objects.filter(pedido_criado_em__isnull=True).update(pedido_criado_em=models.Subquery(primeiro))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0018_arquivoarmazenado_codec'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedidoevento',
+            name='pedido_criado_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pedidoevento',
+            name='registrado_em',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='Trava',
+            fields=[
+                ('nome', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('ate', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(preencher_registro, migrations.RunPython.noop),
+    ]
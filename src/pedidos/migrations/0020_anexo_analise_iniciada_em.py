@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0019_pedidoevento_registro_trava'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anexo',
+            name='analise_iniciada_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
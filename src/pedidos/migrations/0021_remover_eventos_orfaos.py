@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-18 16:05
+
+from django.db import migrations
+
+
+def remover_eventos_orfaos(apps, schema_editor):
+    # Histórico de pedidos excluídos por caminhos que não apagavam os eventos.
+    Pedido = apps.get_model('pedidos', 'Pedido')
+    PedidoArquivado = apps.get_model('pedidos', 'PedidoArquivado')
+    PedidoEvento = apps.get_model('pedidos', 'PedidoEvento')
+    (
+        PedidoEvento.objects
+        .exclude(pedido_id__in=Pedido.objects.values('pk'))
+        .exclude(pedido_id__in=PedidoArquivado.objects.values('pk'))
+        .delete()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0020_anexo_analise_iniciada_em'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_eventos_orfaos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0021_remover_eventos_orfaos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadarquivo',
+            name='recebendo_ate',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-18 17:10
+
+import django.db.models.lookups
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0022_uploadarquivo_recebendo_ate'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='pedido',
+            name='pedido_pendentes_idx',
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(models.F('status'), django.db.models.lookups.IsNull(models.F('data_entrega_prevista'), True), models.F('data_entrega_prevista'), models.F('data_criacao'), name='pedido_fila_idx'),
+        ),
+    ]
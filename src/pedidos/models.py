@@ -1,5 +1,11 @@
+import uuid
+
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
+from django.db.models import F
+from django.db.models.functions import Lower
+from django.db.models.lookups import IsNull
 from django.core.validators import RegexValidator
 
 class Usuario(AbstractUser):
@@ -31,6 +37,37 @@ class Usuario(AbstractUser):
     esta_arquivado = models.BooleanField(default=False, verbose_name="Está na Lixeira")
     cadastro_confirmado = models.BooleanField(default=False)
 
+    class Meta(AbstractUser.Meta):
+        # Usados pelo login por usuário ou e-mail sem diferenciar maiúsculas.
+        indexes = [
+            models.Index(Lower('username'), name='usuario_username_lower_idx'),
+            models.Index(Lower('email'), name='usuario_email_lower_idx'),
+        ]
+
+class PedidoQuerySet(models.QuerySet):
+    # Colunas mostradas nas listas; elementos e observações (texto longo) ficam de fora.
+    CAMPOS_LISTA = (
+        'id', 'nome_paciente', 'tipo_servico', 'status', 'data_criacao', 'data_entrega_prevista',
+        'dentista', 'dentista__username', 'dentista__first_name', 'dentista__last_name',
+        'cadista', 'cadista__username', 'cadista__first_name', 'cadista__last_name',
+    )
+
+    def for_user(self, usuario):
+        """Pedidos que ``usuario`` pode ver: gestores, todos; cadistas, os seus e
+        a fila de PENDENTES; dentistas, os próprios."""
+        if usuario.is_superuser or usuario.tipo_usuario in ('GESTOR', 'ADMIN'):
+            return self
+        if usuario.tipo_usuario == 'CADISTA':
+            return self.filter(models.Q(cadista=usuario) | models.Q(status='PENDENTE'))
+        return self.filter(dentista=usuario)
+
+    def for_list(self):
+        return self.select_related('dentista', 'cadista').only(*self.CAMPOS_LISTA)
+
+    def for_detail(self):
+        return self.select_related('dentista', 'cadista').prefetch_related('anexos')
+
+
 class Pedido(models.Model):
     STATUS_CHOICES = (
         ('PENDENTE', 'Aguardando Início'),
@@ -40,9 +77,9 @@ class Pedido(models.Model):
         ('APROVADO', 'Aprovado'),
     )
 
-    dentista = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='pedidos')
+    dentista = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='pedidos', db_index=False)
 
-    cadista = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='pedidos_alocados')
+    cadista = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='pedidos_alocados', db_index=False)
 
     arquivo_entregavel = models.FileField(upload_to='entregas/', null=True, blank=True)
 
@@ -71,14 +108,307 @@ class Pedido(models.Model):
     
     observacoes = models.TextField(blank=True, null=True, verbose_name="Observações / Detalhes")
 
+    objects = PedidoQuerySet.as_manager()
+
+    class Meta:
+        # Os índices de dentista e cadista começam pela FK e substituem o
+        # índice simples que o Django criaria para ela.
+        indexes = [
+            models.Index(fields=['data_criacao'], name='pedido_criacao_idx'),
+            models.Index(fields=['status', 'data_criacao'], name='pedido_status_criacao_idx'),
+            models.Index(fields=['dentista', 'status', 'data_criacao'], name='pedido_dent_status_cria_idx'),
+            models.Index(fields=['dentista', 'data_criacao'], name='pedido_dent_criacao_idx'),
+            models.Index(fields=['cadista', 'status'], name='pedido_cadista_status_idx'),
+            models.Index(fields=['nome_paciente'], name='pedido_paciente_idx'),
+            models.Index(fields=['data_entrega_prevista'], name='pedido_entrega_idx'),
+            # Fila de pendentes (atribuicao.fila_pendentes): a mesma ordem do
+            # ORDER BY, com os sem prazo no fim. Não é parcial: o filtro de
+            # status chega como parâmetro e o SQLite não usaria o índice.
+            models.Index(
+                'status', IsNull(F('data_entrega_prevista'), True), 'data_entrega_prevista', 'data_criacao',
+                name='pedido_fila_idx',
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Status e cadista como estão no banco, para o log de eventos e a
+        # transmissão detectarem a mudança.
+        if 'status' in instancia.__dict__:
+            instancia._status_salvo = instancia.status
+        if 'cadista_id' in instancia.__dict__:
+            instancia._cadista_salvo = instancia.cadista_id
+        if 'arquivo_entregavel' in instancia.__dict__:
+            # Nome ainda cru (str), antes de o descritor virar FieldFile.
+            instancia._entregavel_salvo = instancia.__dict__['arquivo_entregavel'] or None
+        return instancia
+
     def __str__(self):
         return f"Pedido #{self.id} - {self.nome_paciente}"
 
+class ElementoPedido(models.Model):
+    PROCEDIMENTO_CHOICES = (
+        ('COROA', 'Coroa'),
+        ('FACETA', 'Faceta'),
+        ('PROVISORIO', 'Provisório'),
+        ('IMPLANTE', 'Implante'),
+    )
+
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name='elementos_dentarios', db_index=False)
+    dente = models.PositiveSmallIntegerField(verbose_name="Dente (FDI)")
+    procedimento = models.CharField(max_length=20, choices=PROCEDIMENTO_CHOICES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['pedido', 'dente'], name='elemento_pedido_dente_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['dente', 'procedimento'], name='elemento_dente_proc_idx'),
+            models.Index(fields=['procedimento', 'dente'], name='elemento_proc_dente_idx'),
+        ]
+
+    def __str__(self):
+        return f"Dente {self.dente} - {self.get_procedimento_display()} (Pedido #{self.pedido_id})"
+
 class Anexo(models.Model):
+    ANALISE_CHOICES = (
+        ('PENDENTE', 'Aguardando Análise'),
+        ('PROCESSANDO', 'Em Análise'),
+        ('CONCLUIDA', 'Analisada'),
+        ('ERRO', 'Malha Inválida'),
+        ('IGNORADA', 'Não é Malha'),
+    )
+
     pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name='anexos')
     arquivo = models.FileField(upload_to='arquivos_protese/%Y/%m/')
     descricao = models.CharField(max_length=100, blank=True, default="Arquivo STL")
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    analise_status = models.CharField(max_length=20, choices=ANALISE_CHOICES, default='PENDENTE')
+    analise_erro = models.TextField(blank=True, default="")
+    analise_iniciada_em = models.DateTimeField(null=True, blank=True)
+    triangulos = models.PositiveIntegerField(null=True, blank=True)
+    vertices = models.PositiveIntegerField(null=True, blank=True)
+    caixa_delimitadora = models.JSONField(null=True, blank=True, verbose_name="Caixa Delimitadora (mm)")
+    area_superficie = models.FloatField(null=True, blank=True, verbose_name="Área de Superfície (mm²)")
+    estanque = models.BooleanField(null=True, blank=True, verbose_name="Malha Fechada")
+    previa = models.FileField(upload_to='previas/%Y/%m/', null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['uploaded_at'],
+                name='anexo_analise_pendente_idx',
+                condition=models.Q(analise_status='PENDENTE'),
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        if 'previa' in instancia.__dict__:
+            instancia._previa_salva = instancia.__dict__['previa'] or None
+        return instancia
+
+    @property
+    def dimensoes(self):
+        if not self.caixa_delimitadora:
+            return None
+        minimo, maximo = self.caixa_delimitadora['min'], self.caixa_delimitadora['max']
+        return [round(b - a, 2) for a, b in zip(minimo, maximo)]
+
+    @property
+    def eh_imagem(self):
+        from .imagens import eh_imagem
+
+        return eh_imagem(self.arquivo.name)
+
+    def __str__(self):
+        return f"Anexo do Pedido #{self.pedido.id}"
+
+class UploadArquivo(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name='uploads')
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='uploads')
+    caminho = models.CharField(max_length=255)
+    nome_original = models.CharField(max_length=255)
+    descricao = models.CharField(max_length=100, blank=True, default="Arquivo STL")
+    tamanho_total = models.BigIntegerField()
+    recebido = models.BigIntegerField(default=0)
+    # Enquanto um bloco é gravado, ninguém mais escreve a partir do mesmo offset.
+    recebendo_ate = models.DateTimeField(null=True, blank=True)
+    sha256_esperado = models.CharField(max_length=64, blank=True, default="")
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+    anexo = models.OneToOneField(Anexo, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload')
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    @property
+    def concluido(self):
+        return self.anexo_id is not None
+
+    def __str__(self):
+        return f"Upload {self.nome_original} ({self.recebido}/{self.tamanho_total})"
+
+
+class ArquivoArmazenado(models.Model):
+    CODEC_CHOICES = (
+        ('', 'Sem compressão'),
+        ('gzip', 'gzip'),
+    )
+
+    nome = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    tamanho = models.BigIntegerField(help_text="Tamanho original, antes da compressão.")
+    codec = models.CharField(max_length=10, choices=CODEC_CHOICES, blank=True, default="")
+    tamanho_armazenado = models.BigIntegerField(null=True, blank=True, help_text="Bytes no disco.")
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.nome} ({self.sha256[:12]})"
+
+
+class Tarefa(models.Model):
+    STATUS_CHOICES = (
+        ('PENDENTE', 'Na Fila'),
+        ('EXECUTANDO', 'Executando'),
+        ('CONCLUIDA', 'Concluída'),
+        ('FALHOU', 'Falhou'),
+    )
+
+    nome = models.CharField(max_length=100)
+    argumentos = models.JSONField(default=dict, blank=True)
+    prioridade = models.SmallIntegerField(default=0, help_text="Maior número executa primeiro.")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDENTE')
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    max_tentativas = models.PositiveSmallIntegerField(default=5)
+    executar_em = models.DateTimeField(default=timezone.now)
+    reservada_ate = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True, default="")
+    ultimo_erro = models.TextField(blank=True, default="")
+    criada_em = models.DateTimeField(auto_now_add=True)
+    concluida_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-prioridade', 'executar_em'],
+                name='tarefa_fila_idx',
+                condition=models.Q(status='PENDENTE'),
+            ),
+            models.Index(
+                fields=['reservada_ate'],
+                name='tarefa_reservada_idx',
+                condition=models.Q(status='EXECUTANDO'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.nome} #{self.id} ({self.status})"
+
+
+class PedidoEvento(models.Model):
+    """Transição de status de um pedido. Só recebe inserções."""
+    # Sem restrição no banco: o histórico continua ali quando o pedido vai para o arquivo.
+    pedido = models.ForeignKey(
+        Pedido, on_delete=models.DO_NOTHING, db_constraint=False, related_name='eventos', db_index=False,
+    )
+    status_anterior = models.CharField(max_length=20, blank=True, default="")
+    status_novo = models.CharField(max_length=20)
+    cadista = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_index=False)
+    criado_em = models.DateTimeField(default=timezone.now)
+    # Cópia de Pedido.data_criacao: o lead time não depende do pedido ainda existir na tabela ativa.
+    pedido_criado_em = models.DateTimeField(null=True, blank=True)
+    # Momento da gravação; criado_em pode vir retroativo (importação, benchmark).
+    registrado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pedido', 'criado_em'], name='evento_pedido_idx'),
+            models.Index(fields=['criado_em'], name='evento_criado_idx'),
+            models.Index(fields=['cadista', 'status_novo', 'criado_em'], name='evento_cadista_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pedido #{self.pedido_id}: {self.status_anterior or '-'} -> {self.status_novo}"
+
+
+class IndicadorDiario(models.Model):
+    """Contadores por dia acumulados a partir de ``PedidoEvento``."""
+    dia = models.DateField(unique=True)
+    entradas_fila = models.PositiveIntegerField(default=0)
+    saidas_fila = models.PositiveIntegerField(default=0)
+    entregas = models.PositiveIntegerField(default=0)
+    retrabalhos = models.PositiveIntegerField(default=0)
+    lead_time_total = models.FloatField(default=0, help_text="Soma em segundos, da criação à primeira entrega.")
+    ultimo_evento = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Indicadores de {self.dia}"
+
+
+class Trava(models.Model):
+    """Trava nomeada no banco, válida para todos os processos até ``ate``."""
+    nome = models.CharField(max_length=50, primary_key=True)
+    ate = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.nome
+
+
+class PedidoArquivado(models.Model):
+    """Pedido APROVADO antigo, movido de ``Pedido`` por ``archive_pedidos``.
+
+    Mesmas colunas e mesmo id do original, para a busca, os links e a
+    restauração; somente leitura fora do comando e de ``restaurar_pedido``.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    dentista = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='pedidos_arquivados', db_index=False)
+    cadista = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_index=False)
+    arquivo_entregavel = models.FileField(upload_to='entregas/', null=True, blank=True)
+    motivo_retrabalho = models.TextField(null=True, blank=True)
+    nome_paciente = models.CharField(max_length=100, verbose_name="Nome do Paciente")
+    dentes = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=Pedido.STATUS_CHOICES)
+    data_criacao = models.DateTimeField()
+    data_entrega_prevista = models.DateField(blank=True, null=True)
+    sexo = models.CharField(max_length=1, choices=Pedido.SEXO_CHOICES, default='M', verbose_name="Sexo")
+    elementos = models.TextField(verbose_name="Odontograma JSON", blank=True, default="{}")
+    tipo_servico = models.CharField(max_length=100, verbose_name="Tipo de Serviço")
+    cor = models.CharField(max_length=50, blank=True, null=True, verbose_name="Cor (Ex: A2)")
+    observacoes = models.TextField(blank=True, null=True, verbose_name="Observações / Detalhes")
+    arquivado_em = models.DateTimeField(auto_now_add=True)
+
+    objects = PedidoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['dentista', 'data_criacao'], name='arquivado_dent_criacao_idx'),
+            models.Index(fields=['cadista', 'data_criacao'], name='arquivado_cad_criacao_idx'),
+            models.Index(fields=['data_criacao'], name='arquivado_criacao_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pedido #{self.id} - {self.nome_paciente} (arquivado)"
+
+
+class AnexoArquivado(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    pedido = models.ForeignKey(PedidoArquivado, on_delete=models.CASCADE, related_name='anexos')
+    arquivo = models.FileField(upload_to='arquivos_protese/%Y/%m/')
+    descricao = models.CharField(max_length=100, blank=True, default="Arquivo STL")
+    uploaded_at = models.DateTimeField()
+    analise_status = models.CharField(max_length=20, choices=Anexo.ANALISE_CHOICES, default='PENDENTE')
+    analise_erro = models.TextField(blank=True, default="")
+    triangulos = models.PositiveIntegerField(null=True, blank=True)
+    vertices = models.PositiveIntegerField(null=True, blank=True)
+    caixa_delimitadora = models.JSONField(null=True, blank=True, verbose_name="Caixa Delimitadora (mm)")
+    area_superficie = models.FloatField(null=True, blank=True, verbose_name="Área de Superfície (mm²)")
+    estanque = models.BooleanField(null=True, blank=True, verbose_name="Malha Fechada")
+    previa = models.FileField(upload_to='previas/%Y/%m/', null=True, blank=True)
+
+    dimensoes = Anexo.dimensoes
+
     def __str__(self):
-        return f"Anexo do Pedido #{self.pedido.id}"
\ No newline at end of file
+        return f"Anexo arquivado do Pedido #{self.pedido_id}"
@@ -0,0 +1,85 @@
+import json
+
+from django.db.models import Count
+
+# Numeração FDI: permanentes (quadrantes 1-4) e decíduos (5-8).
+DENTES_VALIDOS = frozenset(
+    [q * 10 + d for q in (1, 2, 3, 4) for d in range(1, 9)]
+    + [q * 10 + d for q in (5, 6, 7, 8) for d in range(1, 6)]
+)
+
+
+class OdontogramaInvalido(ValueError):
+    pass
+
+
+def interpretar_elementos(texto):
+    """Converte o JSON do odontograma em ``{dente: procedimento}`` validado."""
+    from .models import ElementoPedido
+
+    if not texto or not texto.strip():
+        return {}
+    try:
+        bruto = json.loads(texto)
+    except (TypeError, ValueError):
+        raise OdontogramaInvalido("O odontograma enviado não é um JSON válido.")
+    if not isinstance(bruto, dict):
+        raise OdontogramaInvalido("O odontograma deve mapear dentes para procedimentos.")
+
+    procedimentos = dict(ElementoPedido.PROCEDIMENTO_CHOICES)
+    mapa = {}
+    for dente, procedimento in bruto.items():
+        try:
+            numero = int(dente)
+        except (TypeError, ValueError):
+            numero = None
+        if numero not in DENTES_VALIDOS:
+            raise OdontogramaInvalido(f"Dente inválido no odontograma: {dente}.")
+        if procedimento not in procedimentos:
+            raise OdontogramaInvalido(f"Procedimento inválido para o dente {dente}: {procedimento}.")
+        mapa[numero] = procedimento
+    return mapa
+
+
+def serializar_elementos(mapa):
+    return json.dumps({str(dente): mapa[dente] for dente in sorted(mapa)})
+
+
+def sincronizar_elementos(pedido):
+    from .models import ElementoPedido
+
+    try:
+        mapa = interpretar_elementos(pedido.elementos)
+    except OdontogramaInvalido:
+        # Registros antigos com texto inválido simplesmente não geram linhas.
+        mapa = {}
+
+    atuais = dict(
+        ElementoPedido.objects.filter(pedido=pedido).values_list('dente', 'procedimento')
+    )
+    if atuais == mapa:
+        return
+
+    removidos = [dente for dente in atuais if dente not in mapa]
+    if removidos:
+        ElementoPedido.objects.filter(pedido=pedido, dente__in=removidos).delete()
+    for dente, procedimento in mapa.items():
+        if dente in atuais and atuais[dente] != procedimento:
+            ElementoPedido.objects.filter(pedido=pedido, dente=dente).update(procedimento=procedimento)
+    ElementoPedido.objects.bulk_create([
+        ElementoPedido(pedido=pedido, dente=dente, procedimento=procedimento)
+        for dente, procedimento in mapa.items() if dente not in atuais
+    ])
+
+
+def carga_por_dente(queryset_elementos=None):
+    """Quantidade de elementos por (dente, procedimento), calculada no banco."""
+    from .models import ElementoPedido
+
+    if queryset_elementos is None:
+        queryset_elementos = ElementoPedido.objects.all()
+    return (
+        queryset_elementos.values('dente', 'procedimento')
+        .annotate(total=Count('pk'))
+        .order_by('dente', 'procedimento')
+    )
@@ -0,0 +1,172 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+TAMANHO_PAGINA = 25
+
+
+class Pagina:
+    def __init__(self, itens, cursor_proximo=None, cursor_anterior=None):
+        self.itens = itens
+        self.cursor_proximo = cursor_proximo
+        self.cursor_anterior = cursor_anterior
+        self.url_proxima = None
+        self.url_anterior = None
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+    @property
+    def tem_proxima(self):
+        return self.cursor_proximo is not None
+
+    @property
+    def tem_anterior(self):
+        return self.cursor_anterior is not None
+
+
+def _codificar(direcao, valor, pk):
+    bruto = json.dumps([direcao, valor, pk], default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip('=')
+
+
+def _decodificar(cursor):
+    try:
+        preenchido = cursor + '=' * (-len(cursor) % 4)
+        direcao, valor, pk = json.loads(base64.urlsafe_b64decode(preenchido.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if direcao not in ('p', 'a') or not isinstance(pk, int):
+        return None
+    return direcao, valor, pk
+
+
+def _apos(campo, desc, nulos_no_fim, valor, pk):
+    # Condição "vem depois de (valor, pk)" na ordenação (campo, pk) informada.
+    op = 'lt' if desc else 'gt'
+    depois_do_pk = Q(**{f'pk__{op}': pk})
+
+    if campo == 'pk':
+        return depois_do_pk
+
+    if valor is None:
+        mesmo_valor = Q(**{f'{campo}__isnull': True}) & depois_do_pk
+        if nulos_no_fim:
+            return mesmo_valor
+        return mesmo_valor | Q(**{f'{campo}__isnull': False})
+
+    condicao = Q(**{f'{campo}__{op}': valor}) | (Q(**{campo: valor}) & depois_do_pk)
+    if nulos_no_fim:
+        condicao |= Q(**{f'{campo}__isnull': True})
+    return condicao
+
+
+def _ordenacao(campo, desc, nulos_no_fim, anulavel):
+    if campo == 'pk':
+        return ['-pk' if desc else 'pk']
+    expressao = F(campo).desc if desc else F(campo).asc
+    if anulavel:
+        expressao = expressao(nulls_last=True) if nulos_no_fim else expressao(nulls_first=True)
+    else:
+        expressao = expressao()
+    return [expressao, '-pk' if desc else 'pk']
+
+
+def _consulta_da_pagina(queryset, ordem, cursor):
+    desc = ordem.startswith('-')
+    campo = ordem.lstrip('-')
+    if campo in ('id', queryset.model._meta.pk.name):
+        campo = 'pk'
+
+    modelo_campo = None if campo == 'pk' else queryset.model._meta.get_field(campo)
+    anulavel = bool(modelo_campo and modelo_campo.null)
+
+    dados_cursor = _decodificar(cursor) if cursor else None
+    if dados_cursor and modelo_campo is not None and dados_cursor[1] is not None:
+        direcao, valor, pk = dados_cursor
+        try:
+            dados_cursor = direcao, modelo_campo.to_python(valor), pk
+        except ValidationError:
+            dados_cursor = None
+    voltando = bool(dados_cursor and dados_cursor[0] == 'a')
+
+    # Páginas anteriores são lidas na ordem inversa e depois reviradas.
+    # NULL é tratado como o menor valor, como o SQLite já indexa.
+    desc_consulta = desc != voltando
+    nulos_no_fim = desc_consulta
+
+    qs = queryset.order_by(*_ordenacao(campo, desc_consulta, nulos_no_fim, anulavel))
+    if dados_cursor:
+        _, valor, pk = dados_cursor
+        qs = qs.filter(_apos(campo, desc_consulta, nulos_no_fim, valor, pk))
+    return qs, campo, dados_cursor, voltando
+
+
+def _montar_pagina(itens, tamanho, campo, dados_cursor, voltando):
+    ha_mais = len(itens) > tamanho
+    itens = itens[:tamanho]
+    if voltando:
+        itens.reverse()
+
+    def chave(obj):
+        valor = obj.pk if campo == 'pk' else getattr(obj, campo)
+        return valor, obj.pk
+
+    cursor_proximo = cursor_anterior = None
+    if itens:
+        if voltando:
+            cursor_proximo = _codificar('p', *chave(itens[-1]))
+            if ha_mais:
+                cursor_anterior = _codificar('a', *chave(itens[0]))
+        else:
+            if ha_mais:
+                cursor_proximo = _codificar('p', *chave(itens[-1]))
+            if dados_cursor:
+                cursor_anterior = _codificar('a', *chave(itens[0]))
+
+    return Pagina(itens, cursor_proximo, cursor_anterior)
+
+
+def paginar_por_cursor(queryset, ordem, cursor=None, tamanho=TAMANHO_PAGINA):
+    """Pagina ``queryset`` por keyset sobre (``ordem``, pk).
+
+    ``ordem`` segue a sintaxe de ``order_by`` ('campo' ou '-campo'). O custo de
+    cada página não depende da sua posição, ao contrário de OFFSET.
+    """
+    qs, campo, dados_cursor, voltando = _consulta_da_pagina(queryset, ordem, cursor)
+    return _montar_pagina(list(qs[:tamanho + 1]), tamanho, campo, dados_cursor, voltando)
+
+
+async def apaginar_por_cursor(queryset, ordem, cursor=None, tamanho=TAMANHO_PAGINA):
+    qs, campo, dados_cursor, voltando = _consulta_da_pagina(queryset, ordem, cursor)
+    itens = [obj async for obj in qs[:tamanho + 1]]
+    return _montar_pagina(itens, tamanho, campo, dados_cursor, voltando)
+
+
+def _urls_da_pagina(request, pagina):
+    def url_para(cursor):
+        params = request.GET.copy()
+        params['cursor'] = cursor
+        return '?' + params.urlencode()
+
+    if pagina.tem_proxima:
+        pagina.url_proxima = url_para(pagina.cursor_proximo)
+    if pagina.tem_anterior:
+        pagina.url_anterior = url_para(pagina.cursor_anterior)
+    return pagina
+
+
+def paginar_request(request, queryset, ordem, tamanho=TAMANHO_PAGINA):
+    pagina = paginar_por_cursor(queryset, ordem, request.GET.get('cursor'), tamanho)
+    return _urls_da_pagina(request, pagina)
+
+
+async def apaginar_request(request, queryset, ordem, tamanho=TAMANHO_PAGINA):
+    pagina = await apaginar_por_cursor(queryset, ordem, request.GET.get('cursor'), tamanho)
+    return _urls_da_pagina(request, pagina)
@@ -0,0 +1,114 @@
+"""Reconciliação entre os arquivos em ``MEDIA_ROOT`` e os registros do banco.
+
+A árvore é percorrida com ``os.scandir`` sem montar a lista inteira na memória;
+os nomes seguem em lotes e cada lote custa uma consulta ``IN`` por coluna que
+guarda caminhos.
+"""
+import os
+import shutil
+import time
+from itertools import islice
+
+from django.core.files.storage import default_storage
+
+from .models import (
+    Anexo, AnexoArquivado, ArquivoArmazenado, Pedido, PedidoArquivado, UploadArquivo,
+)
+from .storage import PASTA_BLOBS, SUFIXOS_BLOB
+
+PASTAS_MIDIA = ('arquivos_protese', 'entregas', 'previas')
+TAMANHO_LOTE_RECONCILIACAO = 500
+
+# Colunas que apontam para arquivos; uploads em andamento também contam.
+REFERENCIAS = (
+    (Anexo, ('arquivo', 'previa')),
+    (AnexoArquivado, ('arquivo', 'previa')),
+    (Pedido, ('arquivo_entregavel',)),
+    (PedidoArquivado, ('arquivo_entregavel',)),
+    (UploadArquivo, ('caminho',)),
+)
+
+
+def _percorrer(raiz, pasta, antes_de):
+    """Arquivos sob ``pasta`` modificados antes de ``antes_de``: ``(nome, tamanho)``."""
+    pendentes = [os.path.join(raiz, pasta)]
+    while pendentes:
+        try:
+            entradas = os.scandir(pendentes.pop())
+        except FileNotFoundError:
+            continue
+        with entradas:
+            for entrada in entradas:
+                if entrada.is_dir(follow_symlinks=False):
+                    pendentes.append(entrada.path)
+                elif entrada.is_file(follow_symlinks=False):
+                    estado = entrada.stat(follow_symlinks=False)
+                    # Recentes podem ser uploads cujo registro ainda não foi gravado.
+                    if estado.st_mtime < antes_de:
+                        nome = os.path.relpath(entrada.path, raiz).replace(os.sep, '/')
+                        yield nome, estado.st_size
+
+
+def _lotes(iteravel, tamanho):
+    iterador = iter(iteravel)
+    while lote := dict(islice(iterador, tamanho)):
+        yield lote
+
+
+def _referenciados(nomes):
+    encontrados = set()
+    for modelo, campos in REFERENCIAS:
+        for campo in campos:
+            encontrados.update(
+                modelo.objects.filter(**{f'{campo}__in': nomes}).values_list(campo, flat=True)
+            )
+    return encontrados
+
+
+def _blobs_em_uso(nomes):
+    # Blob = blobs/ab/cd/<sha256><sufixo do codec>; fica enquanto algum nome
+    # registrado usa o mesmo hash e codec.
+    codecs = {sufixo: codec for codec, sufixo in SUFIXOS_BLOB.items() if sufixo}
+    chaves = {}
+    for nome in nomes:
+        base, sufixo = os.path.splitext(nome.rsplit('/', 1)[-1])
+        chaves[(base, codecs.get(sufixo, ''))] = nome
+    em_uso = (
+        ArquivoArmazenado.objects
+        .filter(sha256__in={sha for sha, _ in chaves})
+        .values_list('sha256', 'codec')
+    )
+    return {chaves[chave] for chave in em_uso if chave in chaves}
+
+
+def encontrar_orfaos(raiz, idade_minima=24 * 3600, lote=TAMANHO_LOTE_RECONCILIACAO):
+    """Gera ``(nome, tamanho)`` de cada arquivo que nenhum registro referencia."""
+    antes_de = time.time() - idade_minima
+    verificacoes = [(pasta, _referenciados) for pasta in PASTAS_MIDIA]
+    verificacoes.append((PASTA_BLOBS, _blobs_em_uso))
+    for pasta, em_uso in verificacoes:
+        for arquivos in _lotes(_percorrer(raiz, pasta, antes_de), lote):
+            usados = em_uso(list(arquivos))
+            for nome, tamanho in arquivos.items():
+                if nome not in usados:
+                    yield nome, tamanho
+
+
+def descartar(raiz, nome, quarentena=None):
+    """Apaga o órfão ou, com ``quarentena``, move-o para lá mantendo o caminho."""
+    caminho = os.path.join(raiz, nome)
+    if quarentena:
+        destino = os.path.join(quarentena, nome)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        try:
+            os.link(caminho, destino)
+        except OSError:
+            shutil.copy2(caminho, destino)
+    if nome.startswith(PASTA_BLOBS + '/'):
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+    else:
+        # Pelo storage: no deduplicado, leva junto o registro e o blob sem uso.
+        default_storage.delete(nome)
@@ -0,0 +1,137 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from .arquivamento import em_movimento
+from .busca import esquecer_fts, indexar_pedido, remover_pedido
+from .eventos import registrar_evento
+from .fila import enfileirar
+from .kpis import invalidar_kpis
+from .odontograma import sincronizar_elementos
+from .models import Anexo, AnexoArquivado, Pedido, PedidoArquivado, PedidoEvento
+from .tarefas import analisar_anexo, liberar_arquivo
+from .transmissao import publicar_pedido
+
+
+@receiver(post_save, sender=Pedido)
+@receiver(post_delete, sender=Pedido)
+def pedido_alterado(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidar_kpis(instance))
+
+
+@receiver(pre_save, sender=Pedido)
+def pedido_antes_de_salvar(sender, instance, raw=False, **kwargs):
+    # Instâncias que não vieram do banco (ex.: montadas com pk) consultam o status salvo.
+    if raw or instance._state.adding or hasattr(instance, '_status_salvo'):
+        return
+    salvo = Pedido.objects.filter(pk=instance.pk).values_list('status', 'cadista_id', 'arquivo_entregavel').first()
+    instance._status_salvo, instance._cadista_salvo, instance._entregavel_salvo = salvo or (None, None, None)
+
+
+@receiver(post_save, sender=Pedido)
+def pedido_salvo_evento(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    anterior = '' if created else getattr(instance, '_status_salvo', None)
+    cadista_anterior = None if created else getattr(instance, '_cadista_salvo', instance.cadista_id)
+    if anterior != instance.status:
+        registrar_evento(instance, anterior, instance.status)
+    if anterior != instance.status or cadista_anterior != instance.cadista_id:
+        publicar_pedido(instance, anterior, cadista_anterior)
+    instance._status_salvo = instance.status
+    instance._cadista_salvo = instance.cadista_id
+
+
+@receiver(post_save, sender=Pedido)
+def pedido_salvo_busca(sender, instance, raw=False, **kwargs):
+    if not raw:
+        indexar_pedido(instance)
+
+
+@receiver(post_save, sender=Pedido)
+def pedido_salvo_odontograma(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'elementos' not in update_fields):
+        return
+    sincronizar_elementos(instance)
+
+
+@receiver(post_delete, sender=Pedido)
+def pedido_removido_busca(sender, instance, **kwargs):
+    remover_pedido(instance.pk)
+
+
+@receiver(post_migrate)
+def migracao_aplicada_busca(sender, using=None, **kwargs):
+    # Um migrate para trás pode ter removido a tabela FTS.
+    esquecer_fts(using)
+
+
+@receiver(post_delete, sender=Pedido)
+@receiver(post_delete, sender=PedidoArquivado)
+def pedido_removido_eventos(sender, instance, **kwargs):
+    # Sem cascata no banco (ver PedidoEvento.pedido): o histórico sai aqui, em
+    # qualquer caminho de exclusão, menos quando o pedido só troca de tabela.
+    if not em_movimento():
+        PedidoEvento.objects.filter(pedido_id=instance.pk).delete()
+
+
+def _liberar_nome(nome):
+    """Apaga do storage um arquivo que deixou de ser referenciado.
+
+    ``REMOVER_ARQUIVOS_ORFAOS``: 'fila' (tarefa gravada na mesma transação),
+    'commit' (na própria requisição, depois do commit) ou '' (só pelo
+    ``reconciliar_midia``). ``liberar_arquivo`` confere as referências antes.
+    """
+    modo = getattr(settings, 'REMOVER_ARQUIVOS_ORFAOS', 'fila')
+    if not nome or not modo:
+        return
+    if modo == 'commit':
+        transaction.on_commit(lambda: liberar_arquivo(nome))
+    else:
+        enfileirar(liberar_arquivo, nome=nome)
+
+
+def _liberar_arquivo(arquivo):
+    if arquivo:
+        _liberar_nome(arquivo.name)
+
+
+def _liberar_substituido(instance, campo, atributo, raw, update_fields):
+    # Arquivo trocado (ex.: entrega reenviada ao finalizar de novo): o anterior sobra.
+    if raw or (update_fields is not None and campo not in update_fields):
+        return
+    anterior = getattr(instance, atributo, None)
+    atual = getattr(instance, campo).name or None
+    if anterior and anterior != atual:
+        _liberar_nome(anterior)
+    setattr(instance, atributo, atual)
+
+
+@receiver(post_save, sender=Anexo)
+def anexo_criado(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw and instance.analise_status == 'PENDENTE':
+        enfileirar(analisar_anexo, anexo_id=instance.pk)
+
+
+@receiver(post_save, sender=Anexo)
+def anexo_salvo_arquivo(sender, instance, raw=False, update_fields=None, **kwargs):
+    _liberar_substituido(instance, 'previa', '_previa_salva', raw, update_fields)
+
+
+@receiver(post_save, sender=Pedido)
+def pedido_salvo_arquivo(sender, instance, raw=False, update_fields=None, **kwargs):
+    _liberar_substituido(instance, 'arquivo_entregavel', '_entregavel_salvo', raw, update_fields)
+
+
+@receiver(post_delete, sender=Anexo)
+@receiver(post_delete, sender=AnexoArquivado)
+def anexo_removido(sender, instance, **kwargs):
+    _liberar_arquivo(instance.arquivo)
+    _liberar_arquivo(instance.previa)
+
+
+@receiver(post_delete, sender=Pedido)
+@receiver(post_delete, sender=PedidoArquivado)
+def pedido_removido_arquivo(sender, instance, **kwargs):
+    _liberar_arquivo(instance.arquivo_entregavel)
@@ -0,0 +1,205 @@
+import contextlib
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+PASTA_BLOBS = 'blobs'
+TAMANHO_LEITURA = 64 * 1024
+
+CODEC_GZIP = 'gzip'
+# Sufixo do blob por codec: o mesmo conteúdo cru e comprimido não se misturam.
+SUFIXOS_BLOB = {'': '', CODEC_GZIP: '.gz'}
+EXTENSOES_COMPRIMIDAS = ('.stl', '.ply', '.obj')
+NIVEL_GZIP = 6
+
+
+def _comprimindo(f, codec):
+    if codec == CODEC_GZIP:
+        # mtime=0: o mesmo conteúdo gera sempre os mesmos bytes.
+        return gzip.GzipFile(fileobj=f, mode='wb', compresslevel=NIVEL_GZIP, mtime=0)
+    return contextlib.nullcontext(f)
+
+
+class ArmazenamentoDeduplicado(FileSystemStorage):
+    """Guarda cada conteúdo uma única vez, sob o seu SHA-256.
+
+    O blob fica em ``blobs/ab/cd/<sha256>`` e cada nome salvo pelo Django é um
+    hard link para ele, então caminhos, URLs e ``path()`` continuam iguais. A
+    tabela ``ArquivoArmazenado`` liga cada nome ao seu hash; o blob é apagado
+    quando o último nome que aponta para ele é removido.
+    """
+
+    def caminho_blob(self, sha256, codec=''):
+        return self.path(os.path.join(PASTA_BLOBS, sha256[:2], sha256[2:4], sha256 + SUFIXOS_BLOB[codec]))
+
+    def codec_para(self, name):
+        """Codec com que um arquivo novo chamado ``name`` é gravado."""
+        return ''
+
+    def registro(self, name):
+        from .models import ArquivoArmazenado
+
+        return ArquivoArmazenado.objects.filter(nome=name).first()
+
+    def codec(self, name):
+        """Codec do arquivo já gravado; '' quando está cru no disco."""
+        from .models import ArquivoArmazenado
+
+        return ArquivoArmazenado.objects.filter(nome=name).values_list('codec', flat=True).first() or ''
+
+    def _pasta_temporaria(self):
+        pasta = self.path(os.path.join(PASTA_BLOBS, 'tmp'))
+        os.makedirs(pasta, exist_ok=True)
+        return pasta
+
+    def _gravar_blob(self, content, codec=''):
+        sha = hashlib.sha256()
+        tamanho = 0
+
+        if hasattr(content, 'temporary_file_path') and not codec:
+            with open(content.temporary_file_path(), 'rb') as f:
+                for bloco in iter(lambda: f.read(TAMANHO_LEITURA), b''):
+                    sha.update(bloco)
+                    tamanho += len(bloco)
+            temporario = content.temporary_file_path()
+            mover = True
+        else:
+            fd, temporario = tempfile.mkstemp(dir=self._pasta_temporaria())
+            with os.fdopen(fd, 'wb') as f, _comprimindo(f, codec) as destino:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for bloco in content.chunks():
+                    if isinstance(bloco, str):
+                        bloco = bloco.encode()
+                    sha.update(bloco)
+                    destino.write(bloco)
+                    tamanho += len(bloco)
+            mover = False
+
+        digest = sha.hexdigest()
+        blob = self.caminho_blob(digest, codec)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            try:
+                if mover:
+                    file_move_safe(temporario, blob)
+                else:
+                    os.link(temporario, blob)
+            except FileExistsError:
+                pass
+        if not mover:
+            os.unlink(temporario)
+        return digest, tamanho, os.path.getsize(blob)
+
+    def _ligar(self, blob, destino):
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        try:
+            os.link(blob, destino)
+        except OSError as erro:
+            if isinstance(erro, FileExistsError):
+                raise
+            # Sistema de arquivos sem hard link: cai para cópia.
+            shutil.copyfile(blob, destino)
+
+    def _save(self, name, content):
+        codec = self.codec_para(name)
+        digest, tamanho, armazenado = self._gravar_blob(content, codec)
+        blob = self.caminho_blob(digest, codec)
+
+        while True:
+            try:
+                self._ligar(blob, self.path(name))
+            except FileExistsError:
+                name = self.get_available_name(name)
+            else:
+                break
+
+        name = os.path.relpath(self.path(name), self.location).replace('\\', '/')
+        self._registrar(name, digest, tamanho, codec, armazenado)
+        return name
+
+    def adotar(self, name, sha256):
+        """Troca um arquivo já gravado em ``name`` por um link para o seu blob."""
+        caminho = self.path(name)
+        codec = self.codec_para(name)
+        blob = self.caminho_blob(sha256, codec)
+        tamanho = os.path.getsize(caminho)
+
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        if codec:
+            if not os.path.exists(blob):
+                with open(caminho, 'rb') as f:
+                    self._gravar_blob(File(f), codec)
+            existente = True
+        else:
+            try:
+                os.link(caminho, blob)
+                existente = False
+            except FileExistsError:
+                existente = True
+        if existente:
+            # Conteúdo repetido (ou comprimido): o nome passa a apontar para o blob.
+            temporario = caminho + '.dedup'
+            self._ligar(blob, temporario)
+            os.replace(temporario, caminho)
+
+        self._registrar(name, sha256, tamanho, codec, os.path.getsize(blob))
+
+    def _registrar(self, name, sha256, tamanho, codec='', armazenado=None):
+        from .models import ArquivoArmazenado
+
+        ArquivoArmazenado.objects.update_or_create(
+            nome=name, defaults={
+                'sha256': sha256, 'tamanho': tamanho, 'codec': codec,
+                'tamanho_armazenado': tamanho if armazenado is None else armazenado,
+            },
+        )
+
+    def _open(self, name, mode='rb'):
+        registro = self.registro(name)
+        if registro is not None and registro.codec == CODEC_GZIP and 'w' not in mode and '+' not in mode:
+            arquivo = File(gzip.open(self.path(name), 'rb'), name)
+            # Sem isso File.size mediria o arquivo comprimido no disco.
+            arquivo.size = registro.tamanho
+            return arquivo
+        return super()._open(name, mode)
+
+    def size(self, name):
+        registro = self.registro(name)
+        if registro is not None and registro.codec:
+            return registro.tamanho
+        return super().size(name)
+
+    def delete(self, name):
+        from .models import ArquivoArmazenado
+
+        registro = ArquivoArmazenado.objects.filter(nome=name).first()
+        super().delete(name)
+        if registro is None:
+            return
+
+        registro.delete()
+        if not ArquivoArmazenado.objects.filter(sha256=registro.sha256, codec=registro.codec).exists():
+            try:
+                os.remove(self.caminho_blob(registro.sha256, registro.codec))
+            except FileNotFoundError:
+                pass
+
+
+class ArmazenamentoComprimido(ArmazenamentoDeduplicado):
+    """Deduplicado, e malhas (STL, PLY, OBJ) gravadas com gzip.
+
+    ``open()`` e ``size()`` devolvem o conteúdo original; ``path()`` aponta
+    para os bytes comprimidos, que ``downloads`` repassa com
+    ``Content-Encoding: gzip`` a quem aceita. O codec e os dois tamanhos ficam
+    em ``ArquivoArmazenado``.
+    """
+
+    def codec_para(self, name):
+        return CODEC_GZIP if name.lower().endswith(EXTENSOES_COMPRIMIDAS) else ''
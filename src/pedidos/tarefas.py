@@ -0,0 +1,25 @@
+from django.core.files.storage import default_storage
+from django.db.models import Q
+
+from .fila import tarefa
+from .models import Anexo, AnexoArquivado, Pedido, PedidoArquivado
+
+
+@tarefa(nome='analisar_anexo')
+def analisar_anexo(anexo_id):
+    from .analise import analisar_anexo as analisar
+
+    analisar(anexo_id)
+
+
+@tarefa(nome='liberar_arquivo', prioridade=-10)
+def liberar_arquivo(nome):
+    # Outro registro pode apontar para o mesmo nome (ex.: cópia pelo admin ou
+    # o mesmo pedido, agora no arquivo).
+    referencia = Q(arquivo=nome) | Q(previa=nome)
+    if (Anexo.objects.filter(referencia).exists()
+            or AnexoArquivado.objects.filter(referencia).exists()
+            or Pedido.objects.filter(arquivo_entregavel=nome).exists()
+            or PedidoArquivado.objects.filter(arquivo_entregavel=nome).exists()):
+        return
+    default_storage.delete(nome)
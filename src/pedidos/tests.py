@@ -1,6 +1,32 @@
-from django.test import TestCase
+import asyncio
+
+from django.test import TestCase, override_settings
 from .models import Usuario, Pedido
 
+
+class MidiaTemporariaMixin:
+    """MEDIA_ROOT numa pasta temporária própria de cada teste."""
+
+    def setUp(self):
+        import tempfile
+
+        super().setUp()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.configurar(MEDIA_ROOT=self.media.name)
+
+    def configurar(self, **configuracoes):
+        configuracao = override_settings(**configuracoes)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def criar_pedido(self, usuario, **campos):
+        self.dentista = Usuario.objects.create(username=usuario, tipo_usuario='DENTISTA')
+        campos = {'nome_paciente': "Paciente", 'tipo_servico': "Coroa", 'dentes': "11", **campos}
+        self.pedido = Pedido.objects.create(dentista=self.dentista, **campos)
+        return self.pedido
+
+
 class PedidoModelTest(TestCase):
     
     def setUp(self):
@@ -23,4 +49,1877 @@ class PedidoModelTest(TestCase):
         self.assertIsNotNone(pedido.id)
         self.assertEqual(pedido.nome_paciente, "Teste da Silva")
         self.assertEqual(pedido.status, "PENDENTE")
-        print("\n✅ Teste de Criação de Pedido: PASSOU!")
\ No newline at end of file
+        print("\n✅ Teste de Criação de Pedido: PASSOU!")
+
+class PaginacaoCursorTest(TestCase):
+
+    def setUp(self):
+        from datetime import date, timedelta
+        self.dentista = Usuario.objects.create(username='doutor_pagina', tipo_usuario='DENTISTA')
+        nomes = ['Ana', 'Bruno', 'Ana', 'Carla', 'Bruno', 'Davi', 'Ana']
+        status = ['PENDENTE', 'APROVADO', 'PENDENTE', 'CONCLUIDO', 'EM_PRODUCAO', 'PENDENTE', 'APROVADO']
+        for i, nome in enumerate(nomes):
+            Pedido.objects.create(
+                dentista=self.dentista,
+                nome_paciente=nome,
+                tipo_servico="Coroa",
+                dentes="11",
+                status=status[i],
+                data_entrega_prevista=None if i % 3 == 0 else date(2026, 1, 1) + timedelta(days=i % 2),
+            )
+
+    def test_percorre_todas_as_ordens_sem_repetir(self):
+        from .paginacao import paginar_por_cursor
+
+        for ordem in ['id', '-id', 'nome_paciente', '-nome_paciente',
+                      'data_entrega_prevista', '-data_entrega_prevista', 'status']:
+            paginas = []
+            cursor = None
+            while True:
+                pagina = paginar_por_cursor(Pedido.objects.all(), ordem, cursor, tamanho=2)
+                paginas.append([p.id for p in pagina])
+                if not pagina.tem_proxima:
+                    break
+                cursor = pagina.cursor_proximo
+
+            ids = [i for pagina in paginas for i in pagina]
+            self.assertEqual(len(ids), 7, ordem)
+            self.assertEqual(len(set(ids)), 7, ordem)
+
+            voltando = []
+            while pagina.tem_anterior:
+                pagina = paginar_por_cursor(Pedido.objects.all(), ordem, pagina.cursor_anterior, tamanho=2)
+                voltando.insert(0, [p.id for p in pagina])
+            self.assertEqual(voltando, paginas[:-1], ordem)
+
+    def test_cursor_invalido_volta_para_primeira_pagina(self):
+        from .paginacao import paginar_por_cursor
+
+        pagina = paginar_por_cursor(Pedido.objects.all(), '-id', 'lixo!!', tamanho=3)
+        self.assertEqual(len(pagina), 3)
+        self.assertFalse(pagina.tem_anterior)
+
+
+class KpisDashboardTest(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.dentista = Usuario.objects.create(username='doutor_kpi', tipo_usuario='DENTISTA')
+        for status in ['PENDENTE', 'PENDENTE', 'RETRABALHO', 'APROVADO']:
+            Pedido.objects.create(
+                dentista=self.dentista, nome_paciente="Paciente", tipo_servico="Coroa",
+                dentes="11", status=status,
+            )
+
+    def test_uma_consulta_para_todos_os_status(self):
+        from asgiref.sync import async_to_sync
+        from .kpis import akpis_do_usuario
+
+        with self.assertNumQueries(1):
+            kpis = async_to_sync(akpis_do_usuario)('gestor', None, Pedido.objects.all())
+        self.assertEqual(kpis['PENDENTE'], 2)
+        self.assertEqual(kpis['RETRABALHO'], 1)
+        self.assertEqual(kpis['EM_PRODUCAO'], 0)
+
+    def test_cache_invalidado_ao_salvar_pedido(self):
+        from asgiref.sync import async_to_sync
+        from .kpis import akpis_do_usuario
+
+        kpis_do_usuario = async_to_sync(akpis_do_usuario)
+        qs = Pedido.objects.filter(dentista=self.dentista)
+        self.assertEqual(kpis_do_usuario('dentista', self.dentista, qs)['APROVADO'], 1)
+        with self.assertNumQueries(0):
+            kpis_do_usuario('dentista', self.dentista, qs)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Pedido.objects.create(
+                dentista=self.dentista, nome_paciente="Novo", tipo_servico="Coroa",
+                dentes="11", status='APROVADO',
+            )
+        self.assertEqual(kpis_do_usuario('dentista', self.dentista, qs)['APROVADO'], 2)
+
+    def test_cadistas_invalidados_pela_geracao(self):
+        from asgiref.sync import async_to_sync
+        from .kpis import akpis_do_usuario
+
+        kpis_do_usuario = async_to_sync(akpis_do_usuario)
+        cadista = Usuario.objects.create(username='cadista_kpi', tipo_usuario='CADISTA')
+        qs = Pedido.objects.filter(status='PENDENTE')
+        self.assertEqual(kpis_do_usuario('cadista', cadista, qs)['PENDENTE'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Pedido.objects.create(
+                dentista=self.dentista, nome_paciente="Novo", tipo_servico="Coroa", dentes="11",
+            )
+        self.assertEqual(kpis_do_usuario('cadista', cadista, qs)['PENDENTE'], 3)
+
+
+class PlanoConsultaTest(TestCase):
+    # Falha se alguma consulta das telas principais voltar a varrer
+    # pedidos_pedido inteira (SCAN sem índice).
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.gestor = Usuario.objects.create(username='gestor_plano', tipo_usuario='GESTOR')
+        self.cadista = Usuario.objects.create(username='cadista_plano', tipo_usuario='CADISTA')
+        self.dentista = Usuario.objects.create(username='doutor_plano', tipo_usuario='DENTISTA')
+        for i in range(30):
+            Pedido.objects.create(
+                dentista=self.dentista, nome_paciente=f"Paciente {i}", tipo_servico="Coroa",
+                dentes="11", status=['PENDENTE', 'EM_PRODUCAO', 'APROVADO'][i % 3],
+                cadista=self.cadista if i % 3 else None,
+            )
+
+    def consultas_de_pedido(self, usuario, urls):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.force_login(usuario)
+        with CaptureQueriesContext(connection) as contexto:
+            for url in urls:
+                self.assertEqual(self.client.get(url).status_code, 200, url)
+        return [q['sql'] for q in contexto.captured_queries
+                if q['sql'].startswith('SELECT') and '"pedidos_pedido"' in q['sql']]
+
+    def assertSemVarreduraCompleta(self, consultas):
+        from django.db import connection
+
+        self.assertTrue(consultas)
+        with connection.cursor() as cursor:
+            for sql in consultas:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                for linha in cursor.fetchall():
+                    detalhe = linha[-1]
+                    varredura = detalhe.startswith('SCAN pedidos_pedido') and 'INDEX' not in detalhe
+                    # Percorrer a tabela pela chave primária com LIMIT e sem filtro
+                    # para no fim da página, não é varredura completa.
+                    pagina_por_pk = ' WHERE ' not in sql and ' LIMIT ' in sql
+                    if varredura and not pagina_por_pk:
+                        self.fail(f"Varredura completa em:\n{sql}\n{detalhe}")
+
+    def test_telas_usam_indices(self):
+        urls_dashboard = ['/dashboard/'] + [f'/dashboard/?status={s}' for s, _ in Pedido.STATUS_CHOICES]
+        urls_lista = ['/pedidos/'] + [f'/pedidos/?ordenar={o}' for o in
+                                      ['id', 'paciente', '-paciente', 'data', '-data', 'status']]
+        urls_lista += ['/pedidos/?busca=Paciente', '/pedidos/?busca=7']
+
+        self.assertSemVarreduraCompleta(self.consultas_de_pedido(self.gestor, urls_dashboard + urls_lista))
+        # Escopo do cadista na lista: cadista = ... OR status = 'PENDENTE', com e sem ordenar.
+        consultas_cadista = self.consultas_de_pedido(self.cadista, urls_dashboard + urls_lista)
+        escopo = [sql for sql in consultas_cadista if '"pedidos_pedido"."status" = \'PENDENTE\')' in sql]
+        self.assertGreaterEqual(len(escopo), len(urls_lista))
+        self.assertSemVarreduraCompleta(consultas_cadista)
+        self.assertSemVarreduraCompleta(self.consultas_de_pedido(self.dentista, urls_dashboard + urls_lista))
+
+    def test_fila_de_pendentes_sem_ordenacao_temporaria(self):
+        from django.db import connection
+        from .atribuicao import fila_pendentes
+
+        # Com os parâmetros de verdade: um índice parcial por status não serviria.
+        sql, parametros = fila_pendentes().values_list('pk', flat=True)[:10].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, parametros)
+            plano = ' '.join(linha[-1] for linha in cursor.fetchall())
+        self.assertIn('pedido_fila_idx', plano)
+        self.assertNotIn('TEMP B-TREE', plano)
+
+
+class BuscaPedidoTest(TestCase):
+
+    def setUp(self):
+        self.dentista = Usuario.objects.create(username='doutor_busca', tipo_usuario='DENTISTA')
+        self.joao = Pedido.objects.create(
+            dentista=self.dentista, nome_paciente="João Conceição", tipo_servico="Coroa",
+            dentes="11", observacoes="Cor difícil",
+        )
+        self.maria = Pedido.objects.create(
+            dentista=self.dentista, nome_paciente="Maria Souza", tipo_servico="Faceta", dentes="21",
+        )
+
+    def buscar(self, texto):
+        from .busca import filtrar_busca
+        return set(filtrar_busca(Pedido.objects.all(), texto).values_list('id', flat=True))
+
+    def test_busca_ignora_acentos_e_usa_prefixo(self):
+        self.assertEqual(self.buscar('joao concei'), {self.joao.id})
+        self.assertEqual(self.buscar('DIFICIL'), {self.joao.id})
+        self.assertEqual(self.buscar('faceta'), {self.maria.id})
+        self.assertEqual(self.buscar('"*)('), set())
+
+    def test_busca_numerica_e_exata_por_id(self):
+        self.assertEqual(self.buscar(str(self.maria.id)), {self.maria.id})
+        self.assertEqual(self.buscar(f'#{self.joao.id}'), {self.joao.id})
+
+    def test_tabela_criada_depois_passa_a_ser_usada(self):
+        from unittest import mock
+        from django.db import connection
+        from .busca import esquecer_fts, fts_disponivel
+        from .signals import migracao_aplicada_busca
+
+        # Processo que subiu antes do migrate: sem tabela FTS, cai no icontains.
+        esquecer_fts()
+        with mock.patch.object(connection.introspection, 'table_names', return_value=[]):
+            self.assertFalse(fts_disponivel())
+            self.assertEqual(self.buscar('souza'), {self.maria.id})
+        self.assertTrue(fts_disponivel())
+        with self.assertNumQueries(0):
+            self.assertTrue(fts_disponivel())
+
+        migracao_aplicada_busca(sender=None, using=connection.alias)
+        with self.assertNumQueries(1):
+            self.assertTrue(fts_disponivel())
+
+    def test_indice_acompanha_edicao_e_exclusao(self):
+        self.maria.nome_paciente = "Maria Antônia"
+        self.maria.save()
+        self.assertEqual(self.buscar('antonia'), {self.maria.id})
+        self.assertEqual(self.buscar('souza'), set())
+
+        self.maria.delete()
+        self.assertEqual(self.buscar('maria'), set())
+
+
+@override_settings(TAMANHO_MAXIMO_BLOCO_UPLOAD=1024)
+class UploadEmBlocosTest(MidiaTemporariaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.criar_pedido('doutor_upload')
+        self.client.force_login(self.dentista)
+
+    def enviar(self, upload_id, offset, dados):
+        return self.client.put(
+            f'/uploads/{upload_id}/', data=dados,
+            content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_upload_retomado_gera_anexo_com_hash(self):
+        import hashlib
+        from .models import UploadArquivo
+        from . import uploads
+
+        conteudo = bytes(range(256)) * 10
+        resposta = self.client.post(f'/pedidos/{self.pedido.id}/uploads/', {
+            'nome': 'arcada superior.stl', 'tamanho': len(conteudo),
+            'sha256': hashlib.sha256(conteudo).hexdigest(),
+        })
+        self.assertEqual(resposta.status_code, 201)
+        upload_id = resposta.json()['id']
+
+        self.assertEqual(self.enviar(upload_id, 0, conteudo[:1000]).json()['recebido'], 1000)
+        self.assertEqual(self.enviar(upload_id, 0, conteudo[:1000]).status_code, 409)
+        self.assertEqual(self.enviar(upload_id, 1000, conteudo[1000:3000]).status_code, 413)
+
+        # Simula outro processo: o hash parcial em memória não existe mais.
+        uploads._hashes.clear()
+        self.assertEqual(self.client.get(f'/uploads/{upload_id}/').json()['recebido'], 1000)
+        self.enviar(upload_id, 1000, conteudo[1000:2000])
+        final = self.enviar(upload_id, 2000, conteudo[2000:]).json()
+
+        self.assertTrue(final['concluido'])
+        self.assertEqual(final['sha256'], hashlib.sha256(conteudo).hexdigest())
+        anexo = UploadArquivo.objects.get(pk=upload_id).anexo
+        self.assertEqual(anexo.pedido, self.pedido)
+        with anexo.arquivo.open('rb') as f:
+            self.assertEqual(f.read(), conteudo)
+
+    def test_tamanho_acima_do_limite_e_recusado_antes_do_envio(self):
+        from django.test import override_settings
+
+        with override_settings(TAMANHO_MAXIMO_UPLOAD=100):
+            resposta = self.client.post(f'/pedidos/{self.pedido.id}/uploads/', {'nome': 'a.stl', 'tamanho': 101})
+        self.assertEqual(resposta.status_code, 413)
+
+    def test_bloco_concorrente_nao_escreve_no_arquivo(self):
+        import datetime
+        import os
+        from django.utils import timezone
+        from .models import UploadArquivo
+
+        upload_id = self.client.post(f'/pedidos/{self.pedido.id}/uploads/', {'nome': 'a.stl', 'tamanho': 10}).json()['id']
+        # Outro envio reservou o offset 0 e ainda está gravando.
+        UploadArquivo.objects.filter(pk=upload_id).update(recebendo_ate=timezone.now() + datetime.timedelta(minutes=5))
+
+        resposta = self.enviar(upload_id, 0, b'x' * 10)
+        self.assertEqual(resposta.status_code, 409)
+        upload = UploadArquivo.objects.get(pk=upload_id)
+        with open(os.path.join(self.media.name, upload.caminho), 'rb') as f:
+            self.assertEqual(f.read(), b'')
+
+        # Reserva vencida: o bloco é aceito.
+        UploadArquivo.objects.filter(pk=upload_id).update(recebendo_ate=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertTrue(self.enviar(upload_id, 0, b'x' * 10).json()['concluido'])
+
+    def test_uploads_abandonados_expiram(self):
+        import datetime
+        import os
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import UploadArquivo
+
+        ids = [
+            self.client.post(f'/pedidos/{self.pedido.id}/uploads/', {'nome': 'a.stl', 'tamanho': 10}).json()['id']
+            for _ in range(2)
+        ]
+        parado = UploadArquivo.objects.get(pk=ids[0])
+        UploadArquivo.objects.filter(pk=parado.pk).update(atualizado_em=timezone.now() - datetime.timedelta(days=3))
+
+        call_command('expirar_uploads', stdout=StringIO())
+
+        self.assertEqual([str(pk) for pk in UploadArquivo.objects.values_list('pk', flat=True)], ids[1:])
+        self.assertFalse(os.path.exists(os.path.join(self.media.name, parado.caminho)))
+
+
+class ArmazenamentoDeduplicadoTest(TestCase):
+
+    def setUp(self):
+        import tempfile
+        from .storage import ArmazenamentoDeduplicado
+
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.storage = ArmazenamentoDeduplicado(location=pasta.name)
+
+    def test_conteudo_repetido_ocupa_um_blob(self):
+        import os
+        from django.core.files.base import ContentFile
+        from .models import ArquivoArmazenado
+
+        a = self.storage.save('arquivos_protese/scan.stl', ContentFile(b'solid dente'))
+        b = self.storage.save('arquivos_protese/scan.stl', ContentFile(b'solid dente'))
+        self.assertNotEqual(a, b)
+        self.assertTrue(os.path.samefile(self.storage.path(a), self.storage.path(b)))
+
+        sha = ArquivoArmazenado.objects.get(nome=a).sha256
+        blob = self.storage.caminho_blob(sha)
+
+        self.storage.delete(a)
+        self.assertTrue(os.path.exists(blob))
+        with self.storage.open(b) as f:
+            self.assertEqual(f.read(), b'solid dente')
+
+        self.storage.delete(b)
+        self.assertFalse(os.path.exists(blob))
+        self.assertFalse(ArquivoArmazenado.objects.exists())
+
+
+class AnaliseMalhaTest(MidiaTemporariaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.criar_pedido('doutor_malha')
+
+    def cubo_stl(self):
+        import os
+        import numpy as np
+        from .malhas import escrever_stl_binario
+
+        vertices = np.array([[0, 0, 0], [10, 0, 0], [10, 10, 0], [0, 10, 0],
+                             [0, 0, 10], [10, 0, 10], [10, 10, 10], [0, 10, 10]], dtype=float)
+        faces = np.array([[0, 2, 1], [0, 3, 2], [4, 5, 6], [4, 6, 7], [0, 1, 5], [0, 5, 4],
+                          [1, 2, 6], [1, 6, 5], [2, 3, 7], [2, 7, 6], [3, 0, 4], [3, 4, 7]])
+        caminho = os.path.join(self.media.name, 'cubo.stl')
+        escrever_stl_binario(caminho, vertices, faces)
+        return caminho
+
+    def test_worker_preenche_metadados_do_anexo(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.core.files import File
+        from .analise import processar_lote
+        from .models import Anexo
+
+        with open(self.cubo_stl(), 'rb') as f:
+            anexo = Anexo(pedido=self.pedido)
+            anexo.arquivo.save('cubo.stl', File(f))
+        foto = Anexo.objects.create(pedido=self.pedido, arquivo='arquivos_protese/foto.jpg')
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            self.assertEqual(processar_lote(executor, 10), 2)
+
+        anexo.refresh_from_db()
+        self.assertEqual(anexo.analise_status, 'CONCLUIDA')
+        self.assertEqual((anexo.triangulos, anexo.vertices), (12, 8))
+        self.assertEqual(anexo.dimensoes, [10, 10, 10])
+        self.assertAlmostEqual(anexo.area_superficie, 600)
+        self.assertTrue(anexo.estanque)
+        self.assertTrue(anexo.previa)
+        foto.refresh_from_db()
+        self.assertEqual(foto.analise_status, 'IGNORADA')
+
+    def test_anexo_excluido_durante_a_analise(self):
+        import os
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        from unittest import mock
+        from django.core.files import File
+        from .analise import processar_lote
+        from .models import Anexo
+
+        anexos = []
+        for nome in ('a.stl', 'b.stl'):
+            with open(self.cubo_stl(), 'rb') as f:
+                anexo = Anexo(pedido=self.pedido)
+                anexo.arquivo.save(nome, File(f))
+                anexos.append(anexo)
+        excluido, mantido = anexos
+
+        def excluir_e_esperar(futuros):
+            # Depois da reserva, antes de gravar o resultado.
+            Anexo.objects.filter(pk=excluido.pk).delete()
+            return as_completed(futuros)
+
+        with ThreadPoolExecutor(max_workers=1) as executor, \
+                mock.patch('pedidos.analise.as_completed', side_effect=excluir_e_esperar):
+            self.assertEqual(processar_lote(executor, 10), 2)
+
+        mantido.refresh_from_db()
+        self.assertEqual(mantido.analise_status, 'CONCLUIDA')
+        previas = [nome for _, _, nomes in os.walk(self.media.name) for nome in nomes if '_previa' in nome]
+        self.assertEqual(previas, [os.path.basename(mantido.previa.name)])
+
+    def test_arquivo_corrompido_vira_erro(self):
+        import os
+        from .malhas import analisar_em_processo
+
+        caminho = os.path.join(self.media.name, 'quebrado.stl')
+        with open(caminho, 'wb') as f:
+            f.write(b'\x00' * 200)
+        resultado, erro = analisar_em_processo(caminho)
+        self.assertIsNone(resultado)
+        self.assertTrue(erro)
+
+    def test_ascii_e_faces_variaveis(self):
+        import os
+        import numpy as np
+        from .malhas import ler_malha
+
+        # Cubo com quadriláteros e um triângulo de sobra no meio, em PLY binário e ASCII.
+        vertices = [(0, 0, 0), (10, 0, 0), (10, 10, 0), (0, 10, 0),
+                    (0, 0, 10), (10, 0, 10), (10, 10, 10), (0, 10, 10)]
+        faces = [(0, 3, 2, 1), (4, 5, 6, 7), (0, 1, 2), (0, 1, 5, 4), (1, 2, 6, 5), (2, 3, 7, 6), (3, 0, 4, 7)]
+        esperado = [(0, 3, 2), (0, 2, 1), (4, 5, 6), (4, 6, 7), (0, 1, 2), (0, 1, 5), (0, 5, 4),
+                    (1, 2, 6), (1, 6, 5), (2, 3, 7), (2, 7, 6), (3, 0, 4), (3, 4, 7)]
+        cabecalho = ('ply\nformat {} 1.0\nelement vertex 8\nproperty float x\nproperty float y\n'
+                     'property float z\nelement face 7\nproperty list uchar int vertex_indices\nend_header\n')
+
+        binario = os.path.join(self.media.name, 'cubo_bin.ply')
+        with open(binario, 'wb') as f:
+            f.write(cabecalho.format('binary_little_endian').encode())
+            f.write(np.array(vertices, dtype='<f4').tobytes())
+            for face in faces:
+                f.write(bytes([len(face)]) + np.array(face, dtype='<i4').tobytes())
+        texto = os.path.join(self.media.name, 'cubo_ascii.ply')
+        with open(texto, 'w') as f:
+            f.write(cabecalho.format('ascii'))
+            f.writelines(f'{x} {y} {z}\n' for x, y, z in vertices)
+            f.writelines(' '.join(map(str, (len(face), *face))) + '\n' for face in faces)
+
+        for caminho in (binario, texto):
+            lidos, triangulos = ler_malha(caminho)
+            self.assertEqual(lidos.tolist(), [list(map(float, v)) for v in vertices])
+            self.assertEqual([tuple(t) for t in triangulos.tolist()], esperado)
+
+        stl = os.path.join(self.media.name, 'triangulo.stl')
+        with open(stl, 'w') as f:
+            f.write('solid teste\n facet normal 0 0 1\n  outer loop\n   vertex 0 0 0\n'
+                    '   vertex 1.5e1 0 0\n   vertex 0 -2 0\n  endloop\n endfacet\nendsolid teste\n')
+        lidos, triangulos = ler_malha(stl)
+        self.assertEqual(sorted(lidos.tolist()), [[0, -2, 0], [0, 0, 0], [15, 0, 0]])
+        self.assertEqual(len(triangulos), 1)
+
+    def test_so_devolve_reservas_vencidas(self):
+        import datetime
+        from django.utils import timezone
+        from .analise import devolver_presos, reservar_pendentes
+        from .models import Anexo
+
+        antigo = Anexo.objects.create(pedido=self.pedido, arquivo='arquivos_protese/a.stl')
+        recente = Anexo.objects.create(pedido=self.pedido, arquivo='arquivos_protese/b.stl')
+        self.assertEqual(len(reservar_pendentes(10)), 2)
+        Anexo.objects.filter(pk=antigo.pk).update(analise_iniciada_em=timezone.now() - datetime.timedelta(hours=1))
+
+        self.assertEqual(devolver_presos(600), 1)
+        antigo.refresh_from_db()
+        recente.refresh_from_db()
+        self.assertEqual((antigo.analise_status, recente.analise_status), ('PENDENTE', 'PROCESSANDO'))
+
+
+class DownloadProtegidoTest(MidiaTemporariaMixin, TestCase):
+
+    def setUp(self):
+        from django.core.files.base import ContentFile
+        from .models import Anexo
+
+        super().setUp()
+        pedido = self.criar_pedido('doutor_download')
+        self.outro = Usuario.objects.create(username='outro_doutor', tipo_usuario='DENTISTA')
+        self.anexo = Anexo(pedido=pedido)
+        self.anexo.arquivo.save('laudo.pdf', ContentFile(b'0123456789'))
+        self.url = f'/anexos/{self.anexo.id}/download/'
+
+    def test_permissao_igual_a_detalhes(self):
+        self.client.force_login(self.outro)
+        self.assertRedirects(self.client.get(self.url), '/dashboard/', fetch_redirect_response=False)
+
+    def test_range_e_etag(self):
+        self.client.force_login(self.dentista)
+
+        completo = self.client.get(self.url)
+        self.assertEqual(completo.status_code, 200)
+        self.assertEqual(b''.join(completo.streaming_content), b'0123456789')
+        etag = completo['ETag']
+
+        parcial = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(parcial.status_code, 206)
+        self.assertEqual(parcial['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(parcial.streaming_content), b'2345')
+
+        final = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(final.streaming_content), b'789')
+
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=20-').status_code, 416)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        ignorado = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"outro"')
+        self.assertEqual(ignorado.status_code, 200)
+
+    def test_offload_para_o_servidor_web(self):
+        from django.core.files.base import ContentFile
+        from django.test import override_settings
+        from .models import Anexo
+
+        foto = Anexo(pedido=self.anexo.pedido)
+        foto.arquivo.save('foto.jpg', ContentFile(b'jpeg'))
+        scan = Anexo(pedido=self.anexo.pedido)
+        scan.arquivo.save('scan.stl', ContentFile(b'0123456789'))
+        self.client.force_login(self.dentista)
+        with override_settings(DOWNLOAD_OFFLOAD='x-accel'):
+            resposta = self.client.get(f'/anexos/{foto.id}/download/')
+            # Malha comprimida: o Django responde, com ou sem Content-Encoding.
+            malha = self.client.get(f'/anexos/{scan.id}/download/')
+        self.assertEqual(resposta['X-Accel-Redirect'], '/media-protegida/' + foto.arquivo.name)
+        self.assertEqual(resposta.content, b'')
+        self.assertFalse(malha.has_header('X-Accel-Redirect'))
+        self.assertEqual(b''.join(malha.streaming_content), b'0123456789')
+
+
+class ViewsAssincronasTest(MidiaTemporariaMixin, TestCase):
+
+    def setUp(self):
+        from django.core.files.base import ContentFile
+        from .models import Anexo
+
+        super().setUp()
+        self.criar_pedido('doutor_async', nome_paciente="Paciente Async")
+        self.anexo = Anexo(pedido=self.pedido)
+        self.anexo.arquivo.save('grande.zip', ContentFile(b'x' * 600_000 + b'fim'))
+
+    async def test_download_em_blocos_pelo_asgi(self):
+        from .downloads import TAMANHO_BLOCO_DOWNLOAD
+
+        await self.async_client.aforce_login(self.dentista)
+        resposta = await self.async_client.get(f'/anexos/{self.anexo.id}/download/')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.is_async)
+        blocos = [bloco async for bloco in resposta.streaming_content]
+        self.assertEqual(max(len(bloco) for bloco in blocos), TAMANHO_BLOCO_DOWNLOAD)
+        self.assertEqual(b''.join(blocos), b'x' * 600_000 + b'fim')
+
+        parcial = await self.async_client.get(
+            f'/anexos/{self.anexo.id}/download/', headers={'Range': 'bytes=-3'},
+        )
+        self.assertEqual(parcial.status_code, 206)
+        self.assertEqual(b''.join([bloco async for bloco in parcial.streaming_content]), b'fim')
+
+        proibido = await self.async_client.get(f'/anexos/{self.anexo.id + 1}/download/')
+        self.assertEqual(proibido.status_code, 404)
+
+    async def test_dashboard_lista_e_exportacao(self):
+        await self.async_client.aforce_login(self.dentista)
+        dashboard = await self.async_client.get('/dashboard/')
+        self.assertContains(dashboard, "Paciente Async")
+        lista = await self.async_client.get('/pedidos/', {'busca': 'Async'})
+        self.assertContains(lista, "Paciente Async")
+
+        exportacao = await self.async_client.get('/pedidos/exportar/')
+        self.assertTrue(exportacao.is_async)
+        conteudo = b''.join([parte async for parte in exportacao.streaming_content]).decode('utf-8-sig')
+        self.assertIn("Paciente Async", conteudo)
+
+
+class TransmissaoPedidosTest(TestCase):
+
+    def setUp(self):
+        self.dentista = Usuario.objects.create(username='doutor_sse', tipo_usuario='DENTISTA')
+        self.cadista = Usuario.objects.create(username='cadista_sse', tipo_usuario='CADISTA')
+        self.outro_cadista = Usuario.objects.create(username='cadista_sse2', tipo_usuario='CADISTA')
+        self.pedido = Pedido.objects.create(
+            dentista=self.dentista, nome_paciente="Paciente SSE", tipo_servico="Coroa", dentes="11",
+        )
+
+    def test_recorte_igual_ao_dashboard(self):
+        from .transmissao import evento_para_usuario
+
+        evento = {
+            'pedido': self.pedido.id, 'dentista': self.dentista.id, 'status': 'EM_PRODUCAO',
+            'status_anterior': 'PENDENTE', 'cadista': self.cadista.id, 'cadista_anterior': None,
+        }
+        self.assertEqual(evento_para_usuario(evento, self.dentista, 'dentista')['status'], 'EM_PRODUCAO')
+        self.assertEqual(evento_para_usuario(evento, self.cadista, 'cadista')['status_anterior'], 'PENDENTE')
+        # Quem não assumiu só vê o pedido sair da fila.
+        saida = evento_para_usuario(evento, self.outro_cadista, 'cadista')
+        self.assertEqual((saida['status_anterior'], saida['status']), ('PENDENTE', ''))
+        self.assertIsNone(evento_para_usuario(evento, self.outro_cadista, 'dentista'))
+
+    def test_sem_asgi_desativa_o_fluxo(self):
+        self.client.force_login(self.dentista)
+        self.assertEqual(self.client.get('/pedidos/atualizacoes/').status_code, 204)
+
+    async def test_mudanca_salva_chega_ao_cliente(self):
+        import json
+        from asgiref.sync import sync_to_async
+        from .transmissao import transmissor
+
+        await self.async_client.aforce_login(self.dentista)
+        resposta = await self.async_client.get('/pedidos/atualizacoes/')
+        self.assertEqual(resposta['Content-Type'], 'text/event-stream')
+        fluxo = aiter(resposta.streaming_content)
+        self.assertTrue((await anext(fluxo)).startswith(b'retry:'))
+
+        def assumir():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.pedido.status = 'EM_PRODUCAO'
+                self.pedido.cadista = self.cadista
+                self.pedido.save()
+
+        await sync_to_async(assumir)()
+        mensagem = (await asyncio.wait_for(anext(fluxo), 1)).decode()
+        self.assertTrue(mensagem.startswith('event: pedido\n'))
+        dados = json.loads(mensagem.split('data: ', 1)[1])
+        self.assertEqual(dados, {
+            'pedido': self.pedido.id, 'status_anterior': 'PENDENTE', 'status': 'EM_PRODUCAO',
+            'cadista': self.cadista.id,
+        })
+        # Desconexão do cliente: o servidor ASGI cancela a leitura do corpo.
+        leitura = asyncio.ensure_future(anext(fluxo))
+        await asyncio.sleep(0)
+        leitura.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await leitura
+        self.assertFalse(transmissor._inscricoes)
+
+    async def test_repasse_entre_processos_por_socket(self):
+        import shutil
+        import socket
+        import tempfile
+        from pathlib import Path
+        from .transmissao import Transmissor
+
+        diretorio = tempfile.mkdtemp(dir='/tmp')
+        self.addCleanup(shutil.rmtree, diretorio)
+        # Socket de um processo que morreu sem limpar.
+        morto = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        morto.bind(str(Path(diretorio) / 'morto.sock'))
+        morto.close()
+
+        publicador, ouvinte = Transmissor(diretorio), Transmissor(diretorio)
+        with ouvinte.inscrever() as inscricao:
+            publicador.publicar([{'pedido': self.pedido.id}])
+            self.assertEqual(await asyncio.wait_for(inscricao.fila.get(), 1), {'pedido': self.pedido.id})
+        ouvinte.fechar()
+        self.assertEqual(list(Path(diretorio).glob('*.sock')), [])
+
+
+class BenchmarkTest(MidiaTemporariaMixin, TestCase):
+
+    def test_semeia_e_mede_todas_as_telas(self):
+        import io
+        from django.core.management import call_command
+        from .benchmark import executar
+        from .models import Anexo, ElementoPedido
+        from .odontograma import interpretar_elementos
+
+        call_command('seed_benchmark', dentistas=3, cadistas=2, pedidos=40, anexos=2, stdout=io.StringIO())
+        self.assertEqual(Pedido.objects.count(), 40)
+        self.assertEqual(Anexo.objects.count(), 80)
+        pedido = Pedido.objects.order_by('id').first()
+        mapa = interpretar_elementos(pedido.elementos)
+        self.assertEqual(set(pedido.elementos_dentarios.values_list('dente', flat=True)), set(mapa))
+        self.assertEqual(ElementoPedido.objects.count(), sum(
+            len(interpretar_elementos(texto)) for texto in Pedido.objects.values_list('elementos', flat=True)
+        ))
+
+        resultado = executar(repeticoes=1)
+        cenarios = resultado['cenarios']
+        self.assertIn('dashboard cadista', cenarios)
+        self.assertIn('lista gestor ordenar=status', cenarios)
+        self.assertIn('detalhes dentista', cenarios)
+        self.assertTrue(all(medida['status'] == 200 and medida['consultas'] > 0 for medida in cenarios.values()))
+
+    def test_comparacao_aponta_regressoes(self):
+        from .benchmark import comparar
+
+        base = {'cenarios': {
+            'a': {'consultas': 3, 'tempo_ms': 10.0},
+            'b': {'consultas': 3, 'tempo_ms': 100.0},
+        }}
+        atual = {'cenarios': {
+            'a': {'consultas': 4, 'tempo_ms': 14.0},   # +1 consulta; tempo dentro da folga
+            'b': {'consultas': 3, 'tempo_ms': 130.0},  # +30%
+            'novo': {'consultas': 9, 'tempo_ms': 1.0},
+        }}
+        self.assertEqual([nome for nome, _ in comparar(atual, base)], ['a', 'b'])
+
+
+class MetricasTest(TestCase):
+
+    def setUp(self):
+        from core.metricas import registro
+
+        registro.limpar()
+        self.gestor = Usuario.objects.create(username='gestora_metricas', tipo_usuario='GESTOR')
+        self.dentista = Usuario.objects.create(username='doutor_metricas', tipo_usuario='DENTISTA')
+        Pedido.objects.create(dentista=self.dentista, nome_paciente="Paciente", tipo_servico="Coroa", dentes="11")
+
+    def _serie(self, texto, nome):
+        for linha in texto.splitlines():
+            if linha.startswith(nome + ' '):
+                return float(linha.rsplit(' ', 1)[1])
+        return None
+
+    def test_latencia_e_consultas_por_view(self):
+        self.client.force_login(self.gestor)
+        self.client.get('/dashboard/')
+        self.client.get('/pedidos/', {'ordenar': 'paciente'})
+
+        texto = self.client.get('/metrics').content.decode()
+        self.assertEqual(self._serie(texto, 'protese_requisicao_segundos_count{view="dashboard"}'), 1)
+        self.assertEqual(self._serie(texto, 'protese_requisicao_segundos_bucket{view="lista_pedidos",le="+Inf"}'), 1)
+        # Sessão, usuário, página de pedidos e lista de dentistas.
+        self.assertEqual(self._serie(texto, 'protese_sql_consultas_sum{view="lista_pedidos"}'), 4)
+        self.assertEqual(
+            self._serie(texto, 'protese_requisicoes_total{view="lista_pedidos",metodo="GET",status="200"}'), 1,
+        )
+        self.assertGreater(self._serie(texto, 'protese_resposta_bytes_total{view="lista_pedidos"}'), 0)
+
+    def test_acesso_restrito(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.client.force_login(self.dentista)
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        with override_settings(METRICAS_TOKEN='segredo'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segredo').status_code, 200)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer outro').status_code, 401)
+
+    def test_log_de_requisicao_lenta(self):
+        self.client.force_login(self.gestor)
+        with override_settings(METRICAS_LENTAS_MS=0.001), self.assertLogs('core.metricas.lentas') as log:
+            self.client.get('/pedidos/')
+        self.assertIn('lista_pedidos', log.output[0])
+        self.assertIn('SELECT', log.output[0])
+
+
+class ConsultasPorPaginaTest(TestCase):
+
+    def setUp(self):
+        self.gestor = Usuario.objects.create(username='gestora_qs', tipo_usuario='GESTOR')
+        self.cadista = Usuario.objects.create(username='cadista_qs', tipo_usuario='CADISTA')
+        self.outro_cadista = Usuario.objects.create(username='cadista_qs2', tipo_usuario='CADISTA')
+        self.dentista = Usuario.objects.create(username='doutor_qs', tipo_usuario='DENTISTA')
+        self.pedido = self._criar(2)[0]
+
+    def _criar(self, quantidade):
+        from .models import Anexo
+
+        pedidos = []
+        for i in range(quantidade):
+            pedido = Pedido.objects.create(
+                dentista=self.dentista, cadista=self.cadista if i % 2 else None,
+                status='EM_PRODUCAO' if i % 2 else 'PENDENTE',
+                nome_paciente=f"Paciente {i}", tipo_servico="Coroa", dentes="11", observacoes="x" * 1000,
+            )
+            Anexo.objects.create(pedido=pedido, arquivo=f'arquivos_protese/{pedido.id}.stl')
+            pedidos.append(pedido)
+        return pedidos
+
+    def _consultas_constantes(self, usuario, url, esperadas):
+        from django.core.cache import cache
+
+        self.client.force_login(usuario)
+        for _ in range(2):
+            cache.clear()
+            with self.assertNumQueries(esperadas):
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self._criar(10)
+
+    def test_dashboard(self):
+        # Sessão, usuário, KPIs e pedidos (com dentista e cadista no mesmo SELECT).
+        self._consultas_constantes(self.gestor, '/dashboard/', 4)
+        self._consultas_constantes(self.cadista, '/dashboard/?status=PENDENTE', 4)
+        self._consultas_constantes(self.dentista, '/dashboard/', 4)
+
+    def test_lista(self):
+        # Gestor carrega também a lista de dentistas do filtro.
+        self._consultas_constantes(self.gestor, '/pedidos/?ordenar=paciente', 4)
+        self._consultas_constantes(self.dentista, '/pedidos/', 3)
+
+    def test_detalhes(self):
+        # Sessão, usuário, pedido com dentista e cadista, anexos.
+        self._consultas_constantes(self.gestor, f'/pedidos/{self.pedido.id}/', 4)
+
+    def test_lista_sem_colunas_longas(self):
+        pedido = Pedido.objects.for_list().get(id=self.pedido.id)
+        self.assertTrue({'elementos', 'observacoes'} <= pedido.get_deferred_fields())
+        with self.assertNumQueries(0):
+            pedido.dentista.username
+
+    def test_mesmo_recorte_em_todas_as_telas(self):
+        de_outro = Pedido.objects.create(
+            dentista=self.dentista, cadista=self.outro_cadista, status='EM_PRODUCAO',
+            nome_paciente="Caso Alheio", tipo_servico="Coroa", dentes="11",
+        )
+        self.client.force_login(self.cadista)
+        self.assertNotContains(self.client.get('/pedidos/'), "Caso Alheio")
+        self.assertNotContains(self.client.get('/pedidos/exportar/'), "Caso Alheio")
+        self.assertRedirects(self.client.get(f'/pedidos/{de_outro.id}/'), '/dashboard/')
+        self.assertEqual(self.client.get(f'/pedidos/editar/{de_outro.id}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/pedidos/{de_outro.id}/entrega/').status_code, 302)
+        self.assertEqual(self.client.get('/pedidos/999999/').status_code, 404)
+
+
+class OdontogramaTest(TestCase):
+
+    def setUp(self):
+        self.dentista = Usuario.objects.create(username='doutor_odonto', tipo_usuario='DENTISTA')
+
+    def dados(self, elementos):
+        return {
+            'nome_paciente': "Paciente", 'sexo': 'F', 'tipo_servico': "1x COROA",
+            'elementos': elementos,
+        }
+
+    def test_form_valida_dentes_e_procedimentos(self):
+        from .forms import PedidoForm
+
+        self.assertFalse(PedidoForm(self.dados('{"19": "COROA"}')).is_valid())
+        self.assertFalse(PedidoForm(self.dados('{"36": "PONTE"}')).is_valid())
+        self.assertFalse(PedidoForm(self.dados('[36]')).is_valid())
+
+        form = PedidoForm(self.dados('{"36": "COROA", "11": "FACETA"}'))
+        self.assertTrue(form.is_valid(), form.errors)
+        pedido = form.save(commit=False)
+        self.assertEqual(pedido.dentes, "11, 36")
+
+    def test_elementos_sincronizados_e_consultaveis(self):
+        from .models import ElementoPedido
+        from .odontograma import carga_por_dente
+
+        pedido = Pedido.objects.create(
+            dentista=self.dentista, nome_paciente="Paciente", tipo_servico="Coroa",
+            dentes="36", elementos='{"36": "COROA", "37": "COROA"}',
+        )
+        Pedido.objects.create(
+            dentista=self.dentista, nome_paciente="Outro", tipo_servico="Coroa",
+            dentes="36", elementos='{"36": "COROA"}',
+        )
+        coroas_36 = ElementoPedido.objects.filter(dente=36, procedimento='COROA')
+        self.assertEqual(coroas_36.count(), 2)
+
+        pedido.elementos = '{"36": "IMPLANTE"}'
+        pedido.save()
+        self.assertEqual(coroas_36.count(), 1)
+        self.assertEqual(
+            list(carga_por_dente().values_list('dente', 'procedimento', 'total')),
+            [(36, 'COROA', 1), (36, 'IMPLANTE', 1)],
+        )
+
+
+class FilaTarefasTest(TestCase):
+
+    def setUp(self):
+        from .fila import tarefa
+
+        self.executadas = []
+
+        @tarefa(nome='teste_registrar', prioridade=0)
+        def registrar(valor):
+            self.executadas.append(valor)
+
+        @tarefa(nome='teste_falhar', max_tentativas=2)
+        def falhar():
+            raise RuntimeError("sem conexão")
+
+        self.registrar, self.falhar = registrar, falhar
+
+    def test_prioridade_e_reserva_exclusiva(self):
+        from .fila import enfileirar, processar, reservar
+
+        enfileirar(self.registrar, valor='baixa', prioridade=-5)
+        enfileirar(self.registrar, valor='alta', prioridade=10)
+        enfileirar(self.registrar, valor='depois', atraso=60)
+
+        self.assertEqual(len(reservar('worker-a', 1)), 1)
+        self.assertEqual(len(reservar('worker-b', 10)), 1)
+        self.assertEqual(reservar('worker-c', 10), [])
+
+        from .models import Tarefa
+        Tarefa.objects.update(status='PENDENTE', worker='', tentativas=0)
+        self.assertEqual(processar(limite=10), 2)
+        self.assertEqual(self.executadas, ['alta', 'baixa'])
+
+    def test_retentativa_com_espera_e_falha_definitiva(self):
+        from django.utils import timezone
+        from .fila import enfileirar, processar
+        from .models import Tarefa
+
+        item = enfileirar(self.falhar)
+        processar()
+        item.refresh_from_db()
+        self.assertEqual((item.status, item.tentativas), ('PENDENTE', 1))
+        self.assertGreater(item.executar_em, timezone.now())
+        self.assertIn("sem conexão", item.ultimo_erro)
+
+        Tarefa.objects.update(executar_em=timezone.now())
+        processar()
+        item.refresh_from_db()
+        self.assertEqual((item.status, item.tentativas), ('FALHOU', 2))
+
+    def test_visibilidade_expirada_devolve_tarefa(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .fila import enfileirar, executar, processar, reservar
+        from .models import Tarefa
+
+        enfileirar(self.registrar, valor='x')
+        perdida = reservar('worker-morto', 1)[0]
+        Tarefa.objects.update(reservada_ate=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(processar('worker-novo'), 1)
+        self.assertEqual(self.executadas, ['x'])
+        # O worker antigo não sobrescreve o resultado de quem assumiu a tarefa.
+        executar(perdida)
+        self.assertEqual(Tarefa.objects.get().worker, 'worker-novo')
+
+    def test_exclusao_de_anexo_libera_arquivo_pela_fila(self):
+        import os
+        import tempfile
+        from django.core.files.base import ContentFile
+        from django.test import override_settings
+        from .fila import processar
+        from .models import Anexo, Tarefa
+
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            dentista = Usuario.objects.create(username='doutor_fila', tipo_usuario='DENTISTA')
+            pedido = Pedido.objects.create(
+                dentista=dentista, nome_paciente="Paciente", tipo_servico="Coroa", dentes="11",
+            )
+            anexo = Anexo(pedido=pedido)
+            anexo.arquivo.save('foto.jpg', ContentFile(b'jpeg'))
+            caminho = anexo.arquivo.path
+            self.assertTrue(Tarefa.objects.filter(nome='analisar_anexo').exists())
+
+            dentista.delete()
+            self.assertTrue(os.path.exists(caminho))
+            self.assertTrue(Tarefa.objects.filter(nome='liberar_arquivo').exists())
+
+            processar(limite=10)
+            self.assertFalse(os.path.exists(caminho))
+            self.assertFalse(Tarefa.objects.exclude(status='CONCLUIDA').exists())
+
+
+class AtribuicaoCadistaTest(TestCase):
+
+    def setUp(self):
+        self.dentista = Usuario.objects.create(username='doutor_fila_cad', tipo_usuario='DENTISTA')
+        self.ana = Usuario.objects.create(username='ana_cad', tipo_usuario='CADISTA')
+        self.bia = Usuario.objects.create(username='bia_cad', tipo_usuario='CADISTA')
+
+    def criar(self, paciente, entrega=None):
+        return Pedido.objects.create(
+            dentista=self.dentista, nome_paciente=paciente, tipo_servico="Coroa",
+            dentes="11", data_entrega_prevista=entrega,
+        )
+
+    def test_apenas_um_cadista_assume(self):
+        from .atribuicao import assumir_pedido
+
+        pedido = self.criar("Disputado")
+        self.assertIsNotNone(assumir_pedido(pedido.id, self.ana))
+        self.assertIsNone(assumir_pedido(pedido.id, self.bia))
+        pedido.refresh_from_db()
+        self.assertEqual((pedido.status, pedido.cadista), ('EM_PRODUCAO', self.ana))
+
+    def test_dentista_nao_assume_pedido(self):
+        from .atribuicao import assumir_pedido
+
+        pedido = self.criar("Próprio")
+        self.assertIsNone(assumir_pedido(pedido.id, self.dentista))
+        self.client.force_login(self.dentista)
+        self.client.post(f'/pedidos/{pedido.id}/', {'acao': 'iniciar'})
+        pedido.refresh_from_db()
+        self.assertEqual((pedido.status, pedido.cadista), ('PENDENTE', None))
+
+    def test_proximo_por_prazo_e_idade_com_limite(self):
+        import datetime
+        from .atribuicao import proximo_pedido
+
+        hoje = datetime.date.today()
+        sem_prazo = self.criar("Sem prazo")
+        tardio = self.criar("Tardio", hoje + datetime.timedelta(days=9))
+        urgente = self.criar("Urgente", hoje + datetime.timedelta(days=1))
+        urgente_novo = self.criar("Urgente novo", hoje + datetime.timedelta(days=1))
+
+        self.assertEqual(proximo_pedido(self.ana, limite=2), urgente)
+        self.assertEqual(proximo_pedido(self.bia, limite=2), urgente_novo)
+        self.assertEqual(proximo_pedido(self.ana, limite=2), tardio)
+        self.assertIsNone(proximo_pedido(self.ana, limite=2))
+        self.assertEqual(proximo_pedido(self.bia, limite=2), sem_prazo)
+
+    def test_proximo_nao_gira_sem_assumir(self):
+        from unittest import mock
+        from .atribuicao import proximo_pedido
+
+        self.criar("Pendente")
+        gestor = Usuario.objects.create(username='gestor_cad', tipo_usuario='GESTOR')
+        self.assertIsNone(proximo_pedido(self.dentista))
+        self.assertIsNone(proximo_pedido(gestor))
+        # Falha que não é corrida: a fila não muda entre as voltas.
+        with mock.patch('pedidos.atribuicao.assumir_pedido', return_value=None) as assumir:
+            self.assertIsNone(proximo_pedido(self.ana))
+        self.assertEqual(assumir.call_count, 1)
+        self.assertTrue(Pedido.objects.filter(status='PENDENTE').exists())
+
+    def test_endpoint_proximo_caso(self):
+        pedido = self.criar("Via API")
+        self.client.force_login(self.ana)
+        resposta = self.client.post('/pedidos/proximo/', HTTP_ACCEPT='application/json')
+        self.assertEqual(resposta.json()['pedido'], pedido.id)
+        resposta = self.client.post('/pedidos/proximo/', HTTP_ACCEPT='application/json')
+        self.assertIsNone(resposta.json()['pedido'])
+
+        self.client.force_login(self.dentista)
+        self.assertEqual(self.client.post('/pedidos/proximo/').status_code, 403)
+
+
+class EventosPedidoTest(TestCase):
+
+    def setUp(self):
+        self.dentista = Usuario.objects.create(username='doutor_eventos', tipo_usuario='DENTISTA')
+        self.cadista = Usuario.objects.create(username='cad_eventos', tipo_usuario='CADISTA')
+
+    def criar(self):
+        return Pedido.objects.create(
+            dentista=self.dentista, nome_paciente="Paciente", tipo_servico="Coroa", dentes="11",
+        )
+
+    def test_cada_transicao_gera_um_evento(self):
+        from .atribuicao import assumir_pedido
+        from .models import PedidoEvento
+
+        pedido = self.criar()
+        assumir_pedido(pedido.id, self.cadista)
+        pedido = Pedido.objects.get(pk=pedido.pk)
+        pedido.observacoes = "sem mudança de status"
+        pedido.save()
+        pedido.status = 'CONCLUIDO'
+        pedido.save()
+
+        self.assertEqual(
+            list(PedidoEvento.objects.filter(pedido=pedido).order_by('pk')
+                 .values_list('status_anterior', 'status_novo', 'cadista')),
+            [('', 'PENDENTE', None), ('PENDENTE', 'EM_PRODUCAO', self.cadista.pk),
+             ('EM_PRODUCAO', 'CONCLUIDO', self.cadista.pk)],
+        )
+
+    def test_eventos_em_lote_usam_uma_insercao(self):
+        from .eventos import eventos_em_lote
+        from .models import PedidoEvento
+
+        with eventos_em_lote():
+            for _ in range(3):
+                self.criar()
+            self.assertEqual(PedidoEvento.objects.count(), 0)
+        self.assertEqual(PedidoEvento.objects.count(), 3)
+
+    def test_indicadores_incrementais(self):
+        import datetime
+        from django.utils import timezone
+        from .eventos import (
+            atualizar_indicadores, lead_time_medio, profundidade_fila, taxa_retrabalho, vazao_por_cadista,
+        )
+        from .models import PedidoEvento
+
+        ontem = timezone.now() - datetime.timedelta(days=1)
+        entregue = self.criar()
+        self.criar()  # continua na fila
+        Pedido.objects.filter(pk=entregue.pk).update(data_criacao=ontem - datetime.timedelta(hours=10), cadista=self.cadista)
+        entregue.refresh_from_db()
+        PedidoEvento.objects.update(criado_em=ontem - datetime.timedelta(hours=10))
+        for anterior, novo in [('PENDENTE', 'EM_PRODUCAO'), ('EM_PRODUCAO', 'CONCLUIDO'),
+                               ('CONCLUIDO', 'RETRABALHO'), ('RETRABALHO', 'CONCLUIDO')]:
+            PedidoEvento.objects.create(pedido=entregue, status_anterior=anterior, status_novo=novo,
+                                        cadista=self.cadista, criado_em=ontem,
+                                        pedido_criado_em=entregue.data_criacao)
+        PedidoEvento.objects.update(registrado_em=ontem)
+
+        self.assertEqual(atualizar_indicadores(), 6)
+        self.assertEqual(atualizar_indicadores(), 0)
+
+        dia = timezone.localdate(ontem)
+        inicio, fim = dia - datetime.timedelta(days=1), dia + datetime.timedelta(days=1)
+        self.assertEqual(lead_time_medio(inicio, fim), datetime.timedelta(hours=10))
+        self.assertEqual(taxa_retrabalho(inicio, fim), 1.0)
+        self.assertEqual([p for _, p in profundidade_fila(inicio, fim)][-1], 1)
+        self.assertEqual(
+            vazao_por_cadista(ontem - datetime.timedelta(days=1), timezone.now()).get()['entregas'], 2,
+        )
+
+    def test_marcador_nao_passa_de_evento_recente(self):
+        import datetime
+        from django.db.models import Sum
+        from django.utils import timezone
+        from .eventos import atualizar_indicadores
+        from .models import IndicadorDiario, PedidoEvento
+
+        recente = self.criar()
+        # Evento retroativo com id maior, como os da importação.
+        retroativo = PedidoEvento.objects.create(
+            pedido=recente, status_anterior='PENDENTE', status_novo='EM_PRODUCAO',
+            criado_em=timezone.now() - datetime.timedelta(days=2),
+        )
+        PedidoEvento.objects.filter(pk=retroativo.pk).update(
+            registrado_em=timezone.now() - datetime.timedelta(hours=1),
+        )
+
+        self.assertEqual(atualizar_indicadores(), 0)
+        PedidoEvento.objects.update(registrado_em=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(atualizar_indicadores(), 2)
+        self.assertEqual(IndicadorDiario.objects.aggregate(n=Sum('entradas_fila'))['n'], 1)
+
+    def test_pedido_arquivado_continua_nos_indicadores(self):
+        import datetime
+        from django.utils import timezone
+        from .arquivamento import arquivar_lote
+        from .eventos import atualizar_indicadores, lead_time_medio
+        from .models import PedidoEvento
+
+        pedido = self.criar()
+        for status in ('CONCLUIDO', 'APROVADO'):
+            pedido.status = status
+            pedido.save()
+        arquivar_lote([pedido.pk])
+        PedidoEvento.objects.update(registrado_em=timezone.now() - datetime.timedelta(hours=1))
+
+        self.assertEqual(atualizar_indicadores(), 3)
+        hoje = timezone.localdate()
+        self.assertIsNotNone(lead_time_medio(hoje, hoje))
+
+    def test_trava_no_banco(self):
+        from .eventos import atualizar_indicadores, travar
+
+        with travar('indicadores', 60) as obtida:
+            self.assertTrue(obtida)
+            with travar('indicadores', 60) as outra:
+                self.assertFalse(outra)
+            self.assertEqual(atualizar_indicadores(margem=0), 0)
+        with travar('indicadores', 60) as obtida:
+            self.assertTrue(obtida)
+
+
+class ExportacaoPedidosTest(TestCase):
+
+    def setUp(self):
+        self.gestor = Usuario.objects.create(username='gestora_exp', tipo_usuario='GESTOR')
+        self.dentista = Usuario.objects.create(
+            username='doutor_exp', first_name='Carla', last_name='Souza', tipo_usuario='DENTISTA', cro='SP-123',
+        )
+        for paciente in ("João Pereira", "Maria & Filhos", "Outro"):
+            Pedido.objects.create(
+                dentista=self.dentista, nome_paciente=paciente, tipo_servico="Coroa", dentes="11",
+            )
+
+    def test_linhas_em_uma_consulta(self):
+        from .exportacao import linhas_pedidos
+
+        with self.assertNumQueries(1):
+            linhas = list(linhas_pedidos(Pedido.objects.order_by('id')))
+        self.assertEqual(linhas[0][1:5], ("João Pereira", "Carla Souza", "SP-123", ""))
+
+    def test_csv_respeita_filtros_da_lista(self):
+        import csv
+        import io
+
+        self.client.force_login(self.gestor)
+        resposta = self.client.get('/pedidos/exportar/', {'cliente': self.dentista.id, 'ordenar': 'paciente'})
+        self.assertTrue(resposta.streaming)
+        conteudo = b''.join(resposta.streaming_content).decode('utf-8-sig')
+        linhas = list(csv.reader(io.StringIO(conteudo), delimiter=';'))
+        self.assertEqual(linhas[0][:3], ['ID', 'Paciente', 'Dentista'])
+        self.assertEqual([linha[1] for linha in linhas[1:]], ["João Pereira", "Maria & Filhos", "Outro"])
+
+        dentista_sem_pedidos = Usuario.objects.create(username='outro_exp', tipo_usuario='DENTISTA')
+        self.client.force_login(dentista_sem_pedidos)
+        resposta = self.client.get('/pedidos/exportar/')
+        self.assertEqual(len(b''.join(resposta.streaming_content).decode('utf-8-sig').splitlines()), 1)
+
+    def test_xlsx_valido(self):
+        import io
+        import zipfile
+        from xml.etree import ElementTree
+
+        self.client.force_login(self.gestor)
+        resposta = self.client.get('/pedidos/exportar/', {'formato': 'xlsx', 'busca': 'Maria'})
+        pacote = zipfile.ZipFile(io.BytesIO(b''.join(resposta.streaming_content)))
+        self.assertIsNone(pacote.testzip())
+        planilha = ElementTree.fromstring(pacote.read('xl/worksheets/sheet1.xml'))
+        ns = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+        linhas = planilha.findall(f'{ns}sheetData/{ns}row')
+        self.assertEqual(len(linhas), 2)
+        self.assertEqual(''.join(linhas[1].itertext()).count("Maria & Filhos"), 1)
+
+    def test_xlsx_sem_caracteres_de_controle(self):
+        import io
+        import zipfile
+        from xml.etree import ElementTree
+
+        Pedido.objects.create(
+            dentista=self.dentista, nome_paciente="Lia\x00 Souza", tipo_servico="Coroa\x0b total\x1f",
+            dentes="\x01=1+1",
+        )
+        self.client.force_login(self.gestor)
+        resposta = self.client.get('/pedidos/exportar/', {'formato': 'xlsx', 'busca': 'Lia'})
+        pacote = zipfile.ZipFile(io.BytesIO(b''.join(resposta.streaming_content)))
+        planilha = ElementTree.fromstring(pacote.read('xl/worksheets/sheet1.xml'))
+        texto = ''.join(planilha.itertext())
+        self.assertIn("Lia Souza", texto)
+        self.assertIn("Coroa total", texto)
+        self.assertIn("'=1+1", texto)
+
+    def test_texto_nao_vira_formula(self):
+        from .exportacao import _Csv, _celula
+
+        Pedido.objects.create(
+            dentista=self.dentista, nome_paciente='=HYPERLINK("http://x")', tipo_servico="@SUM(A1)", dentes="-1",
+        )
+        linha = _Csv().linha(('=1+1', '+55 11', '-2', '@A1', '\tx', 'Maria', 7))
+        self.assertEqual(linha, "'=1+1;'+55 11;'-2;'@A1;'\tx;Maria;7\r\n")
+        self.assertIn("'=HYPERLINK", _celula('=HYPERLINK("http://x")'))
+        self.assertEqual(_celula(-2), '<c><v>-2</v></c>')
+
+        self.client.force_login(self.gestor)
+        conteudo = b''.join(self.client.get('/pedidos/exportar/').streaming_content).decode('utf-8-sig')
+        self.assertIn("'=HYPERLINK", conteudo)
+        self.assertIn("'@SUM(A1)", conteudo)
+
+
+class ImportacaoPedidosTest(TestCase):
+
+    def setUp(self):
+        self.gestor = Usuario.objects.create(username='gestora_imp', tipo_usuario='GESTOR')
+        self.carla = Usuario.objects.create(
+            username='carla_imp', tipo_usuario='DENTISTA', cro='12345-SP', email='Carla@Clinica.com',
+        )
+
+    def csv(self, *linhas):
+        import io
+        cabecalho = 'Paciente;Serviço;CRO;dentista_email;elementos;Entrega prevista'
+        return io.BytesIO('\n'.join((cabecalho,) + linhas).encode('utf-8-sig'))
+
+    def test_importa_em_lote_e_reporta_erros_por_linha(self):
+        from .busca import filtrar_busca
+        from .importacao import importar_pedidos, ler_linhas
+        from .models import ElementoPedido, PedidoEvento
+
+        arquivo = self.csv(
+            # Campo entre aspas em duas linhas: Ana ocupa as linhas 2 e 3 da planilha.
+            'Ana Lima;Coroa;12345-sp;;"{""36"":\n""COROA""}";25/12/2030',
+            'Bruno;Faceta;;carla@clinica.com;;',
+            ';Coroa;12345-SP;;;',
+            'Caio;Coroa;99999-RJ;;;',
+            'Davi;Coroa;12345-SP;;"{""99"": ""COROA""}";',
+        )
+        linhas = list(ler_linhas(arquivo))
+        self.assertFalse(arquivo.closed)
+        # Mapa de dentistas + 1 lote (pedidos, elementos, busca, eventos) dentro de savepoints.
+        with self.assertNumQueries(7):
+            resultado = importar_pedidos(linhas, tamanho_lote=1000)
+
+        self.assertEqual(resultado.importados, 2)
+        self.assertEqual([linha for linha, _ in resultado.erros], [5, 6, 7])
+        self.assertIn("Dentista não encontrado", resultado.erros[1][1])
+
+        ana = Pedido.objects.get(nome_paciente="Ana Lima")
+        self.assertEqual((ana.dentista, ana.dentes, str(ana.data_entrega_prevista)), (self.carla, "36", "2030-12-25"))
+        self.assertTrue(ElementoPedido.objects.filter(pedido=ana, dente=36).exists())
+        self.assertEqual(PedidoEvento.objects.filter(status_anterior='', status_novo='PENDENTE').count(), 2)
+        self.assertEqual(list(filtrar_busca(Pedido.objects.all(), "bruno")), [Pedido.objects.get(nome_paciente="Bruno")])
+
+    def test_view_restrita_e_json(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        dados = b'[{"nome_paciente": "Eva", "tipo_servico": "Coroa", "dentista_email": "carla@clinica.com"}]'
+        self.client.force_login(self.carla)
+        self.assertEqual(self.client.get('/pedidos/importar/').status_code, 302)
+
+        self.client.force_login(self.gestor)
+        resposta = self.client.post('/pedidos/importar/', {'arquivo': SimpleUploadedFile('p.json', dados)})
+        self.assertEqual(resposta.context['resultado'].importados, 1)
+        self.assertTrue(Pedido.objects.filter(nome_paciente="Eva", dentista=self.carla).exists())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AutenticacaoTest(TestCase):
+
+    def setUp(self):
+        self.ana = Usuario.objects.create_user(username='Ana.Lima', email='ana@clinica.com', password='senha-ana')
+        self.outra = Usuario.objects.create_user(username='ana2', email='ANA@clinica.com', password='senha-outra')
+
+    def test_usuario_ou_email_sem_diferenciar_maiusculas(self):
+        from django.contrib.auth import authenticate
+
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate(username='ana.lima', password='senha-ana'), self.ana)
+        self.assertEqual(authenticate(username='Ana@Clinica.com', password='senha-ana'), self.ana)
+        # E-mail repetido: vale a conta mais antiga, e a senha continua sendo conferida.
+        self.assertIsNone(authenticate(username='ana@clinica.com', password='senha-outra'))
+        self.assertIsNone(authenticate(username='ana.lima', password='errada'))
+
+    def test_usuario_inexistente_consulta_uma_vez_e_gera_hash(self):
+        from unittest import mock
+        from django.contrib.auth import authenticate
+
+        with mock.patch('django.contrib.auth.base_user.make_password') as make_password:
+            with self.assertNumQueries(1):
+                self.assertIsNone(authenticate(username='ninguem', password='x'))
+        make_password.assert_called_once_with('x')
+
+    def test_consulta_usa_indices_funcionais(self):
+        from django.db import connection
+        from core.backends import EmailOuUsuarioModelBackend
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as contexto:
+            EmailOuUsuarioModelBackend().authenticate(None, username='ana.lima', password='senha-ana')
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + contexto.captured_queries[0]['sql'])
+            plano = ' '.join(linha[-1] for linha in cursor.fetchall())
+        self.assertIn('usuario_username_lower_idx', plano)
+        self.assertIn('usuario_email_lower_idx', plano)
+
+
+class ConcorrenciaSqliteTest(TestCase):
+
+    def conectar(self, caminho, pragmas):
+        import sqlite3
+
+        # timeout curto: se a escrita precisar esperar pela leitura, falha logo.
+        conexao = sqlite3.connect(caminho, timeout=0.2, isolation_level=None, check_same_thread=False)
+        for pragma in pragmas:
+            if 'busy_timeout' not in pragma:
+                conexao.execute(pragma)
+        return conexao
+
+    def escrever_durante_leitura(self, pragmas):
+        import os
+        import sqlite3
+        import tempfile
+        import threading
+
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, 'concorrencia.sqlite3')
+            escritor = self.conectar(caminho, pragmas)
+            leitor = self.conectar(caminho, pragmas)
+            escritor.execute('CREATE TABLE pedido (id INTEGER PRIMARY KEY, status TEXT)')
+            escritor.executemany('INSERT INTO pedido (status) VALUES (?)', [('PENDENTE',)] * 100)
+
+            # Um dashboard no meio de uma leitura longa...
+            leitor.execute('BEGIN')
+            leitor.execute('SELECT count(*) FROM pedido').fetchone()
+
+            # ...enquanto outra thread grava (ex.: fim de um upload).
+            erros = []
+
+            def gravar():
+                try:
+                    escritor.execute('BEGIN IMMEDIATE')
+                    escritor.execute("UPDATE pedido SET status = 'EM_PRODUCAO' WHERE id = 1")
+                    escritor.execute('COMMIT')
+                except sqlite3.OperationalError as erro:
+                    erros.append(erro)
+                    escritor.execute('ROLLBACK')
+
+            thread = threading.Thread(target=gravar)
+            thread.start()
+            thread.join()
+            contagem = leitor.execute("SELECT count(*) FROM pedido WHERE status = 'PENDENTE'").fetchone()[0]
+            leitor.execute('COMMIT')
+            escritor.close()
+            leitor.close()
+            return erros, contagem
+
+    def test_wal_nao_serializa_leitura_e_escrita(self):
+        from django.conf import settings
+
+        erros, _ = self.escrever_durante_leitura(['PRAGMA journal_mode=DELETE'])
+        self.assertTrue(erros)
+
+        erros, contagem = self.escrever_durante_leitura(settings.SQLITE_PRAGMAS)
+        self.assertEqual(erros, [])
+        # A leitura em andamento continua vendo o retrato de quando começou.
+        self.assertEqual(contagem, 100)
+
+    def test_conexao_do_django_usa_a_configuracao(self):
+        import os
+        import sqlite3
+        import tempfile
+        from django.conf import settings
+        from django.db import connection, connections, transaction
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        # O banco de teste fica em memória (sem WAL): mesma configuração, num arquivo.
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, 'concorrencia.sqlite3')
+            configuracao = {
+                **connection.settings_dict, 'NAME': caminho, 'OPTIONS': {**connection.settings_dict['OPTIONS']},
+            }
+            conexao = DatabaseWrapper(configuracao, alias='concorrencia')
+            connections['concorrencia'] = conexao
+            try:
+                with conexao.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertIn(f'PRAGMA busy_timeout={cursor.fetchone()[0]}', settings.SQLITE_PRAGMAS)
+                    cursor.execute('CREATE TABLE pedido (id INTEGER PRIMARY KEY)')
+
+                # transaction_mode=IMMEDIATE: o atomic() já segura a escrita,
+                # mesmo antes de gravar qualquer coisa.
+                outra = sqlite3.connect(caminho, timeout=0, isolation_level=None)
+                with transaction.atomic(using='concorrencia'):
+                    with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+                        outra.execute('BEGIN IMMEDIATE')
+                outra.execute('BEGIN IMMEDIATE')
+                outra.execute('ROLLBACK')
+                outra.close()
+            finally:
+                conexao.close()
+                del connections['concorrencia']
+
+
+class ArquivamentoPedidosTest(TestCase):
+
+    def setUp(self):
+        import datetime
+        from django.utils import timezone
+        from .models import Anexo, PedidoEvento
+
+        self.gestor = Usuario.objects.create(username='gestora_arq', tipo_usuario='GESTOR')
+        self.dentista = Usuario.objects.create(username='doutor_arq', tipo_usuario='DENTISTA')
+        self.outro = Usuario.objects.create(username='doutor_arq2', tipo_usuario='DENTISTA')
+        antigo = timezone.now() - datetime.timedelta(days=400)
+
+        self.antigo = Pedido.objects.create(
+            dentista=self.dentista, status='APROVADO', nome_paciente="Joana Arquivada",
+            tipo_servico="Coroa", dentes="11", elementos='{"11": "COROA"}',
+            arquivo_entregavel='entregas/final.stl',
+        )
+        self.recente = Pedido.objects.create(
+            dentista=self.dentista, status='APROVADO', nome_paciente="Joana Recente", tipo_servico="Coroa", dentes="11",
+        )
+        self.em_producao = Pedido.objects.create(
+            dentista=self.dentista, status='EM_PRODUCAO', nome_paciente="Joana Ativa", tipo_servico="Coroa", dentes="11",
+        )
+        Pedido.objects.filter(pk__in=[self.antigo.pk, self.em_producao.pk]).update(data_criacao=antigo)
+        self.anexo = Anexo.objects.create(pedido=self.antigo, arquivo='arquivos_protese/scan.stl', analise_status='CONCLUIDA')
+        self.eventos = PedidoEvento.objects.filter(pedido_id=self.antigo.pk).count()
+
+    def test_arquiva_so_aprovados_antigos(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import AnexoArquivado, ElementoPedido, PedidoArquivado, PedidoEvento
+
+        call_command('archive_pedidos', dias=180, lote=1, stdout=StringIO())
+
+        self.assertEqual(set(Pedido.objects.values_list('pk', flat=True)), {self.recente.pk, self.em_producao.pk})
+        arquivado = PedidoArquivado.objects.get(pk=self.antigo.pk)
+        self.assertEqual(arquivado.nome_paciente, "Joana Arquivada")
+        self.assertEqual(arquivado.arquivo_entregavel.name, 'entregas/final.stl')
+        self.assertEqual(AnexoArquivado.objects.get(pk=self.anexo.pk).pedido_id, self.antigo.pk)
+        self.assertFalse(ElementoPedido.objects.filter(pedido_id=self.antigo.pk).exists())
+        # O histórico de status continua lá para quando o pedido voltar.
+        self.assertEqual(PedidoEvento.objects.filter(pedido_id=self.antigo.pk).count(), self.eventos)
+
+    def test_arquivo_continua_pesquisavel_e_com_recorte(self):
+        from .arquivamento import arquivar_antigos
+        from .busca import filtrar_busca
+        from .models import PedidoArquivado
+
+        arquivar_antigos(180)
+
+        self.assertEqual(list(filtrar_busca(PedidoArquivado.objects.all(), 'arquivada')), [PedidoArquivado.objects.get()])
+        self.assertFalse(filtrar_busca(Pedido.objects.all(), 'arquivada').exists())
+
+        self.client.force_login(self.dentista)
+        resposta = self.client.get('/pedidos/arquivo/?busca=arquivada')
+        self.assertContains(resposta, "Joana Arquivada")
+        self.assertRedirects(self.client.get(f'/pedidos/{self.antigo.pk}/'), f'/pedidos/arquivo/{self.antigo.pk}/')
+        self.assertContains(self.client.get(f'/pedidos/arquivo/{self.antigo.pk}/'), "Joana Arquivada")
+
+        self.client.force_login(self.outro)
+        self.assertNotContains(self.client.get('/pedidos/arquivo/'), "Joana Arquivada")
+        self.assertRedirects(self.client.get(f'/pedidos/arquivo/{self.antigo.pk}/'), '/dashboard/',
+                             fetch_redirect_response=False)
+
+    def test_restaurar_pelo_gestor(self):
+        from .arquivamento import arquivar_antigos
+        from .busca import filtrar_busca
+        from .models import Anexo, ElementoPedido, PedidoArquivado, PedidoEvento
+
+        criacao = Pedido.objects.get(pk=self.antigo.pk).data_criacao
+        arquivar_antigos(180)
+
+        self.client.force_login(self.dentista)
+        self.client.post(f'/pedidos/arquivo/{self.antigo.pk}/', {'acao': 'restaurar'})
+        self.assertTrue(PedidoArquivado.objects.filter(pk=self.antigo.pk).exists())
+
+        self.client.force_login(self.gestor)
+        resposta = self.client.post(f'/pedidos/arquivo/{self.antigo.pk}/', {'acao': 'restaurar'})
+        self.assertRedirects(resposta, f'/pedidos/{self.antigo.pk}/')
+
+        pedido = Pedido.objects.get(pk=self.antigo.pk)
+        self.assertEqual(pedido.data_criacao, criacao)
+        self.assertEqual(Anexo.objects.get(pk=self.anexo.pk).analise_status, 'CONCLUIDA')
+        self.assertEqual(list(ElementoPedido.objects.filter(pedido=pedido).values_list('dente', flat=True)), [11])
+        self.assertFalse(PedidoArquivado.objects.exists())
+        self.assertEqual(PedidoEvento.objects.filter(pedido_id=pedido.pk).count(), self.eventos)
+        self.assertEqual(list(filtrar_busca(Pedido.objects.all(), 'arquivada')), [pedido])
+
+    def test_arquivos_referenciados_no_arquivo_nao_sao_liberados(self):
+        from unittest import mock
+        from .arquivamento import arquivar_antigos
+        from .tarefas import liberar_arquivo
+
+        arquivar_antigos(180)
+        with mock.patch('pedidos.tarefas.default_storage') as storage:
+            liberar_arquivo('arquivos_protese/scan.stl')
+            liberar_arquivo('entregas/final.stl')
+            liberar_arquivo('arquivos_protese/solto.stl')
+        storage.delete.assert_called_once_with('arquivos_protese/solto.stl')
+
+    def test_exclusao_por_qualquer_caminho_apaga_historico(self):
+        from .arquivamento import arquivar_antigos
+        from .models import PedidoEvento
+
+        arquivar_antigos(180)
+        self.assertTrue(PedidoEvento.objects.filter(pedido_id=self.antigo.pk).exists())
+        # Exclusão em cascata pelo dentista, como no admin: pedidos ativos e arquivados.
+        self.dentista.delete()
+        self.assertFalse(PedidoEvento.objects.exists())
+
+    def test_simular_nao_move(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        saida = StringIO()
+        call_command('archive_pedidos', dias=180, simular=True, stdout=saida)
+        self.assertIn('1 pedido(s)', saida.getvalue())
+        self.assertEqual(Pedido.objects.count(), 3)
+
+
+class ReconciliacaoMidiaTest(MidiaTemporariaMixin, TestCase):
+
+    def setUp(self):
+        from django.core.files.base import ContentFile
+        from .models import Anexo
+
+        super().setUp()
+        self.criar_pedido('doutor_midia')
+        self.anexo = Anexo(pedido=self.pedido)
+        self.anexo.arquivo.save('scan.stl', ContentFile(b'solid scan'))
+
+    def envelhecer(self, *nomes):
+        import os
+        import time
+
+        antigo = time.time() - 48 * 3600
+        for nome in nomes:
+            os.utime(os.path.join(self.media.name, nome), (antigo, antigo))
+
+    def criar_orfao(self, nome, conteudo=b'sobra'):
+        import os
+
+        caminho = os.path.join(self.media.name, nome)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with open(caminho, 'wb') as f:
+            f.write(conteudo)
+        return caminho
+
+    def test_simular_lista_sem_apagar(self):
+        import os
+        from io import StringIO
+        from django.core.management import call_command
+
+        orfao = self.criar_orfao('entregas/antiga.stl')
+        recente = self.criar_orfao('entregas/subindo.stl')
+        self.envelhecer('entregas/antiga.stl', self.anexo.arquivo.name)
+
+        saida = StringIO()
+        call_command('reconciliar_midia', simular=True, stdout=saida)
+        self.assertIn('entregas/antiga.stl', saida.getvalue())
+        self.assertNotIn('subindo', saida.getvalue())
+        self.assertNotIn(self.anexo.arquivo.name, saida.getvalue())
+        self.assertTrue(os.path.exists(orfao) and os.path.exists(recente))
+
+    def test_quarentena_preserva_caminho_e_limpa_blob(self):
+        import hashlib
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import ArquivoArmazenado
+
+        orfao = self.criar_orfao('arquivos_protese/2020/01/perdido.stl')
+        self.envelhecer('arquivos_protese/2020/01/perdido.stl', self.anexo.arquivo.name)
+        # Blob de um arquivo cujo registro sumiu.
+        codec = ArquivoArmazenado.objects.get().codec
+        ArquivoArmazenado.objects.all().delete()
+        blob = self.anexo.arquivo.storage.caminho_blob(hashlib.sha256(b'solid scan').hexdigest(), codec)
+        self.envelhecer(os.path.relpath(blob, self.media.name))
+
+        with tempfile.TemporaryDirectory() as quarentena:
+            call_command('reconciliar_midia', quarentena=quarentena, lote=1, stdout=StringIO())
+            self.assertTrue(os.path.exists(os.path.join(quarentena, 'arquivos_protese/2020/01/perdido.stl')))
+            self.assertFalse(os.path.exists(orfao))
+            self.assertFalse(os.path.exists(blob))
+        self.assertTrue(os.path.exists(self.anexo.arquivo.path))
+
+    def test_entrega_substituida_e_removida_no_commit(self):
+        import os
+        from django.core.files.base import ContentFile
+
+        pedido = Pedido.objects.get(pk=self.pedido.pk)
+        pedido.arquivo_entregavel.save('final.stl', ContentFile(b'v1'))
+        antigo = pedido.arquivo_entregavel.path
+
+        pedido = Pedido.objects.get(pk=self.pedido.pk)
+        with override_settings(REMOVER_ARQUIVOS_ORFAOS='commit'), self.captureOnCommitCallbacks(execute=True):
+            pedido.arquivo_entregavel.save('final.stl', ContentFile(b'v2'))
+        self.assertFalse(os.path.exists(antigo))
+        self.assertTrue(os.path.exists(pedido.arquivo_entregavel.path))
+
+    def test_exclusao_de_usuario_remove_historico(self):
+        from .models import PedidoEvento, Tarefa
+
+        gestor = Usuario.objects.create(username='gestora_midia', tipo_usuario='GESTOR')
+        self.client.force_login(gestor)
+        self.assertTrue(PedidoEvento.objects.filter(pedido_id=self.pedido.pk).exists())
+
+        self.client.post(f'/usuarios/deletar-permanente/{self.dentista.pk}/')
+        self.assertFalse(PedidoEvento.objects.filter(pedido_id=self.pedido.pk).exists())
+        self.assertTrue(Tarefa.objects.filter(nome='liberar_arquivo', argumentos__nome=self.anexo.arquivo.name).exists())
+
+
+class RendicoesImagemTest(MidiaTemporariaMixin, TestCase):
+
+    def setUp(self):
+        import tempfile
+        from django.core.files.base import ContentFile
+        from .models import Anexo
+
+        super().setUp()
+        self.cache = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache.cleanup)
+        self.configurar(RENDICOES_DIR=self.cache.name)
+        pedido = self.criar_pedido('doutor_foto')
+        self.outro = Usuario.objects.create(username='doutor_foto2', tipo_usuario='DENTISTA')
+        self.foto = Anexo(pedido=pedido, descricao="Foto de cor")
+        self.foto.arquivo.save('cor.jpg', ContentFile(self.jpeg(4000, 3000, orientacao=6)))
+        self.scan = Anexo.objects.create(pedido=pedido, arquivo='arquivos_protese/scan.stl')
+
+    def jpeg(self, largura, altura, orientacao=None):
+        from io import BytesIO
+        from PIL import Image
+
+        imagem = Image.new('RGB', (largura, altura), 'red')
+        exif = Image.Exif()
+        if orientacao:
+            exif[0x0112] = orientacao
+        saida = BytesIO()
+        imagem.save(saida, 'JPEG', exif=exif)
+        return saida.getvalue()
+
+    def test_miniatura_rotacionada_em_webp_e_cache(self):
+        import os
+        from io import BytesIO
+        from unittest import mock
+        from PIL import Image
+
+        self.client.force_login(self.dentista)
+        url = f'/anexos/{self.foto.pk}/imagem/miniatura/'
+        resposta = self.client.get(url, headers={'Accept': 'image/webp,*/*'})
+        self.assertEqual(resposta['Content-Type'], 'image/webp')
+        self.assertIn('Accept', resposta['Vary'])
+        with Image.open(BytesIO(resposta.content)) as imagem:
+            # Orientação 6 (90°): a foto deitada vira retrato.
+            self.assertEqual(imagem.size, (240, 320))
+
+        with mock.patch('pedidos.imagens._gerar') as gerar:
+            segunda = self.client.get(url, headers={'Accept': 'image/webp'})
+            nao_modificada = self.client.get(url, headers={'Accept': 'image/webp', 'If-None-Match': resposta['ETag']})
+        gerar.assert_not_called()
+        self.assertEqual(segunda.content, resposta.content)
+        self.assertEqual(nao_modificada.status_code, 304)
+
+        jpeg = self.client.get(f'/anexos/{self.foto.pk}/imagem/web/')
+        self.assertEqual(jpeg['Content-Type'], 'image/jpeg')
+        self.assertEqual(len(os.listdir(os.path.join(self.cache.name, resposta['ETag'][1:3]))), 2)
+
+    def test_permissao_e_tipos(self):
+        self.client.force_login(self.outro)
+        self.assertRedirects(self.client.get(f'/anexos/{self.foto.pk}/imagem/web/'), '/dashboard/',
+                             fetch_redirect_response=False)
+
+        self.client.force_login(self.dentista)
+        self.assertEqual(self.client.get(f'/anexos/{self.scan.pk}/imagem/web/').status_code, 404)
+        self.assertEqual(self.client.get(f'/anexos/{self.foto.pk}/imagem/gigante/').status_code, 404)
+        self.assertContains(self.client.get(f'/pedidos/{self.foto.pedido_id}/'), f'/anexos/{self.foto.pk}/imagem/miniatura/')
+
+    def test_rendicao_apagada_ou_imagem_corrompida(self):
+        import os
+        from unittest import mock
+        from django.core.files.base import ContentFile
+        from .imagens import cache_rendicoes
+        from .models import Anexo
+
+        self.client.force_login(self.dentista)
+        url = f'/anexos/{self.foto.pk}/imagem/miniatura/'
+        obter = cache_rendicoes.obter
+
+        def obter_e_limpar(*args):
+            caminho = obter(*args)
+            if obter_e_limpar.primeira:
+                obter_e_limpar.primeira = False
+                os.remove(caminho)
+            return caminho
+
+        obter_e_limpar.primeira = True
+        with mock.patch.object(cache_rendicoes, 'obter', side_effect=obter_e_limpar):
+            resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.content.startswith(b'\xff\xd8'))
+
+        truncada = Anexo(pedido=self.foto.pedido)
+        truncada.arquivo.save('truncada.jpg', ContentFile(self.jpeg(800, 600)[:2000]))
+        self.assertEqual(self.client.get(f'/anexos/{truncada.pk}/imagem/web/').status_code, 404)
+
+        # Erro de disco não é "imagem inválida": sobe em vez de virar 404.
+        with mock.patch('pedidos.imagens.Image.open', side_effect=PermissionError(13, 'Permission denied')):
+            with self.assertRaises(PermissionError):
+                self.client.get(f'/anexos/{truncada.pk}/imagem/miniatura/')
+
+    def test_limite_apaga_as_menos_usadas(self):
+        import os
+        from .imagens import CacheRendicoes
+
+        cache = CacheRendicoes(pasta=self.cache.name, limite=150)
+        for i, idade in enumerate((300, 100, 200)):
+            caminho = os.path.join(self.cache.name, 'ab', f'{i}.jpeg')
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            with open(caminho, 'wb') as f:
+                f.write(b'x' * 100)
+            os.utime(caminho, (1000 - idade, 1000 - idade))
+
+        cache._registrar(0)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.cache.name, 'ab'))), ['1.jpeg'])
+
+
+class CompressaoMalhasTest(MidiaTemporariaMixin, TestCase):
+
+    def setUp(self):
+        from django.core.files.base import ContentFile
+        from .models import Anexo
+
+        super().setUp()
+        self.criar_pedido('doutor_gzip')
+        self.conteudo = b'solid dente\n' + b'  facet normal 0 0 1\n    vertex 0 0 0\n' * 500 + b'endsolid\n'
+        self.anexo = Anexo(pedido=self.pedido)
+        self.anexo.arquivo.save('scan.stl', ContentFile(self.conteudo))
+        self.url = f'/anexos/{self.anexo.id}/download/'
+
+    def test_grava_comprimido_e_registra_codec(self):
+        import gzip
+        from .models import ArquivoArmazenado
+
+        registro = ArquivoArmazenado.objects.get(nome=self.anexo.arquivo.name)
+        self.assertEqual(registro.codec, 'gzip')
+        self.assertEqual(registro.tamanho, len(self.conteudo))
+        self.assertLess(registro.tamanho_armazenado, len(self.conteudo) // 10)
+        with open(self.anexo.arquivo.path, 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), self.conteudo)
+
+        storage = self.anexo.arquivo.storage
+        with self.assertNumQueries(1), storage.open(self.anexo.arquivo.name) as f:
+            self.assertEqual(f.size, len(self.conteudo))
+            self.assertEqual(f.read(), self.conteudo)
+        self.assertEqual(self.anexo.arquivo.size, len(self.conteudo))
+
+    def test_download_repassa_ou_descomprime(self):
+        import gzip
+
+        self.client.force_login(self.dentista)
+        comprimido = self.client.get(self.url, headers={'Accept-Encoding': 'br, gzip;q=0.8'})
+        self.assertEqual(comprimido['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', comprimido['Vary'])
+        corpo = b''.join(comprimido.streaming_content)
+        self.assertEqual(int(comprimido['Content-Length']), len(corpo))
+        self.assertEqual(gzip.decompress(corpo), self.conteudo)
+
+        cru = self.client.get(self.url, headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertFalse(cru.has_header('Content-Encoding'))
+        self.assertEqual(int(cru['Content-Length']), len(self.conteudo))
+        self.assertEqual(b''.join(cru.streaming_content), self.conteudo)
+        self.assertNotEqual(cru['ETag'], comprimido['ETag'])
+
+        self.assertEqual(cru['Accept-Ranges'], 'none')
+        # Sem gzip, Range levaria a descomprimir tudo antes do trecho: vai o arquivo inteiro.
+        inteiro = self.client.get(self.url, headers={'Range': 'bytes=5-10'})
+        self.assertEqual(inteiro.status_code, 200)
+        self.assertFalse(inteiro.has_header('Content-Range'))
+        self.assertEqual(b''.join(inteiro.streaming_content), self.conteudo)
+
+        # Com gzip aceito, o trecho é dos bytes gravados, sem descompressão.
+        parcial = self.client.get(self.url, headers={'Range': 'bytes=5-10', 'Accept-Encoding': 'gzip'})
+        self.assertEqual(parcial.status_code, 206)
+        self.assertEqual(parcial['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(parcial.streaming_content), corpo[5:11])
+
+    def test_upload_em_blocos_e_analise(self):
+        import os
+        import numpy as np
+        from io import BytesIO
+        from .analise import analisar_anexo
+        from .malhas import escrever_stl_binario
+        from .models import Anexo, ArquivoArmazenado
+        from .uploads import iniciar_upload, receber_bloco
+
+        vertices = np.array([[0, 0, 0], [10, 0, 0], [10, 10, 0], [0, 10, 0],
+                             [0, 0, 10], [10, 0, 10], [10, 10, 10], [0, 10, 10]], dtype=float)
+        faces = np.array([[0, 2, 1], [0, 3, 2], [4, 5, 6], [4, 6, 7], [0, 1, 5], [0, 5, 4],
+                          [1, 2, 6], [1, 6, 5], [2, 3, 7], [2, 7, 6], [3, 0, 4], [3, 4, 7]])
+        caminho = os.path.join(self.media.name, 'cubo.stl')
+        escrever_stl_binario(caminho, vertices, faces)
+        with open(caminho, 'rb') as f:
+            cubo = f.read()
+
+        upload = iniciar_upload(self.pedido, self.dentista, nome='cubo.stl', tamanho=len(cubo))
+        receber_bloco(upload, 0, len(cubo), BytesIO(cubo))
+        upload.refresh_from_db()
+        self.assertEqual(ArquivoArmazenado.objects.get(nome=upload.caminho).codec, 'gzip')
+
+        # A análise lê uma cópia descomprimida, já que os leitores usam memmap.
+        analisar_anexo(upload.anexo_id)
+        anexo = Anexo.objects.get(pk=upload.anexo_id)
+        self.assertEqual(anexo.analise_status, 'CONCLUIDA')
+        self.assertEqual(anexo.triangulos, 12)
+        with anexo.arquivo.open('rb') as f:
+            self.assertEqual(f.read(), cubo)
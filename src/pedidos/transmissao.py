@@ -0,0 +1,198 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_FILA_INSCRICAO = 200
+EVENTOS_POR_DATAGRAMA = 200
+
+
+class Inscricao:
+    """Fila de um cliente SSE, ligada ao laço de eventos que a consome."""
+
+    def __init__(self):
+        self.laco = asyncio.get_running_loop()
+        self.fila = asyncio.Queue(TAMANHO_FILA_INSCRICAO)
+        self.atrasada = False
+
+    def _colocar(self, evento):
+        try:
+            self.fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            # Cliente lento: o navegador recarrega em vez de acumularmos eventos.
+            self.atrasada = True
+
+    def entregar(self, evento):
+        try:
+            self.laco.call_soon_threadsafe(self._colocar, evento)
+        except RuntimeError:
+            pass  # laço já encerrado; a inscrição sai no finally de quem a criou
+
+
+class Transmissor:
+    """Distribui mudanças de pedidos aos clientes SSE.
+
+    No mesmo processo a entrega é direta. Com ``TRANSMISSAO_SOCKETS`` apontando
+    para um diretório, cada processo com clientes conectados abre ali um socket
+    Unix de datagramas e quem publica envia uma cópia a todos eles.
+    """
+
+    def __init__(self, diretorio=None):
+        self._diretorio = diretorio
+        self._inscricoes = set()
+        self._trava = threading.Lock()
+        self._receptor = None
+        self._emissor = None
+
+    @property
+    def diretorio(self):
+        if self._diretorio is not None:
+            return self._diretorio
+        return getattr(settings, 'TRANSMISSAO_SOCKETS', '')
+
+    @contextmanager
+    def inscrever(self):
+        inscricao = Inscricao()
+        with self._trava:
+            self._inscricoes.add(inscricao)
+            if self.diretorio and self._receptor is None:
+                self._abrir_receptor()
+        try:
+            yield inscricao
+        finally:
+            with self._trava:
+                self._inscricoes.discard(inscricao)
+
+    def publicar(self, eventos):
+        self._entregar(eventos)
+        if self.diretorio:
+            self._repassar(eventos)
+
+    def _entregar(self, eventos):
+        with self._trava:
+            inscricoes = list(self._inscricoes)
+        for inscricao in inscricoes:
+            for evento in eventos:
+                inscricao.entregar(evento)
+
+    def _caminho_proprio(self):
+        return str(Path(self.diretorio) / f'{socket.gethostname()}-{os.getpid()}-{id(self):x}.sock')
+
+    def _abrir_receptor(self):
+        if not hasattr(socket, 'AF_UNIX'):
+            logger.warning("Sockets Unix indisponíveis: transmissão só dentro do processo.")
+            return
+        caminho = self._caminho_proprio()
+        Path(self.diretorio).mkdir(parents=True, exist_ok=True)
+        if os.path.exists(caminho):
+            os.unlink(caminho)
+        receptor = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        receptor.bind(caminho)
+        self._receptor = receptor
+        atexit.register(self.fechar)
+        threading.Thread(target=self._escutar, args=(receptor,), name='transmissao', daemon=True).start()
+
+    def _escutar(self, receptor):
+        while True:
+            try:
+                dados = receptor.recv(65536)
+            except OSError:
+                return
+            try:
+                self._entregar(json.loads(dados))
+            except (ValueError, TypeError):
+                logger.warning("Datagrama de transmissão inválido descartado.")
+
+    def _repassar(self, eventos):
+        if not hasattr(socket, 'AF_UNIX'):
+            return
+        if self._emissor is None:
+            self._emissor = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._emissor.setblocking(False)
+        proprio = self._caminho_proprio() if self._receptor is not None else None
+        destinos = [caminho for caminho in Path(self.diretorio).glob('*.sock') if str(caminho) != proprio]
+        datagramas = [
+            json.dumps(eventos[i:i + EVENTOS_POR_DATAGRAMA]).encode()
+            for i in range(0, len(eventos), EVENTOS_POR_DATAGRAMA)
+        ]
+        for caminho in destinos:
+            for dados in datagramas:
+                try:
+                    self._emissor.sendto(dados, str(caminho))
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Processo que terminou sem remover o socket.
+                    caminho.unlink(missing_ok=True)
+                    break
+                except BlockingIOError:
+                    logger.warning("Fila do socket %s cheia; eventos descartados.", caminho.name)
+                    break
+
+    def fechar(self):
+        if self._receptor is not None:
+            self._receptor.close()
+            self._receptor = None
+            Path(self._caminho_proprio()).unlink(missing_ok=True)
+
+
+transmissor = Transmissor()
+
+
+def _evento(pedido, status_anterior, cadista_anterior):
+    return {
+        'pedido': pedido.pk,
+        'dentista': pedido.dentista_id,
+        'status': pedido.status,
+        'status_anterior': status_anterior or '',
+        'cadista': pedido.cadista_id,
+        'cadista_anterior': cadista_anterior,
+    }
+
+
+def publicar_pedido(pedido, status_anterior, cadista_anterior):
+    evento = _evento(pedido, status_anterior, cadista_anterior)
+    transaction.on_commit(lambda: transmissor.publicar([evento]))
+
+
+def publicar_pedidos_novos(pedidos):
+    eventos = [_evento(pedido, '', None) for pedido in pedidos]
+    transaction.on_commit(lambda: transmissor.publicar(eventos))
+
+
+def _visivel(usuario, papel, status, cadista, dentista):
+    # Mesmo recorte de PedidoQuerySet.for_user, aplicado ao evento.
+    if papel == 'gestor':
+        return True
+    if papel == 'cadista':
+        return cadista == usuario.pk or status == 'PENDENTE'
+    return dentista == usuario.pk
+
+
+def evento_para_usuario(evento, usuario, papel):
+    """Recorta o evento ao que ``usuario`` enxerga antes e depois da mudança.
+
+    Devolve ``None`` se o pedido não era visível ao usuário em nenhum dos dois
+    momentos; do lado em que não era, o status vai vazio (o pedido entrou ou
+    saiu da visão).
+    """
+    antes = bool(evento['status_anterior']) and _visivel(
+        usuario, papel, evento['status_anterior'], evento['cadista_anterior'], evento['dentista'],
+    )
+    depois = _visivel(usuario, papel, evento['status'], evento['cadista'], evento['dentista'])
+    if not antes and not depois:
+        return None
+    return {
+        'pedido': evento['pedido'],
+        'status_anterior': evento['status_anterior'] if antes else '',
+        'status': evento['status'] if depois else '',
+        'cadista': evento['cadista'],
+    }
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .models import Anexo, UploadArquivo
+
+TAMANHO_LEITURA = 64 * 1024
+# Prazo para gravar um bloco; passado isso, a reserva do offset pode ser retomada.
+PRAZO_BLOCO_UPLOAD = 15 * 60
+
+
+class ErroUpload(Exception):
+    def __init__(self, mensagem, status=400, recebido=None):
+        super().__init__(mensagem)
+        self.status = status
+        self.recebido = recebido
+
+
+# Hash parcial de cada upload em andamento neste processo: {id: (offset, sha256)}.
+# Se o processo reiniciar ou outro worker receber o bloco, o hash é refeito
+# a partir do que já está em disco.
+_hashes = {}
+_trava_hashes = threading.Lock()
+
+
+def _storage():
+    return Anexo._meta.get_field('arquivo').storage
+
+
+def iniciar_upload(pedido, usuario, nome, tamanho, descricao='', sha256=''):
+    if tamanho <= 0:
+        raise ErroUpload("Tamanho do arquivo inválido.")
+    if tamanho > settings.TAMANHO_MAXIMO_UPLOAD:
+        raise ErroUpload("Arquivo maior que o limite permitido.", status=413)
+
+    nome = get_valid_filename(os.path.basename(nome or '')) or 'arquivo.stl'
+    campo = Anexo._meta.get_field('arquivo')
+    storage = _storage()
+    caminho = storage.get_available_name(campo.generate_filename(None, nome), max_length=campo.max_length)
+
+    # O arquivo é criado já no destino final, sem cópia ao concluir.
+    destino = storage.path(caminho)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    open(destino, 'xb').close()
+
+    return UploadArquivo.objects.create(
+        pedido=pedido,
+        usuario=usuario,
+        caminho=caminho,
+        nome_original=nome,
+        descricao=descricao or "Arquivo STL",
+        tamanho_total=tamanho,
+        sha256_esperado=(sha256 or '').lower(),
+    )
+
+
+def _hash_ate(upload, destino, offset):
+    with _trava_hashes:
+        atual = _hashes.get(upload.pk)
+    if atual and atual[0] == offset:
+        return atual[1].copy()
+
+    sha = hashlib.sha256()
+    restante = offset
+    with open(destino, 'rb') as f:
+        while restante:
+            dados = f.read(min(TAMANHO_LEITURA, restante))
+            if not dados:
+                break
+            sha.update(dados)
+            restante -= len(dados)
+    return sha
+
+
+def receber_bloco(upload, offset, tamanho_bloco, fluxo):
+    if upload.concluido:
+        raise ErroUpload("Upload já concluído.", status=409, recebido=upload.recebido)
+    if offset != upload.recebido:
+        raise ErroUpload("Offset fora de ordem.", status=409, recebido=upload.recebido)
+    if tamanho_bloco > settings.TAMANHO_MAXIMO_BLOCO_UPLOAD:
+        raise ErroUpload("Bloco maior que o limite permitido.", status=413, recebido=upload.recebido)
+    if offset + tamanho_bloco > upload.tamanho_total:
+        raise ErroUpload("Bloco ultrapassa o tamanho declarado.", status=413, recebido=upload.recebido)
+
+    # Reserva o offset antes de tocar no arquivo: dois envios do mesmo bloco
+    # não escrevem juntos.
+    agora = timezone.now()
+    reserva = agora + timedelta(seconds=PRAZO_BLOCO_UPLOAD)
+    reservado = (
+        UploadArquivo.objects
+        .filter(pk=upload.pk, recebido=offset, anexo__isnull=True)
+        .filter(Q(recebendo_ate__isnull=True) | Q(recebendo_ate__lt=agora))
+        .update(recebendo_ate=reserva)
+    )
+    if not reservado:
+        upload.refresh_from_db()
+        raise ErroUpload("Outro envio está gravando este upload.", status=409, recebido=upload.recebido)
+
+    destino = _storage().path(upload.caminho)
+    escritos = 0
+    try:
+        sha = _hash_ate(upload, destino, offset)
+        with open(destino, 'r+b') as f:
+            f.seek(offset)
+            while escritos < tamanho_bloco:
+                dados = fluxo.read(min(TAMANHO_LEITURA, tamanho_bloco - escritos))
+                if not dados:
+                    break
+                f.write(dados)
+                sha.update(dados)
+                escritos += len(dados)
+    finally:
+        # Mesmo um bloco interrompido avança o offset: o que chegou já está em disco.
+        novo_offset = offset + escritos
+        atualizados = (
+            UploadArquivo.objects
+            .filter(pk=upload.pk, recebido=offset, recebendo_ate=reserva)
+            .update(recebido=novo_offset, recebendo_ate=None, atualizado_em=timezone.now())
+        )
+    if not atualizados:
+        with _trava_hashes:
+            _hashes.pop(upload.pk, None)
+        upload.refresh_from_db()
+        raise ErroUpload("Outro envio alterou este upload.", status=409, recebido=upload.recebido)
+
+    upload.recebido = novo_offset
+    with _trava_hashes:
+        _hashes[upload.pk] = (novo_offset, sha)
+
+    if upload.recebido == upload.tamanho_total:
+        _concluir(upload, destino, sha.hexdigest())
+    return upload
+
+
+def _concluir(upload, destino, digest):
+    with _trava_hashes:
+        _hashes.pop(upload.pk, None)
+
+    with open(destino, 'r+b') as f:
+        f.truncate(upload.tamanho_total)
+
+    if upload.sha256_esperado and upload.sha256_esperado != digest:
+        cancelar_upload(upload)
+        raise ErroUpload("O hash SHA-256 do arquivo não confere.", status=422)
+
+    storage = _storage()
+    if hasattr(storage, 'adotar'):
+        storage.adotar(upload.caminho, digest)
+
+    anexo = Anexo(pedido=upload.pedido, descricao=upload.descricao)
+    anexo.arquivo.name = upload.caminho
+    anexo.save()
+
+    upload.sha256 = digest
+    upload.anexo = anexo
+    upload.save(update_fields=['sha256', 'anexo', 'atualizado_em'])
+
+
+def cancelar_upload(upload):
+    with _trava_hashes:
+        _hashes.pop(upload.pk, None)
+    if not upload.concluido:
+        _storage().delete(upload.caminho)
+    upload.delete()
+
+
+def uploads_abandonados(horas=None):
+    """Uploads não concluídos sem bloco novo há mais de ``horas`` e sem gravação em curso."""
+    horas = settings.UPLOAD_EXPIRA_APOS_HORAS if horas is None else horas
+    agora = timezone.now()
+    return (
+        UploadArquivo.objects
+        .filter(anexo__isnull=True, atualizado_em__lt=agora - timedelta(hours=horas))
+        .filter(Q(recebendo_ate__isnull=True) | Q(recebendo_ate__lt=agora))
+    )
+
+
+def expirar_uploads(horas=None):
+    """Apaga os uploads abandonados e os arquivos parciais. Devolve quantos."""
+    total = 0
+    for upload in uploads_abandonados(horas).iterator():
+        cancelar_upload(upload)
+        total += 1
+    return total
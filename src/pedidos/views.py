@@ -1,54 +1,72 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import login
 from django.contrib import messages
-from django.db.models import (
-    Q, Count
-)
-from .models import Anexo, Usuario, Pedido
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from .models import Anexo, AnexoArquivado, Usuario, Pedido, PedidoArquivado, UploadArquivo
+from . import importacao, uploads
+from .downloads import aservir_arquivo
+from .exportacao import resposta_exportacao
+from .imagens import responder_rendicao
+from .arquivamento import restaurar_pedido
+from .atribuicao import assumir_pedido, proximo_pedido as atribuir_proximo
+from .busca import filtrar_busca
+from .kpis import akpis_do_usuario
+from .paginacao import apaginar_request, paginar_request
+from .transmissao import evento_para_usuario, transmissor
 from .forms import (
     PedidoForm, AnexoForm, CadastroForm, 
     EditarUsuarioForm, MeuPerfilForm, CriarUsuarioCompletoForm
 )
 from django.utils import timezone
 
-@login_required
-def dashboard(request):
-    usuario = request.user
-    
-    eh_gestor = usuario.tipo_usuario in ['GESTOR', 'ADMIN'] or usuario.is_superuser
-    eh_cadista = usuario.tipo_usuario == 'CADISTA'
-    
-    if eh_gestor:
-        qs_base = Pedido.objects.all()
-    elif eh_cadista:
-        qs_base = Pedido.objects.filter(Q(cadista=usuario) | Q(status='PENDENTE'))
-    else:
+async def _listar(queryset):
+    return [obj async for obj in queryset]
 
-        qs_base = Pedido.objects.filter(dentista=usuario)
+def papel_do_usuario(usuario):
+    if usuario.tipo_usuario in ['GESTOR', 'ADMIN'] or usuario.is_superuser:
+        return 'gestor'
+    if usuario.tipo_usuario == 'CADISTA':
+        return 'cadista'
+    return 'dentista'
 
-    kpi_pendentes = qs_base.filter(status='PENDENTE').count()
-    kpi_iniciados = qs_base.filter(status='EM_PRODUCAO').count()
-    kpi_finalizados = qs_base.filter(status='CONCLUIDO').count()
+@login_required
+async def dashboard(request):
+    # Usuário já carregado: templates e context processors não vão ao banco.
+    usuario = request.user = await request.auser()
     
-    kpi_aprovados = qs_base.filter(status='APROVADO').count()
+    papel = papel_do_usuario(usuario)
+    eh_gestor = papel == 'gestor'
+    eh_cadista = papel == 'cadista'
     
+    qs_base = Pedido.objects.for_user(usuario)
+
     status_selecionado = request.GET.get('status')
+    recentes = qs_base.for_list()
     
     if status_selecionado:
-        pedidos = qs_base.filter(status=status_selecionado).order_by('-data_criacao')
+        consulta = apaginar_request(request, recentes.filter(status=status_selecionado), '-data_criacao')
     else:
-        pedidos = qs_base.order_by('-data_criacao')[:10]
+        consulta = _listar(recentes.order_by('-data_criacao')[:10])
+
+    kpis, pedidos = await asyncio.gather(akpis_do_usuario(papel, usuario, qs_base), consulta)
 
     return render(request, 'pedidos/dashboard.html', {
         'pedidos': pedidos,
         'eh_gestor': eh_gestor,
         'eh_cadista': eh_cadista,
         'status_selecionado': status_selecionado,
-        'kpi_pendentes': kpi_pendentes,
-        'kpi_iniciados': kpi_iniciados,
-        'kpi_finalizados': kpi_finalizados,
-        'kpi_aprovados': kpi_aprovados,
+        'kpi_pendentes': kpis['PENDENTE'],
+        'kpi_iniciados': kpis['EM_PRODUCAO'],
+        'kpi_finalizados': kpis['CONCLUIDO'],
+        'kpi_aprovados': kpis['APROVADO'],
     })
 
 @login_required
@@ -79,28 +97,98 @@ def novo_pedido(request):
         'form_anexo': form_anexo
     })
 
+@login_required
+@require_POST
+def proximo_pedido(request):
+    usuario = request.user
+    if usuario.tipo_usuario != 'CADISTA':
+        return JsonResponse({'erro': 'Apenas cadistas recebem casos da fila.'}, status=403)
+
+    pedido = atribuir_proximo(usuario)
+    if request.accepts('text/html'):
+        if pedido is None:
+            messages.info(request, 'Nenhum caso disponível agora (fila vazia ou limite de casos atingido).')
+            return redirect('dashboard')
+        messages.success(request, 'Você assumiu este caso! Mãos à obra.')
+        return redirect('detalhes_pedido', id=pedido.id)
+
+    if pedido is None:
+        return JsonResponse({'pedido': None})
+    return JsonResponse({
+        'pedido': pedido.id,
+        'data_entrega_prevista': pedido.data_entrega_prevista,
+        'url': reverse('detalhes_pedido', args=[pedido.id]),
+    })
+
+INTERVALO_PING_SSE = 15
+
+@login_required
+async def fluxo_pedidos(request):
+    """Mudanças de status e de cadista, via Server-Sent Events, no recorte do dashboard.
+
+    ``?pedido=<id>`` restringe a um pedido (tela de detalhes).
+    """
+    if not isinstance(request, ASGIRequest):
+        # Em WSGI cada conexão prenderia uma thread; 204 faz o EventSource desistir.
+        return HttpResponse(status=204)
+    usuario = await request.auser()
+    papel = papel_do_usuario(usuario)
+    pedido = request.GET.get('pedido', '')
+    pedido_id = int(pedido) if pedido.isdigit() else None
+
+    async def fluxo():
+        with transmissor.inscrever() as inscricao:
+            yield 'retry: 2000\n\n'
+            while True:
+                try:
+                    evento = await asyncio.wait_for(inscricao.fila.get(), INTERVALO_PING_SSE)
+                except TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                if inscricao.atrasada:
+                    yield 'event: recarregar\ndata: {}\n\n'
+                    return
+                if pedido_id is not None and evento['pedido'] != pedido_id:
+                    continue
+                dados = evento_para_usuario(evento, usuario, papel)
+                if dados is not None:
+                    yield f'event: pedido\ndata: {json.dumps(dados)}\n\n'
+
+    resposta = StreamingHttpResponse(fluxo(), content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    resposta['X-Accel-Buffering'] = 'no'
+    return resposta
+
+def _sem_permissao(request):
+    messages.error(request, "Você não tem permissão para ver este caso.")
+    return redirect('dashboard')
+
 @login_required
 def detalhes_pedido(request, id):
-    pedido = get_object_or_404(Pedido, id=id)
     usuario = request.user
+    pedido = Pedido.objects.for_user(usuario).for_detail().filter(id=id).first()
+    if pedido is None:
+        if PedidoArquivado.objects.filter(id=id).exists():
+            return redirect('detalhes_arquivado', id=id)
+        get_object_or_404(Pedido, id=id)
+        return _sem_permissao(request)
     
-    eh_dono = pedido.dentista == usuario
-    eh_responsavel = pedido.cadista == usuario
-    eh_gestor = usuario.tipo_usuario in ['GESTOR', 'ADMIN'] or usuario.is_superuser
-    pode_atuar = eh_dono or eh_responsavel or eh_gestor or (pedido.status == 'PENDENTE' and usuario.tipo_usuario == 'CADISTA')
-
-    if not pode_atuar:
-        messages.error(request, "Você não tem permissão para ver este caso.")
-        return redirect('dashboard')
+    eh_dono = pedido.dentista_id == usuario.id
+    eh_responsavel = pedido.cadista_id == usuario.id
+    eh_gestor = papel_do_usuario(usuario) == 'gestor'
 
     if request.method == 'POST':
         acao = request.POST.get('acao')
         
         if acao == 'iniciar':
-            pedido.status = 'EM_PRODUCAO'
-            pedido.cadista = usuario
-            pedido.save()
-            messages.success(request, 'Você assumiu este caso! Mãos à obra.')
+            if usuario.tipo_usuario != 'CADISTA':
+                messages.error(request, 'Apenas cadistas podem assumir casos.')
+            elif assumir_pedido(pedido.id, usuario):
+                messages.success(request, 'Você assumiu este caso! Mãos à obra.')
+            elif Pedido.objects.filter(id=id, status='PENDENTE').exists():
+                messages.error(request, 'Você atingiu o limite de casos em andamento.')
+            else:
+                messages.error(request, 'Outro cadista assumiu este caso antes de você.')
 
         elif acao == 'finalizar':
             arquivo = request.FILES.get('arquivo_entregavel')
@@ -137,10 +225,7 @@ def detalhes_pedido(request, id):
 def editar_pedido(request, id):
     eh_equipe_interna = request.user.tipo_usuario in ['GESTOR', 'CADISTA'] or request.user.is_superuser
 
-    if eh_equipe_interna:
-        pedido = get_object_or_404(Pedido, id=id)
-    else:
-        pedido = get_object_or_404(Pedido, id=id, dentista=request.user)
+    pedido = get_object_or_404(Pedido.objects.for_user(request.user), id=id)
 
     if request.method == 'POST':
         form = PedidoForm(request.POST, request.FILES, instance=pedido)
@@ -311,23 +396,15 @@ def deletar_permanente(request, id):
 def eh_gestor(user):
     return user.is_authenticated and (user.tipo_usuario == 'GESTOR' or user.is_superuser)
 
-@login_required
-def lista_pedidos(request):
+def filtrar_lista_pedidos(request):
+    """Filtros e ordenação de ``lista_pedidos``, compartilhados com a exportação."""
+    # Equipe interna vê a coluna e o filtro de dentista; o recorte vem de for_user.
     eh_gestor = request.user.tipo_usuario in ['GESTOR', 'CADISTA'] or request.user.is_superuser
-    
-    if eh_gestor:
-        pedidos = Pedido.objects.all()
-        lista_dentistas = Usuario.objects.filter(tipo_usuario='DENTISTA')
-    else:
-        pedidos = Pedido.objects.filter(dentista=request.user)
-        lista_dentistas = [] 
+    pedidos = Pedido.objects.for_user(request.user)
 
     busca = request.GET.get('busca')
     if busca:
-        pedidos = pedidos.filter(
-            Q(id__icontains=busca) | 
-            Q(nome_paciente__icontains=busca)
-        )
+        pedidos = filtrar_busca(pedidos, busca)
 
     filtro_cliente = request.GET.get('cliente')
     if eh_gestor and filtro_cliente:
@@ -342,20 +419,42 @@ def lista_pedidos(request):
         'status': 'status',
     }
     campo_ordenacao = mapa_ordem.get(ordenar_por, '-id')
-    pedidos = pedidos.order_by(campo_ordenacao)
+    return pedidos, campo_ordenacao, {
+        'eh_gestor': eh_gestor,
+        'busca_atual': busca,
+        'filtro_cliente_atual': filtro_cliente,
+        'ordem_atual': ordenar_por,
+    }
+
+@login_required
+async def lista_pedidos(request):
+    request.user = await request.auser()
+    # A busca pode consultar o banco para detectar o FTS; o resto só monta a consulta.
+    pedidos, campo_ordenacao, filtros = await sync_to_async(filtrar_lista_pedidos)(request)
+    consultas = [apaginar_request(request, pedidos.for_list(), campo_ordenacao)]
+    if filtros['eh_gestor']:
+        consultas.append(_listar(Usuario.objects.filter(tipo_usuario='DENTISTA')))
+
+    pedidos, *dentistas = await asyncio.gather(*consultas)
+    lista_dentistas = dentistas[0] if dentistas else []
 
     return render(request, 'pedidos/lista_pedidos.html', {
         'pedidos': pedidos,
         'dentistas': lista_dentistas,
-        'eh_gestor': eh_gestor,
-        'busca_atual': busca,
-        'filtro_cliente_atual': filtro_cliente,
-        'ordem_atual': ordenar_por
+        **filtros,
     })
 
+@login_required
+async def exportar_pedidos(request):
+    request.user = await request.auser()
+    pedidos, campo_ordenacao, _ = await sync_to_async(filtrar_lista_pedidos)(request)
+    formato = 'xlsx' if request.GET.get('formato') == 'xlsx' else 'csv'
+    return resposta_exportacao(pedidos.order_by(campo_ordenacao, 'id'), formato,
+                               assincrona=isinstance(request, ASGIRequest))
+
 @login_required
 def excluir_pedido(request, id):
-    pedido = get_object_or_404(Pedido, id=id)
+    pedido = get_object_or_404(Pedido.objects.for_user(request.user), id=id)
     
     if not (request.user.tipo_usuario == 'GESTOR' or request.user.is_superuser):
         messages.error(request, 'Apenas gestores podem excluir registros.')
@@ -383,4 +482,182 @@ def criar_usuario_interno(request):
     else:
         form = CriarUsuarioCompletoForm()
 
-    return render(request, 'pedidos/criar_usuario_interno.html', {'form': form})
\ No newline at end of file
+    return render(request, 'pedidos/criar_usuario_interno.html', {'form': form})
+
+@login_required
+def importar_pedidos(request):
+    if not eh_gestor(request.user):
+        messages.error(request, 'Acesso restrito.')
+        return redirect('dashboard')
+
+    resultado = None
+    if request.method == 'POST':
+        arquivo = request.FILES.get('arquivo')
+        if not arquivo:
+            messages.error(request, 'Selecione um arquivo CSV ou JSON.')
+        else:
+            try:
+                resultado = importacao.importar_pedidos(
+                    importacao.ler_linhas(arquivo),
+                    simular=bool(request.POST.get('simular')),
+                )
+            except (UnicodeDecodeError, ValueError) as erro:
+                messages.error(request, f'Não foi possível ler o arquivo: {erro}')
+
+    return render(request, 'pedidos/importar_pedidos.html', {
+        'resultado': resultado,
+        'erros': resultado.erros[:200] if resultado else [],
+        'simulado': bool(request.POST.get('simular')),
+    })
+
+def pode_anexar(usuario, pedido):
+    return pedido.dentista_id == usuario.id or pedido.cadista_id == usuario.id or eh_gestor(usuario)
+
+def _estado_upload(upload):
+    return {
+        'id': str(upload.id),
+        'recebido': upload.recebido,
+        'tamanho': upload.tamanho_total,
+        'concluido': upload.concluido,
+        'anexo': upload.anexo_id,
+        'sha256': upload.sha256 or None,
+    }
+
+@login_required
+@require_POST
+def iniciar_upload(request, id):
+    pedido = get_object_or_404(Pedido.objects.for_user(request.user), id=id)
+    if not pode_anexar(request.user, pedido):
+        return JsonResponse({'erro': 'Você não pode anexar arquivos a este caso.'}, status=403)
+
+    try:
+        tamanho = int(request.POST.get('tamanho', ''))
+    except ValueError:
+        return JsonResponse({'erro': 'Informe o tamanho do arquivo em bytes.'}, status=400)
+
+    try:
+        upload = uploads.iniciar_upload(
+            pedido, request.user,
+            nome=request.POST.get('nome', ''),
+            tamanho=tamanho,
+            descricao=request.POST.get('descricao', ''),
+            sha256=request.POST.get('sha256', ''),
+        )
+    except uploads.ErroUpload as erro:
+        return JsonResponse({'erro': str(erro)}, status=erro.status)
+
+    return JsonResponse(_estado_upload(upload), status=201)
+
+@login_required
+def upload_bloco(request, upload_id):
+    upload = get_object_or_404(UploadArquivo, pk=upload_id, usuario=request.user)
+
+    if request.method in ('GET', 'HEAD'):
+        return JsonResponse(_estado_upload(upload))
+
+    if request.method == 'DELETE':
+        uploads.cancelar_upload(upload)
+        return JsonResponse({'cancelado': True})
+
+    if request.method not in ('PUT', 'PATCH'):
+        return JsonResponse({'erro': 'Método não permitido.'}, status=405)
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        tamanho_bloco = int(request.META.get('CONTENT_LENGTH') or '')
+    except ValueError:
+        return JsonResponse({'erro': 'Cabeçalhos Upload-Offset e Content-Length são obrigatórios.'}, status=411)
+
+    try:
+        uploads.receber_bloco(upload, offset, tamanho_bloco, request)
+    except uploads.ErroUpload as erro:
+        resposta = {'erro': str(erro)}
+        if erro.recebido is not None:
+            resposta['recebido'] = erro.recebido
+        return JsonResponse(resposta, status=erro.status)
+
+    return JsonResponse(_estado_upload(upload))
+
+
+@login_required
+async def baixar_anexo(request, id, previa=False):
+    visiveis = Pedido.objects.for_user(await request.auser())
+    try:
+        anexo = await Anexo.objects.filter(pedido__in=visiveis).aget(id=id)
+    except Anexo.DoesNotExist:
+        if not await Anexo.objects.filter(id=id).aexists():
+            raise Http404
+        return _sem_permissao(request)
+    return await aservir_arquivo(request, anexo.previa if previa else anexo.arquivo)
+
+@login_required
+def imagem_anexo(request, id, tamanho):
+    """Foto anexada reduzida (``miniatura`` ou ``web``), no lugar do original."""
+    anexo = Anexo.objects.filter(pedido__in=Pedido.objects.for_user(request.user), id=id).first()
+    if anexo is None:
+        get_object_or_404(Anexo, id=id)
+        return _sem_permissao(request)
+    return responder_rendicao(request, anexo.arquivo, tamanho)
+
+@login_required
+async def baixar_entrega(request, id):
+    try:
+        pedido = await Pedido.objects.for_user(await request.auser()).aget(id=id)
+    except Pedido.DoesNotExist:
+        if not await Pedido.objects.filter(id=id).aexists():
+            raise Http404
+        return _sem_permissao(request)
+    return await aservir_arquivo(request, pedido.arquivo_entregavel)
+
+@login_required
+def arquivo_pedidos(request):
+    """Pedidos arquivados, somente leitura, com o mesmo recorte e busca da lista."""
+    pedidos = filtrar_busca(PedidoArquivado.objects.for_user(request.user), request.GET.get('busca'))
+    return render(request, 'pedidos/arquivo_pedidos.html', {
+        'pedidos': paginar_request(request, pedidos.for_list(), '-data_criacao'),
+        'eh_gestor': papel_do_usuario(request.user) != 'dentista',
+        'busca_atual': request.GET.get('busca'),
+    })
+
+@login_required
+def detalhes_arquivado(request, id):
+    usuario = request.user
+    pedido = PedidoArquivado.objects.for_user(usuario).for_detail().filter(id=id).first()
+    if pedido is None:
+        get_object_or_404(PedidoArquivado, id=id)
+        return _sem_permissao(request)
+    eh_gestor = papel_do_usuario(usuario) == 'gestor'
+
+    if request.method == 'POST' and request.POST.get('acao') == 'restaurar':
+        if not eh_gestor:
+            messages.error(request, 'Apenas gestores podem restaurar pedidos.')
+            return redirect('detalhes_arquivado', id=id)
+        restaurar_pedido(pedido.id)
+        messages.success(request, 'Pedido restaurado para a lista de casos.')
+        return redirect('detalhes_pedido', id=id)
+
+    return render(request, 'pedidos/detalhes_arquivado.html', {
+        'pedido': pedido,
+        'eh_gestor': eh_gestor,
+    })
+
+@login_required
+async def baixar_anexo_arquivado(request, id, previa=False):
+    visiveis = PedidoArquivado.objects.for_user(await request.auser())
+    try:
+        anexo = await AnexoArquivado.objects.filter(pedido__in=visiveis).aget(id=id)
+    except AnexoArquivado.DoesNotExist:
+        if not await AnexoArquivado.objects.filter(id=id).aexists():
+            raise Http404
+        return _sem_permissao(request)
+    return await aservir_arquivo(request, anexo.previa if previa else anexo.arquivo)
+
+@login_required
+async def baixar_entrega_arquivada(request, id):
+    try:
+        pedido = await PedidoArquivado.objects.for_user(await request.auser()).aget(id=id)
+    except PedidoArquivado.DoesNotExist:
+        if not await PedidoArquivado.objects.filter(id=id).aexists():
+            raise Http404
+        return _sem_permissao(request)
+    return await aservir_arquivo(request, pedido.arquivo_entregavel)